@@ -0,0 +1,242 @@
+"""
+Measures gear import throughput and accuracy over a directory of labeled screenshots.
+
+Every 1280x720 screenshot of the directory is labeled by a JSON file of the same name holding the expected gear in the
+gears.json format, id and in_use are ignored, e.g. screenshots/0001.png and screenshots/0001.json.
+
+The corpus is imported twice, cold with Tesseract alone and warm with the glyphs learned by the optimizer, which are
+only read so the benchmark neither learns from its own corpus nor changes the user's glyphs file.
+
+No corpus ships with the repository: the screenshots are game captures, and panels drawn in another font would only
+measure Tesseract on that font. To build one, gather 1280x720 screenshots of varied gears (every type, set and stat,
+flat and %, 1 to 4 substats) in a directory and run with --write-labels, which reads the screenshots without a label and
+writes what was read as their label. Check each label against its screenshot and fix the misreads by hand, the labels
+are then the expected gears.
+
+Usage: python benchmark.py screenshots [--cores N] [--min-accuracy 0.99] [--write-labels]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from typing import List, Tuple
+
+from gear import *
+from ocr import GEAR_FIELDS, GLYPHS_FILE
+from optimizer import E7GearOptimizer
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+STAGES = ['decode', 'match', 'glyphs', 'ocr', 'parse']
+
+
+def label_path(image_path: str) -> str:
+    """
+    :param image_path: screenshot path
+    :return: path of the JSON label of the screenshot
+    """
+    return os.path.splitext(image_path)[0] + '.json'
+
+
+def load_corpus(directory: str) -> List[Tuple[str, Gear]]:
+    """
+    Loads the labeled screenshots of a directory
+
+    :param directory: directory of screenshots and their JSON labels
+    :return: list of (image path, expected gear)
+    """
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+            continue
+
+        path = os.path.join(directory, name)
+        if not os.path.exists(label_path(path)):
+            print('No label for {}, skipped'.format(name))
+            continue
+        with open(label_path(path), 'r') as file_input:
+            corpus.append((path, json.load(file_input, object_hook=json_to_gear)))
+
+    return corpus
+
+
+def gear_fields(gear: Gear) -> dict:
+    """
+    Splits a gear into the fields read from a screenshot
+
+    :param gear: Gear
+    :return: dict of field name -> value
+    """
+    substats = list(gear.substats) + [None] * (4 - len(gear.substats))
+    return dict(zip(GEAR_FIELDS, [gear.type, gear.set, gear.main_stat] + substats))
+
+
+def unlabeled_images(directory: str) -> List[str]:
+    """
+    :param directory: directory of screenshots
+    :return: paths of the screenshots without a JSON label
+    """
+    paths = [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+             if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS]
+    return [path for path in paths if not os.path.exists(label_path(path))]
+
+
+def benchmark_optimizer(cores: int, glyphs_path: str = None) -> E7GearOptimizer:
+    """
+    Creates an empty optimizer whose imports leave the user's files alone
+
+    :param cores: number of OCR processes, 0 reads in this process which also measures every stage
+    :param glyphs_path: glyphs file read without learning, None reads with Tesseract only
+    :return: E7GearOptimizer
+    """
+    optimizer = E7GearOptimizer()
+    optimizer.cores = cores
+    # Learning would score later images with glyphs taught by earlier ones and save them over the user's file
+    optimizer.glyphs_path = glyphs_path
+    optimizer.learn_glyphs = False
+    optimizer.skip_duplicates = False
+    optimizer.quarantine_dir = None
+    # Benchmark imports must not overwrite the saved inventory and OCR cache
+    optimizer.mark_dirty = lambda **kwargs: None
+    return optimizer
+
+
+def write_labels(directory: str, cores: int) -> int:
+    """
+    Reads the screenshots of a directory without a label and writes what was read as their label, to be checked by hand
+
+    :param directory: directory of screenshots
+    :param cores: number of OCR processes
+    :return: number of labels written
+    """
+    optimizer = benchmark_optimizer(cores)
+    written = 0
+    try:
+        for path, gear, error in optimizer.import_gear_iter(unlabeled_images(directory)):
+            if gear is None:
+                print('{}: {}, no label written'.format(path, error))
+                continue
+            gear.id = -1
+            with open(label_path(path), 'w') as file_output:
+                json.dump(gear, file_output, cls=GearJSONEncoder, indent=2, separators=(',', ': '))
+            written += 1
+    finally:
+        optimizer.close()
+    return written
+
+
+def run(corpus: List[Tuple[str, Gear]], cores: int, glyphs_path: str = None) -> dict:
+    """
+    Imports the corpus into an empty optimizer
+
+    :param corpus: list of (image path, expected gear)
+    :param cores: number of OCR processes, 0 reads in this process which also measures every stage
+    :param glyphs_path: glyphs file read without learning, None reads with Tesseract only
+    :return: dict of results
+    """
+    optimizer = benchmark_optimizer(cores, glyphs_path)
+    # Created up front so Tesseract initialization isn't measured
+    reader = optimizer.reader
+
+    labels = dict(corpus)
+    correct = Counter()
+    failed = []
+    start = time.perf_counter()
+    try:
+        for path, gear, error in optimizer.import_gear_iter([path for path, _ in corpus]):
+            if gear is None:
+                failed.append((path, error))
+                continue
+
+            actual = gear_fields(gear)
+            expected = gear_fields(labels[path])
+            for field in GEAR_FIELDS:
+                correct[field] += actual[field] == expected[field]
+            correct['gear'] += actual == expected
+        elapsed = time.perf_counter() - start
+    finally:
+        optimizer.close()
+
+    return {
+        'images': len(corpus),
+        'elapsed': elapsed,
+        'failed': failed,
+        'correct': correct,
+        'timings': dict(reader.timings),
+        'field_sources': dict(reader.field_sources),
+    }
+
+
+def report(results: dict):
+    """
+    Prints benchmark results
+
+    :param results: dict returned by run()
+    :return: None
+    """
+    images = results['images']
+    print('Images: {} ({} failed)'.format(images, len(results['failed'])))
+    print('Throughput: {:.2f} images/s ({:.2f} s)'.format(images / results['elapsed'], results['elapsed']))
+
+    if results['timings']:
+        print('\n{:<10}{:>10}{:>12}'.format('Stage', 'Total s', 'ms/image'))
+        for stage in STAGES:
+            seconds = results['timings'].get(stage, 0)
+            print('{:<10}{:>10.2f}{:>12.1f}'.format(stage, seconds, seconds * 1000 / images))
+        print('Fields read by glyphs: {}, by Tesseract: {}, Tesseract retries: {}'.format(
+            results['field_sources'].get('glyphs', 0), results['field_sources'].get('tesseract', 0),
+            results['field_sources'].get('retries', 0)))
+    else:
+        print('\nStages are only measured when reading in this process (--cores 0)')
+
+    print('\n{:<12}{:>12}{:>10}'.format('Field', 'Correct', 'Accuracy'))
+    for field in GEAR_FIELDS + ['gear']:
+        correct = results['correct'][field]
+        print('{:<12}{:>12}{:>9.1f}%'.format(field, '{}/{}'.format(correct, images), correct * 100 / images))
+
+    if results['failed']:
+        print('\nFailed images:')
+        for path, error in results['failed']:
+            print('  {}: {}'.format(path, error))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gear import throughput and accuracy benchmark')
+    parser.add_argument('directory', help='directory of labeled 1280x720 screenshots')
+    parser.add_argument('--cores', type=int, default=0, help='number of OCR processes, 0 reads in this process')
+    parser.add_argument('--min-accuracy', type=float, default=0,
+                        help='exit with an error if any field accuracy is lower, from 0 to 1')
+    parser.add_argument('--write-labels', action='store_true',
+                        help='label the screenshots without a label with what is read, to be checked by hand')
+    args = parser.parse_args()
+
+    if args.write_labels:
+        print('Wrote {} labels, check them against their screenshots'.format(write_labels(args.directory,
+                                                                                           args.cores)))
+        return 0
+
+    corpus = load_corpus(args.directory)
+    if not corpus:
+        print('No labeled screenshots in {}'.format(args.directory))
+        return 1
+
+    runs = [('Cold, Tesseract only', run(corpus, args.cores))]
+    if os.path.exists(GLYPHS_FILE):
+        runs.append(('Warm, glyphs from {}'.format(GLYPHS_FILE), run(corpus, args.cores, GLYPHS_FILE)))
+    else:
+        print('No {}, warm run skipped'.format(GLYPHS_FILE))
+
+    for i, (title, results) in enumerate(runs):
+        print('{}== {} =='.format('\n' if i else '', title))
+        report(results)
+
+    worst = min(results['correct'][field] / results['images'] for _, results in runs for field in GEAR_FIELDS)
+    if worst < args.min_accuracy:
+        print('\nAccuracy {:.1f}% below {:.1f}%'.format(worst * 100, args.min_accuracy * 100))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
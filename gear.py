@@ -1,8 +1,14 @@
 from enum import Enum
 from dataclasses import dataclass, asdict, is_dataclass
+from array import array
 import json
+import re
 import itertools
-from typing import Tuple, List, Dict
+import mmap
+import struct
+import sys
+from threading import RLock
+from typing import Tuple, List, Dict, Optional
 
 
 class GearType(Enum):
@@ -80,6 +86,11 @@ class Gear:
         return '\n'.join(strings)
 
 
+# Final stats are computed in 1/FINAL_STAT_UNITS of a point, hundredths of a point of base stat times whole %, so
+# they are exact integers
+FINAL_STAT_UNITS = 10000
+
+
 @dataclass(frozen=False)
 class Loadout:
     __slots__ = ['gears', 'set', 'stats_given']
@@ -130,6 +141,31 @@ class Loadout:
         elif gear_set == 7:
             return Stat(GearStat.CritD.value, 40, True)
 
+    @staticmethod
+    def stat_units(base: float, percent, flat):
+        """
+        Returns what % and flat stats add to a base stat in 1/FINAL_STAT_UNITS of a point, the base stat taken to the
+        hundredth of a point
+
+        :param base: hero base stat
+        :param percent: % stat, int or numpy integer array
+        :param flat: flat stat, int or numpy integer array
+        :return: added value
+        """
+        return int(round(base * 100)) * percent + FINAL_STAT_UNITS * flat
+
+    @staticmethod
+    def final_stat(base: float, percent, flat):
+        """
+        Returns a hero's final stat, its base stat raised by % and flat stats then rounded down
+
+        :param base: hero base stat
+        :param percent: % stat given, int or numpy integer array, e.g. stats_given[stat][0]
+        :param flat: flat stat given, int or numpy integer array
+        :return: final stat
+        """
+        return Loadout.stat_units(base, 100 + percent, flat) // FINAL_STAT_UNITS
+
     def calculate_loadout_sets(self):
         """
         Returns the sets the gear loadout contains if any exists
@@ -192,8 +228,39 @@ class Loadout:
             yield gear
 
 
+def validate_gear(gear: Gear) -> Gear:
+    """
+    Checks a gear fits the inventory store, e.g. a record or a misread screenshot with too many substats
+
+    :param gear: Gear
+    :return: the gear
+    :raise ValueError: more than SNAPSHOT_STATS - 1 substats or a stat value out of 0 to MAX_STAT_VALUE
+    """
+    if len(gear.substats) > SNAPSHOT_STATS - 1:
+        raise ValueError('{} substats, at most {}'.format(len(gear.substats), SNAPSHOT_STATS - 1))
+    for stat in [gear.main_stat] + list(gear.substats):
+        if not 0 <= stat.value <= MAX_STAT_VALUE:
+            raise ValueError('{} value {} out of 0 to {}'.format(GearStat(stat.type).name, stat.value, MAX_STAT_VALUE))
+    return gear
+
+
+def gear_fingerprint(gear: Gear) -> bytes:
+    """
+    Returns what identifies a gear regardless of its ID and usage: type, set, main stat and substats.
+    Two screenshots of the same item have the same fingerprint.
+
+    :param gear: Gear
+    :return: hashable fingerprint, packed to stay small when kept for every gear
+    """
+    stats = [gear.main_stat] + list(gear.substats)
+    return struct.pack('<BB' + 'BHB' * len(stats), gear.type, gear.set,
+                       *itertools.chain.from_iterable((stat.type, stat.value, bool(stat.is_flat)) for stat in stats))
+
+
 class GearJSONEncoder(json.JSONEncoder):
     def default(self, o):
+        if isinstance(o, GearView):
+            o = o.to_gear()
         if is_dataclass(o):
             return asdict(o)
         return super().default(o)
@@ -221,3 +288,608 @@ def json_to_gear(in_dict):
                 in_dict['in_use']
             )
     return in_dict
+
+
+def parse_gear_type(gear_type: str) -> int:
+    """
+    Process a string read from a screenshot or an export and return the equipment type
+
+    :param gear_type: gear type string
+    :return: the equipment type
+    """
+    gear_type = gear_type.replace('Rina', 'Ring').lower()
+    for g_type in GearType:
+        if g_type.name.lower() in gear_type.lower():
+            return g_type.value
+
+    raise NameError('Unknown equipment type:', gear_type)
+
+
+def parse_gear_set(gear_set: str) -> int:
+    """
+    Process a string read from a screenshot or an export and return the equipment set
+
+    :param gear_set: gear set string
+    :return: the equipment set
+    """
+    gear_set = [x.lower() for x in gear_set.split()]
+    for g_set in GearSet:
+        if g_set.name.lower() in gear_set:
+            return g_set.value
+
+    raise NameError('Unknown equipment set:', gear_set)
+
+
+def parse_gear_stat(equip_stat: str) -> Stat:
+    """
+    Process a string read from a screenshot or an export and return a Stat object holding the stat and value
+
+    :param equip_stat: stat string
+    :return: Stat object
+    """
+    matched = re.findall(r'([^\d][a-zA-Z\s]+).*?([0-9]+%*)',
+                         equip_stat.replace(',', '').replace('T%', '7%'))
+    if matched:
+        stat = -1
+        if 'attack' in matched[0][0].lower():
+            stat = GearStat.Attack.value
+        if 'health' in matched[0][0].lower():
+            stat = GearStat.Health.value
+        if 'defense' in matched[0][0].lower():
+            stat = GearStat.Defense.value
+        if 'speed' in matched[0][0].lower():
+            stat = GearStat.Speed.value
+        if 'chance' in matched[0][0].lower():
+            stat = GearStat.CritC.value
+        if 'damage' in matched[0][0].lower():
+            stat = GearStat.CritD.value
+        if 'effectiveness' in matched[0][0].lower():
+            stat = GearStat.Eff.value
+        if 'resistance' in matched[0][0].lower():
+            stat = GearStat.ER.value
+
+        if stat == -1:
+            raise NameError('Unknown equipment stat:', equip_stat)
+
+        value = matched[0][1]
+        if '%' in value and GearStat(stat) not in [GearStat.CritC, GearStat.CritD, GearStat.Eff, GearStat.ER]:
+            is_flat = False
+        else:
+            is_flat = True
+        value = int(value.replace('%', ''))
+        return Stat(stat, value, is_flat)
+    else:
+        raise NameError('No matches from regex found for \'{}\''.format(equip_stat))
+
+
+def _record_stat_type(name) -> Optional[int]:
+    """
+    Resolves a stat type of an external gear record against GearStat names and aliases, case insensitive
+
+    :param name: GearStat value, or name such as 'Crit. C', 'Critical Chance' or 'ER'
+    :return: GearStat value, None if the name isn't one
+    """
+    if isinstance(name, int) or str(name).strip().isdigit():
+        return GearStat(int(name)).value
+    name = ' '.join(str(name).split()).lower()
+    for member_name, member in GearStat.__members__.items():
+        if member_name.lower() == name:
+            return member.value
+    return None
+
+
+def _record_stat(stat_type: int, value, is_flat: bool) -> Stat:
+    """
+    :param stat_type: GearStat value
+    :param value: stat value, number or numeric string
+    :param is_flat: whether the value is flat, always for stats that only come in % (e.g. Crit. C)
+    :return: Stat object
+    """
+    if GearStat(stat_type) in [GearStat.CritC, GearStat.CritD, GearStat.Eff, GearStat.ER]:
+        is_flat = True
+    return Stat(stat_type, int(str(value).replace(',', '').strip()), is_flat)
+
+
+def parse_record_stat(value) -> Stat:
+    """
+    Process a stat of an external gear record
+
+    :param value: stat string (e.g. 'Attack 12%' or 'Crit. C 12'), or dict with a type name or GearStat value, a value
+                  and optionally is_flat
+    :return: Stat object
+    """
+    if isinstance(value, Stat):
+        return value
+    if isinstance(value, dict):
+        stat_type = _record_stat_type(value['type'])
+        if stat_type is not None:
+            return _record_stat(stat_type, value['value'], bool(value.get('is_flat', True)))
+        percent = '' if value.get('is_flat', True) else '%'
+        value = '{} {}{}'.format(value['type'], value['value'], percent)
+
+    # Names exactly as in GearStat, e.g. 'Crit. C 12', before the screenshot normalization
+    matched = re.fullmatch(r'\s*(.*?)\s*([0-9][0-9,]*)\s*(%?)\s*', str(value))
+    if matched is not None:
+        stat_type = _record_stat_type(matched.group(1))
+        if stat_type is not None:
+            return _record_stat(stat_type, matched.group(2), matched.group(3) != '%')
+    return parse_gear_stat(str(value))
+
+
+def _record_enum(value, enum, parse) -> int:
+    """
+    :param value: enum value as a number or numeric string, or a name
+    :param enum: GearType or GearSet
+    :param parse: parse_gear_type or parse_gear_set, applied to names
+    :return: enum value
+    """
+    if isinstance(value, int) or str(value).strip().isdigit():
+        return enum(int(value)).value
+    return parse(str(value))
+
+
+def gear_from_record(record: dict) -> Gear:
+    """
+    Maps a gear record exported by another tool onto a Gear, without an ID.
+
+    Keys are case insensitive: type, set, main_stat (or main) and substats as a list or substat1 to substat4. Stat names
+    are GearStat names or aliases (e.g. 'Crit. C'), other names go through the same normalization as screenshots.
+    GearType, GearSet and GearStat values, numbers or numeric strings, are taken as is. An in_use key is ignored: the
+    gear isn't in any of the hero loadouts, which free gears when deleted, so it is imported unused.
+
+    :param record: dict of field name -> value
+    :return: unused Gear with id -1
+    :raise ValueError: the gear doesn't fit the inventory, see validate_gear()
+    """
+    record = {str(key).strip().lower(): value for key, value in record.items()}
+
+    gear_type = _record_enum(record['type'], GearType, parse_gear_type)
+    gear_set = _record_enum(record['set'], GearSet, parse_gear_set)
+
+    main_stat = parse_record_stat(record['main_stat'] if 'main_stat' in record else record['main'])
+    if 'substats' in record:
+        substats = record['substats']
+    else:
+        substats = [record[key] for key in sorted(key for key in record if key.startswith('substat'))]
+    substats = [parse_record_stat(stat) for stat in substats if stat not in (None, '')]
+
+    return validate_gear(Gear(-1, gear_type, gear_set, main_stat, substats, False))
+
+
+# Columnar gear snapshot
+#
+# Header followed by one contiguous column per field, so each column can be copied into an array in one go:
+#   id        int32  * n
+#   type      uint8  * n
+#   set       uint8  * n
+#   in_use    uint8  * n
+#   stat_type uint8  * 5n   (main stat followed by 4 substats, 255 = no stat)
+#   stat_flat uint8  * 5n
+#   stat_val  uint16 * 5n
+SNAPSHOT_MAGIC = b'E7GS'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<4sHBxI')
+SNAPSHOT_STATS = 5
+SNAPSHOT_NO_STAT = 255
+# Highest stat value the uint16 stat column holds
+MAX_STAT_VALUE = 65535
+SNAPSHOT_COLUMNS = (
+    # name, typecode, values per gear
+    ('id', 'i', 1),
+    ('type', 'B', 1),
+    ('set', 'B', 1),
+    ('in_use', 'B', 1),
+    ('stat_type', 'B', SNAPSHOT_STATS),
+    ('stat_flat', 'B', SNAPSHOT_STATS),
+    ('stat_value', 'H', SNAPSHOT_STATS),
+)
+
+
+def gears_to_snapshot(gears) -> bytes:
+    """
+    Encodes gears into the columnar snapshot format
+
+    :param gears: iterable of Gear
+    :return: snapshot bytes
+    """
+    columns = {name: array(typecode) for name, typecode, _ in SNAPSHOT_COLUMNS}
+    count = 0
+    for gear in gears:
+        columns['id'].append(gear.id)
+        columns['type'].append(gear.type)
+        columns['set'].append(gear.set)
+        columns['in_use'].append(gear.in_use)
+
+        stats = [gear.main_stat] + list(gear.substats)
+        for i in range(SNAPSHOT_STATS):
+            if i < len(stats):
+                columns['stat_type'].append(stats[i].type)
+                columns['stat_flat'].append(stats[i].is_flat)
+                columns['stat_value'].append(stats[i].value)
+            else:
+                columns['stat_type'].append(SNAPSHOT_NO_STAT)
+                columns['stat_flat'].append(0)
+                columns['stat_value'].append(0)
+        count += 1
+
+    return columns_to_snapshot(columns, count)
+
+
+def columns_to_snapshot(columns: Dict[str, array], count: int) -> bytes:
+    """
+    Encodes gear columns into the snapshot format
+
+    :param columns: dict of column name -> array, see SNAPSHOT_COLUMNS
+    :param count: number of gears
+    :return: snapshot bytes
+    """
+    byteorder = 0 if sys.byteorder == 'little' else 1
+    output = [SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, byteorder, count)]
+    output.extend(columns[name].tobytes() for name, _, _ in SNAPSHOT_COLUMNS)
+    return b''.join(output)
+
+
+class GearSnapshot:
+    """
+    Read-only, memory-mapped view of a columnar gear snapshot.
+
+    Gears are decoded on access, or all columns can be copied straight into arrays with columns().
+    """
+
+    def __init__(self, path: str):
+        self.__file = open(path, 'rb')
+        try:
+            self.__mmap = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file can't be mapped
+            self.__file.close()
+            raise ValueError('Invalid gear snapshot: {}'.format(path))
+
+        if len(self.__mmap) < SNAPSHOT_HEADER.size:
+            self.close()
+            raise ValueError('Invalid gear snapshot: {}'.format(path))
+        magic, version, byteorder, self.count = SNAPSHOT_HEADER.unpack_from(self.__mmap, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError('Invalid gear snapshot: {}'.format(path))
+        self.__swap = byteorder != (0 if sys.byteorder == 'little' else 1)
+
+        # Column offsets and item decoders for lazy access
+        self.__offsets = {}
+        self.__items = {}
+        offset = SNAPSHOT_HEADER.size
+        for name, typecode, width in SNAPSHOT_COLUMNS:
+            self.__items[name] = struct.Struct(('<' if byteorder == 0 else '>') + typecode)
+            size = self.__items[name].size * width * self.count
+            self.__offsets[name] = (offset, offset + size)
+            offset += size
+
+        if offset > len(self.__mmap):
+            self.close()
+            raise ValueError('Truncated gear snapshot: {}'.format(path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.__mmap.close()
+        self.__file.close()
+
+    def column(self, name: str) -> array:
+        """
+        Copies a single column out of the snapshot
+
+        :param name: column name (see SNAPSHOT_COLUMNS)
+        :return: array holding the column
+        """
+        start, end = self.__offsets[name]
+        output = array(self.__items[name].format[-1])
+        output.frombytes(self.__mmap[start:end])
+        if self.__swap:
+            output.byteswap()
+        return output
+
+    def columns(self) -> Dict[str, array]:
+        """
+        Copies every column out of the snapshot
+
+        :return: Dictionary of column name to array
+        """
+        return {name: self.column(name) for name, _, _ in SNAPSHOT_COLUMNS}
+
+    def __getitem__(self, idx: int) -> Gear:
+        if not 0 <= idx < self.count:
+            raise IndexError('Gear snapshot index out of range')
+
+        def read(name, i):
+            item = self.__items[name]
+            return item.unpack_from(self.__mmap, self.__offsets[name][0] + i * item.size)[0]
+
+        stats = []
+        for i in range(idx * SNAPSHOT_STATS, (idx + 1) * SNAPSHOT_STATS):
+            stat_type = read('stat_type', i)
+            if stat_type != SNAPSHOT_NO_STAT:
+                stats.append(Stat(stat_type, read('stat_value', i), bool(read('stat_flat', i))))
+
+        return Gear(read('id', idx), read('type', idx), read('set', idx), stats[0], stats[1:],
+                    bool(read('in_use', idx)))
+
+    def gears(self) -> List[Gear]:
+        """
+        Decodes every gear in the snapshot
+
+        :return: list of Gear
+        """
+        columns = self.columns()
+        stat_type = columns['stat_type']
+        stat_flat = columns['stat_flat']
+        stat_value = columns['stat_value']
+
+        output = []
+        for idx, (gear_id, gear_type, gear_set, in_use) in enumerate(zip(columns['id'], columns['type'],
+                                                                            columns['set'], columns['in_use'])):
+            base = idx * SNAPSHOT_STATS
+            stats = [Stat(stat_type[i], stat_value[i], bool(stat_flat[i]))
+                     for i in range(base, base + SNAPSHOT_STATS) if stat_type[i] != SNAPSHOT_NO_STAT]
+            output.append(Gear(gear_id, gear_type, gear_set, stats[0], stats[1:], bool(in_use)))
+
+        return output
+
+
+class GearStore:
+    """
+    Columnar in-memory gear storage with the layout of SNAPSHOT_COLUMNS: one typed array per field and a block of
+    SNAPSHOT_STATS stats per gear, main stat first. A gear takes 27 bytes of arrays instead of a Gear, a list and 5
+    Stat objects.
+
+    Gears are rows of the arrays, rows of removed gears are reused. Code wanting Gear-like access goes through
+    GearView objects, code going through many gears can read the arrays in columns directly.
+
+    Reads of a gear resolve its row and read it under the store's lock, so a gear removed meanwhile is never read from
+    a row already reused by another gear. Writers hold the same lock, e.g. the Inventory shares its own.
+    """
+
+    def __init__(self, columns: Dict[str, array] = None, lock=None):
+        """
+        :param columns: initial columns, e.g. copied out of a GearSnapshot, the store takes ownership of them
+        :param lock: reentrant lock writers of the store hold, None for a lock of its own
+        """
+        if columns is None:
+            columns = {name: array(typecode) for name, typecode, _ in SNAPSHOT_COLUMNS}
+        self.columns = columns
+        self.lock = RLock() if lock is None else lock
+        self.__rows = {gear_id: row for row, gear_id in enumerate(columns['id'])}
+        self.__free = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__ = state
+        self.lock = RLock()
+
+    def __len__(self):
+        return len(self.__rows)
+
+    def __contains__(self, gear_id: int):
+        return gear_id in self.__rows
+
+    def __iter__(self):
+        return iter(self.__rows)
+
+    def row(self, gear_id: int) -> int:
+        """
+        Returns the row of a gear in the arrays
+
+        :param gear_id: ID of the gear
+        :return: row index, its stats are at row * SNAPSHOT_STATS onwards
+        """
+        try:
+            return self.__rows[gear_id]
+        except KeyError:
+            raise IndexError('Gear ID not found in inventory...')
+
+    def value(self, gear_id: int, name: str) -> int:
+        """
+        Reads a single value column of a gear
+
+        :param gear_id: ID of the gear
+        :param name: column name, e.g. 'type'
+        :return: value of the gear
+        """
+        with self.lock:
+            return self.columns[name][self.row(gear_id)]
+
+    def add(self, gear) -> int:
+        """
+        Stores a gear
+
+        :param gear: Gear or GearView with an assigned id
+        :return: row of the gear
+        """
+        if gear.id in self.__rows:
+            raise ValueError('Gear ID {} already in inventory...'.format(gear.id))
+        stats = [gear.main_stat] + list(gear.substats)
+        if len(stats) > SNAPSHOT_STATS:
+            raise ValueError('Gear ID {} has more than {} substats'.format(gear.id, SNAPSHOT_STATS - 1))
+
+        columns = self.columns
+        if self.__free:
+            row = self.__free.pop()
+        else:
+            row = len(columns['id'])
+            for name, typecode, width in SNAPSHOT_COLUMNS:
+                columns[name].extend([0] * width)
+
+        columns['id'][row] = gear.id
+        columns['type'][row] = gear.type
+        columns['set'][row] = gear.set
+        columns['in_use'][row] = bool(gear.in_use)
+        base = row * SNAPSHOT_STATS
+        for i in range(SNAPSHOT_STATS):
+            if i < len(stats):
+                columns['stat_type'][base + i] = stats[i].type
+                columns['stat_flat'][base + i] = bool(stats[i].is_flat)
+                columns['stat_value'][base + i] = stats[i].value
+            else:
+                columns['stat_type'][base + i] = SNAPSHOT_NO_STAT
+                columns['stat_flat'][base + i] = 0
+                columns['stat_value'][base + i] = 0
+
+        self.__rows[gear.id] = row
+        return row
+
+    def remove(self, gear_id: int):
+        """
+        Removes a gear, its row is reused by the next added gear
+
+        :param gear_id: ID of the gear
+        :return: None
+        """
+        row = self.row(gear_id)
+        del self.__rows[gear_id]
+        self.columns['id'][row] = -1
+        base = row * SNAPSHOT_STATS
+        for i in range(base, base + SNAPSHOT_STATS):
+            self.columns['stat_type'][i] = SNAPSHOT_NO_STAT
+        self.__free.append(row)
+
+    def set_in_use(self, gear_id: int, in_use: bool):
+        self.columns['in_use'][self.row(gear_id)] = bool(in_use)
+
+    def stats(self, gear_id: int) -> List[Stat]:
+        """
+        Returns the stats of a gear
+
+        :param gear_id: ID of the gear
+        :return: list of Stat, main stat first
+        """
+        with self.lock:
+            base = self.row(gear_id) * SNAPSHOT_STATS
+            stat_type = self.columns['stat_type']
+            stat_value = self.columns['stat_value']
+            stat_flat = self.columns['stat_flat']
+            return [Stat(stat_type[i], stat_value[i], bool(stat_flat[i]))
+                    for i in range(base, base + SNAPSHOT_STATS) if stat_type[i] != SNAPSHOT_NO_STAT]
+
+    def gear(self, gear_id: int) -> Gear:
+        """
+        Materializes a gear
+
+        :param gear_id: ID of the gear
+        :return: Gear, independent from the store
+        """
+        with self.lock:
+            row = self.row(gear_id)
+            stats = self.stats(gear_id)
+            return Gear(gear_id, self.columns['type'][row], self.columns['set'][row], stats[0], stats[1:],
+                        bool(self.columns['in_use'][row]))
+
+    def fingerprint(self, gear_id: int) -> bytes:
+        """
+        Returns the same fingerprint as gear_fingerprint(), straight from the arrays
+
+        :param gear_id: ID of the gear
+        :return: hashable fingerprint
+        """
+        row = self.row(gear_id)
+        base = row * SNAPSHOT_STATS
+        stat_type = self.columns['stat_type']
+        stat_value = self.columns['stat_value']
+        stat_flat = self.columns['stat_flat']
+        stats = [i for i in range(base, base + SNAPSHOT_STATS) if stat_type[i] != SNAPSHOT_NO_STAT]
+        return struct.pack('<BB' + 'BHB' * len(stats), self.columns['type'][row], self.columns['set'][row],
+                           *itertools.chain.from_iterable((stat_type[i], stat_value[i], stat_flat[i] != 0)
+                                                          for i in stats))
+
+    def snapshot(self) -> bytes:
+        """
+        Encodes the stored gears into the snapshot format straight from the arrays
+
+        :return: snapshot bytes
+        """
+        rows = list(self.__rows.values())
+        if rows == list(range(len(self.columns['id']))):
+            return columns_to_snapshot(self.columns, len(rows))
+
+        # Drop free rows, keeping the gears in the order they were added
+        columns = {}
+        for name, typecode, width in SNAPSHOT_COLUMNS:
+            column = self.columns[name]
+            if width == 1:
+                columns[name] = array(typecode, [column[row] for row in rows])
+            else:
+                columns[name] = array(typecode)
+                for row in rows:
+                    columns[name].extend(column[row * width:(row + 1) * width])
+        return columns_to_snapshot(columns, len(rows))
+
+
+class GearView:
+    """
+    Gear-like access to a gear of a GearStore, reading the arrays on every access.
+
+    Stats are rebuilt on each access so modifying them doesn't change the store, and usage is changed through the
+    Inventory. A view pickles and copies as a plain Gear, e.g. when sent to optimizer processes.
+
+    Each access reads the gear by id under the store's lock, so it sees the gear as it is now and never another gear's
+    row, but a view of a removed gear raises IndexError. Code holding on to gears while other threads may remove them
+    materializes them instead, e.g. the optimizer's candidates and the GUI gear table through
+    Inventory.materialized_gears().
+    """
+    __slots__ = ['_store', 'id']
+
+    def __init__(self, store: GearStore, gear_id: int):
+        self._store = store
+        self.id = gear_id
+
+    @property
+    def type(self) -> int:
+        return self._store.value(self.id, 'type')
+
+    @property
+    def set(self) -> int:
+        return self._store.value(self.id, 'set')
+
+    @property
+    def in_use(self) -> bool:
+        return bool(self._store.value(self.id, 'in_use'))
+
+    @property
+    def main_stat(self) -> Stat:
+        return self._store.stats(self.id)[0]
+
+    @property
+    def substats(self) -> List[Stat]:
+        return self._store.stats(self.id)[1:]
+
+    def to_gear(self) -> Gear:
+        return self._store.gear(self.id)
+
+    def __reduce__(self):
+        gear = self.to_gear()
+        return Gear, (gear.id, gear.type, gear.set, gear.main_stat, gear.substats, gear.in_use)
+
+    def __eq__(self, other):
+        if isinstance(other, GearView):
+            other = other.to_gear()
+        if not isinstance(other, Gear):
+            return NotImplemented
+        return self.to_gear() == other
+
+    __hash__ = None
+
+    def __str__(self):
+        return str(self.to_gear())
+
+    def __repr__(self):
+        return 'GearView({!r})'.format(self.to_gear())
+
@@ -1,5 +1,8 @@
 import os
-from threading import Thread
+from array import array
+from bisect import bisect_left
+from threading import Event, Thread
+import time
 
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
@@ -9,17 +12,245 @@ from requests import get
 
 from gear import *
 from optimizer import E7GearOptimizer
+from watcher import FolderWatcher
 import re
 
 QLAYER_STYLESHEET = 'resources/style/qlayer.qss'
+# Seconds between GUI updates while importing
+IMPORT_UPDATE_INTERVAL = 0.1
+
+
+class GearFilterIndex:
+    """
+    Inverted index of gear table rows for filtering. Every (slot, set, main stat, substat) key maps to a bitmask of
+    the rows having it, so a filter is the intersection of a few masks instead of a scan over the rows.
+
+    Numeric filters use a mask per distinct stat value, a gear's value of a stat being the highest of its main stat
+    and substats of that type. Flat and % values of a stat (e.g. Attack 40 and Attack 8%) are ranged separately.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.reset([])
+
+    def reset(self, gears):
+        self.__masks = {}
+        self.__values = {}
+        self.__at_least = {}
+        self.__row_keys = []
+        self.__row_values = []
+        for gear in gears:
+            self.append(gear)
+        self.version += 1
+
+    def __len__(self):
+        return len(self.__row_keys)
+
+    @staticmethod
+    def _row_keys(gear):
+        keys = [('type', gear.type), ('set', gear.set), ('main', gear.main_stat.type)]
+        keys.extend(('sub', i, substat.type) for i, substat in enumerate(gear.substats))
+
+        values = {}
+        for stat in [gear.main_stat] + list(gear.substats):
+            key = stat.type, bool(stat.is_flat)
+            values[key] = max(values.get(key, stat.value), stat.value)
+
+        return keys, values
+
+    def __set_row(self, row, keys, values):
+        bit = 1 << row
+        for key in keys:
+            self.__masks[key] = self.__masks.get(key, 0) | bit
+        for stat, value in values.items():
+            stat_values = self.__values.setdefault(stat, {})
+            stat_values[value] = stat_values.get(value, 0) | bit
+            self.__at_least.pop(stat, None)
+
+    def __clear_row(self, row):
+        bit = ~(1 << row)
+        for key in self.__row_keys[row]:
+            self.__masks[key] &= bit
+        for stat, value in self.__row_values[row].items():
+            self.__values[stat][value] &= bit
+            self.__at_least.pop(stat, None)
+
+    def append(self, gear):
+        keys, values = self._row_keys(gear)
+        self.__set_row(len(self.__row_keys), keys, values)
+        self.__row_keys.append(keys)
+        self.__row_values.append(values)
+        self.version += 1
+
+    def update(self, row, gear):
+        self.__clear_row(row)
+        keys, values = self._row_keys(gear)
+        self.__set_row(row, keys, values)
+        self.__row_keys[row] = keys
+        self.__row_values[row] = values
+        self.version += 1
+
+    def at_least(self, stat, minimum):
+        """
+        Returns the mask of rows whose value of the stat is at least minimum
+
+        :param stat: (GearStat value, is_flat)
+        :param minimum: minimum value
+        :return: bitmask of rows
+        """
+        if stat not in self.__at_least:
+            # Sorted distinct values with the OR of the masks of every value from there up
+            values = sorted(self.__values.get(stat, {}).items())
+            masks = [0] * (len(values) + 1)
+            for i in range(len(values) - 1, -1, -1):
+                masks[i] = masks[i + 1] | values[i][1]
+            self.__at_least[stat] = ([value for value, _ in values], masks)
+
+        values, masks = self.__at_least[stat]
+        return masks[bisect_left(values, minimum)]
+
+    def query(self, gear_type=-1, gear_set=-1, main_stat=-1, substats=(-1, -1, -1, -1), ranges=None):
+        """
+        Returns the mask of rows matching the filter, -1 meaning any
+
+        :param gear_type: GearType value
+        :param gear_set: GearSet value
+        :param main_stat: GearStat value of the main stat
+        :param substats: GearStat value of each substat
+        :param ranges: Dictionary of (GearStat value, is_flat) to (min, max) value, None meaning unbounded
+        :return: bitmask of rows
+        """
+        mask = (1 << len(self.__row_keys)) - 1
+        if gear_type != -1:
+            mask &= self.__masks.get(('type', gear_type), 0)
+        if gear_set != -1:
+            mask &= self.__masks.get(('set', gear_set), 0)
+        if main_stat != -1:
+            mask &= self.__masks.get(('main', main_stat), 0)
+        for i, substat in enumerate(substats):
+            if substat != -1:
+                mask &= self.__masks.get(('sub', i, substat), 0)
+
+        for stat, (minimum, maximum) in (ranges or {}).items():
+            if minimum is not None:
+                mask &= self.at_least(stat, minimum)
+            if maximum is not None:
+                mask &= ~self.at_least(stat, maximum + 1)
+
+        return mask
+
+    def rows(self, mask: int) -> bytes:
+        """
+        Unpacks a mask for testing rows in constant time, shifting the mask itself costs its whole length per row
+
+        :param mask: bitmask of rows
+        :return: little endian bytes of the mask, row r is bit r % 8 of byte r // 8
+        """
+        return mask.to_bytes((len(self.__row_keys) + 7) // 8, 'little')
 
 
 class GearTableModel(QAbstractTableModel):
     headers = ['Type', 'Set', 'Main Stat', 'Substat 1', 'Substat 2', 'Substat 3', 'Substat 4']
-    gears = []
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.gears = []
+        # Inventory version the model is up to date with
+        self.version = 0
+
+        # Per row display strings and sort keys, rebuilt only when the row's gear changes
+        self.__display = []
+        self.__sort_keys = []
+        self.__rows = {}
+
+        self.filter_index = GearFilterIndex()
+
+    @staticmethod
+    def _row_cache(gear):
+        """
+        Precomputes the display strings and numeric sort keys of a gear's row
+
+        :param gear: Gear of the row
+        :return: tuple of display strings, tuple of sort keys
+        """
+        stats = [gear.main_stat] + list(gear.substats)
+        stats += [None] * (5 - len(stats))
+        display = (GearType(gear.type).name, GearSet(gear.set).name) + \
+            tuple(str(stat) if stat is not None else '' for stat in stats)
+        sort_keys = (gear.type, gear.set) + \
+            tuple(stat.type * 100000 + stat.value if stat is not None else -1 for stat in stats)
+        return display, sort_keys
 
     def setGears(self, gears):
-        self.gears = gears
+        self.beginResetModel()
+        self.gears = list(gears)
+        self.__display = []
+        self.__sort_keys = []
+        for gear in self.gears:
+            display, sort_keys = self._row_cache(gear)
+            self.__display.append(display)
+            self.__sort_keys.append(sort_keys)
+        self.__rows = {gear.id: row for row, gear in enumerate(self.gears)}
+        self.filter_index.reset(self.gears)
+        self.endResetModel()
+
+    def appendGears(self, gears):
+        if not gears:
+            return
+
+        first = len(self.gears)
+        self.beginInsertRows(QModelIndex(), first, first + len(gears) - 1)
+        for gear in gears:
+            display, sort_keys = self._row_cache(gear)
+            self.__rows[gear.id] = len(self.gears)
+            self.gears.append(gear)
+            self.__display.append(display)
+            self.__sort_keys.append(sort_keys)
+            self.filter_index.append(gear)
+        self.endInsertRows()
+
+    def removeGears(self, gear_ids):
+        rows = sorted((self.__rows[gear_id] for gear_id in gear_ids if gear_id in self.__rows), reverse=True)
+        if not rows:
+            return
+
+        for row in rows:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.gears[row]
+            del self.__display[row]
+            del self.__sort_keys[row]
+            self.endRemoveRows()
+        self.__rows = {gear.id: row for row, gear in enumerate(self.gears)}
+        # Rows shifted, bit positions have to be rebuilt
+        self.filter_index.reset(self.gears)
+
+    def updateGears(self, gears):
+        for gear in gears:
+            row = self.__rows.get(gear.id)
+            if row is None:
+                continue
+            self.gears[row] = gear
+            self.__display[row], self.__sort_keys[row] = self._row_cache(gear)
+            self.filter_index.update(row, gear)
+            self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+    def sync(self, inventory):
+        """
+        Brings the model up to date with the inventory using its change feed, resetting only when the feed doesn't go
+        back far enough
+        """
+        # Rows hold copies of the gears, a view would fail once a background thread removes its gear
+        changes = inventory.changes_since(self.version)
+        if changes is None:
+            self.version, gears = inventory.materialized_gears()
+            self.setGears(gears)
+            return
+
+        # Gears may have been removed since the changes were taken, the next sync picks that up
+        self.removeGears(changes.removed)
+        self.updateGears(inventory.materialized_gears(changes.updated)[1])
+        self.appendGears(inventory.materialized_gears(changes.added)[1])
+        self.version = changes.version
 
     def rowCount(self, parent=None, *args, **kwargs):
         return len(self.gears)
@@ -28,18 +259,10 @@ class GearTableModel(QAbstractTableModel):
         return 7
 
     def data(self, index, role=None):
-        row = index.row()
-        col = index.column()
-
         if role == Qt.DisplayRole:
-            if col == 0:
-                return str(GearType(self.gears[row].type).name)
-            elif col == 1:
-                return str(GearSet(self.gears[row].set).name)
-            elif col == 2:
-                return str(self.gears[row].main_stat)
-            else:
-                return str(self.gears[row].substats[col - 3])
+            return self.__display[index.row()][index.column()]
+        elif role == Qt.UserRole:
+            return self.__sort_keys[index.row()][index.column()]
 
         return QVariant()
 
@@ -54,10 +277,21 @@ class GearTableModel(QAbstractTableModel):
 
 
 class GearFilter(QSortFilterProxyModel):
-    __gear_type = -1
-    __gear_set = -1
-    __main_stat = -1
-    __substats = [-1, -1, -1, -1]
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.__gear_type = -1
+        self.__gear_set = -1
+        self.__main_stat = -1
+        self.__substats = [-1, -1, -1, -1]
+        self.__ranges = {}
+
+        # Rows accepted by the current filter, recomputed when the filter or the source model's index changes
+        self.__accepted = b''
+        self.__accepted_version = None
+
+    def invalidateFilter(self):
+        self.__accepted_version = None
+        super().invalidateFilter()
 
     @pyqtSlot(int)
     def set_gear_type(self, gear_type):
@@ -79,30 +313,149 @@ class GearFilter(QSortFilterProxyModel):
         self.__substats[substat_num] = substat - 1
         self.invalidateFilter()
 
+    def set_stat_ranges(self, ranges):
+        """
+        Filters gears by the value of stats, e.g. {(GearStat.Speed.value, True): (10, None)} for Speed >= 10
+
+        :param ranges: Dictionary of (GearStat value, is_flat) to (min, max) value, None meaning unbounded
+        """
+        self.__ranges = dict(ranges)
+        self.invalidateFilter()
+
     def filterAcceptsRow(self, source_row, source_parent):
-        index_type = self.sourceModel().index(source_row, 0, source_parent).data()
-        index_set = self.sourceModel().index(source_row, 1, source_parent).data()
-        index_main = self.sourceModel().index(source_row, 2, source_parent).data()
-        index_substat1 = self.sourceModel().index(source_row, 3, source_parent).data()
-        index_substat2 = self.sourceModel().index(source_row, 4, source_parent).data()
-        index_substat3 = self.sourceModel().index(source_row, 5, source_parent).data()
-        index_substat4 = self.sourceModel().index(source_row, 6, source_parent).data()
-
-        if (self.__gear_type == -1 or self.__gear_type == GearType[index_type].value) and \
-           (self.__gear_set == -1 or self.__gear_set == GearSet[index_set].value) and \
-           (self.__main_stat == -1 or self.__main_stat == GearStat[index_main.rsplit(' ', 1)[0]].value) and \
-           (self.__substats[0] == -1 or self.__substats[0] == GearStat[index_substat1.rsplit(' ', 1)[0]].value) and \
-           (self.__substats[1] == -1 or self.__substats[1] == GearStat[index_substat2.rsplit(' ', 1)[0]].value) and \
-           (self.__substats[2] == -1 or self.__substats[2] == GearStat[index_substat3.rsplit(' ', 1)[0]].value) and \
-           (self.__substats[3] == -1 or self.__substats[3] == GearStat[index_substat4.rsplit(' ', 1)[0]].value):
-                return True
-
-        return False
+        index = self.sourceModel().filter_index
+        if self.__accepted_version != index.version:
+            self.__accepted = index.rows(index.query(self.__gear_type, self.__gear_set, self.__main_stat,
+                                                     self.__substats, self.__ranges))
+            self.__accepted_version = index.version
+
+        return bool(self.__accepted[source_row >> 3] >> (source_row & 7) & 1)
 
     def headerData(self, index, orientation, role=None):
         return self.sourceModel().headerData(index, orientation, role)
 
 
+class ResultTableModel(QAbstractTableModel):
+    """
+    Optimizer results stored column by column, one array of final stat values per stat. Cells are only formatted when
+    painted and sorting reorders a row permutation instead of the results.
+    """
+    headers = [stat.name for stat in GearStat]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.__columns = [array('l') for _ in self.headers]
+        self.__results = []
+        self.__order = array('l')
+        self.__sort = (-1, Qt.DescendingOrder)
+
+    def setResults(self, results):
+        """
+        Replaces the results, keeping the current sort order
+
+        :param results: list of (final stats, loadout) ordered from best to worst
+        """
+        self.beginResetModel()
+        self.__results = list(results)
+        self.__columns = [array('l', (final_stats[stat] for final_stats, _ in self.__results))
+                          for stat in self.headers]
+        self.__order = self.__sorted_order(*self.__sort)
+        self.endResetModel()
+
+    def setPartialResults(self, results, keep=None):
+        """
+        Replaces the results with a partial snapshot of a running optimization, keeping the current sort order
+
+        :param results: list of (final stats, loadout) ordered from best to worst
+        :param keep: (final stats, loadout) kept after the snapshot's results if the snapshot no longer has it, e.g. the
+                     selected result, None for none
+        """
+        results = list(results)
+        if keep is not None and all(self.__gear_ids(result) != self.__gear_ids(keep) for result in results):
+            results.append(keep)
+        self.setResults(results)
+
+    @staticmethod
+    def __gear_ids(result):
+        return tuple(gear.id for gear in result[1])
+
+    def resultRow(self, result) -> int:
+        """
+        :param result: (final stats, loadout)
+        :return: row in the view of the result with the same gears, -1 if there's none
+        """
+        gear_ids = self.__gear_ids(result)
+        for row, i in enumerate(self.__order):
+            if self.__gear_ids(self.__results[i]) == gear_ids:
+                return row
+        return -1
+
+    def __sorted_order(self, column, order):
+        if column < 0:
+            # Optimizer's score order
+            return array('l', range(len(self.__results)))
+        return array('l', sorted(range(len(self.__results)), key=self.__columns[column].__getitem__,
+                                 reverse=order == Qt.DescendingOrder))
+
+    def result(self, row):
+        """
+        :param row: row in the view
+        :return: (final stats, loadout) displayed at the row
+        """
+        return self.__results[self.__order[row]]
+
+    def rowCount(self, parent=None, *args, **kwargs):
+        return len(self.__order)
+
+    def columnCount(self, parent=None, *args, **kwargs):
+        return len(self.headers)
+
+    def data(self, index, role=None):
+        if role == Qt.DisplayRole:
+            return str(self.__columns[index.column()][self.__order[index.row()]])
+        elif role == Qt.UserRole:
+            return self.__columns[index.column()][self.__order[index.row()]]
+
+        return QVariant()
+
+    def headerData(self, index, orientation, role=None):
+        if role != Qt.DisplayRole:
+            return QVariant()
+
+        if orientation == Qt.Horizontal:
+            return self.headers[index]
+
+        return index + 1
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        self.__sort = (column, order)
+        self.__order = self.__sorted_order(column, order)
+        self.layoutChanged.emit()
+
+
+class ResultTableView(QTableView):
+    """
+    Optimizer results table keeping the selected result and the scroll position while partial results come in
+    """
+
+    def setPartialResults(self, results):
+        """
+        Shows a partial snapshot of a running optimization, see ResultTableModel.setPartialResults()
+
+        :param results: list of (final stats, loadout) ordered from best to worst
+        """
+        model = self.model()
+        rows = self.selectionModel().selectedRows()
+        selected = model.result(rows[0].row()) if rows else None
+        scroll = self.verticalScrollBar().value()
+
+        model.setPartialResults(results, selected)
+        if selected is not None:
+            self.selectRow(model.resultRow(selected))
+        self.verticalScrollBar().setValue(scroll)
+
+
 class TabBar(QTabBar):
     def tabSizeHint(self, index):
         s = QTabBar.tabSizeHint(self, index)
@@ -203,9 +556,89 @@ class CenterAlignDelegate(QItemDelegate):
         QItemDelegate.paint(self, painter, option, index)
 
 
+class SweepCurveWidget(QWidget):
+    """
+    Plots the best score reached for each threshold of a constraint sweep, clicking a point selects its threshold
+    """
+    point_clicked = pyqtSignal(int)
+
+    # Pixels around the plot for the axis labels
+    MARGIN = 40
+    # Radius of a point in pixels
+    POINT_RADIUS = 4
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumHeight(180)
+        self.__stat = ''
+        self.__points = []
+
+    def setCurve(self, stat, points):
+        """
+        :param stat: swept stat name
+        :param points: list of (threshold, best score or None if unreachable) in ascending threshold order
+        :return: None
+        """
+        self.__stat = stat
+        self.__points = points
+        self.update()
+
+    def __positions(self):
+        reached = [(i, threshold, score) for i, (threshold, score) in enumerate(self.__points) if score is not None]
+        if not reached:
+            return []
+
+        min_x, max_x = self.__points[0][0], self.__points[-1][0]
+        min_y = min(score for _, _, score in reached)
+        max_y = max(score for _, _, score in reached)
+        width = self.width() - 2 * self.MARGIN
+        height = self.height() - 2 * self.MARGIN
+
+        positions = []
+        for i, threshold, score in reached:
+            x = self.MARGIN + (width * (threshold - min_x) / (max_x - min_x) if max_x != min_x else width / 2)
+            y = self.MARGIN + (height * (max_y - score) / (max_y - min_y) if max_y != min_y else height / 2)
+            positions.append((i, QPointF(x, y)))
+        return positions
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        plot = self.rect().adjusted(self.MARGIN, self.MARGIN, -self.MARGIN, -self.MARGIN)
+
+        painter.setPen(QPen(self.palette().color(QPalette.WindowText)))
+        painter.drawLine(plot.bottomLeft(), plot.bottomRight())
+        painter.drawLine(plot.bottomLeft(), plot.topLeft())
+        if not self.__points:
+            painter.drawText(plot, Qt.AlignCenter, 'No sweep')
+            return
+
+        painter.drawText(QRectF(plot.left(), plot.bottom(), plot.width(), self.MARGIN), Qt.AlignCenter,
+                         'Min {}: {} - {}'.format(self.__stat, self.__points[0][0], self.__points[-1][0]))
+        scores = [score for _, score in self.__points if score is not None]
+        if not scores:
+            painter.drawText(plot, Qt.AlignCenter, 'No reachable threshold')
+            return
+        painter.drawText(QRectF(0, 0, self.width(), self.MARGIN), Qt.AlignCenter,
+                         'Best score: {:.0f} - {:.0f}'.format(min(scores), max(scores)))
+
+        positions = [point for _, point in self.__positions()]
+        painter.setPen(QPen(self.palette().color(QPalette.Highlight), 2))
+        painter.drawPolyline(QPolygonF(positions))
+        painter.setBrush(self.palette().color(QPalette.Highlight))
+        for point in positions:
+            painter.drawEllipse(point, self.POINT_RADIUS, self.POINT_RADIUS)
+
+    def mousePressEvent(self, event):
+        for i, point in self.__positions():
+            if (QPointF(event.pos()) - point).manhattanLength() <= self.POINT_RADIUS * 3:
+                self.point_clicked.emit(i)
+                return
+
+
 class OptimizerWidget(QObject, E7GearOptimizer):
     optimizer_done_signal = pyqtSignal()
-    gear_added_signal = pyqtSignal()
+    inventory_changed_signal = pyqtSignal()
 
     def __init__(self):
         QObject.__init__(self, None)
@@ -213,7 +646,7 @@ class OptimizerWidget(QObject, E7GearOptimizer):
 
     def import_gear(self, image_paths):
         super(OptimizerWidget, self).import_gear(image_paths)
-        self.gear_added_signal.emit(self.gears)
+        self.inventory_changed_signal.emit()
 
     def optimize(self, priorities, required_sets, min_max_constraints):
         super(OptimizerWidget, self).optimize(priorities, required_sets, min_max_constraints)
@@ -222,12 +655,23 @@ class OptimizerWidget(QObject, E7GearOptimizer):
 
 class GUI(QWidget):
     optimizer_done_signal = pyqtSignal()
-    gear_added_signal = pyqtSignal(list)
+    optimizer_partial_signal = pyqtSignal(list)
+    sweep_done_signal = pyqtSignal(str, list)
+    inventory_changed_signal = pyqtSignal()
+    import_progress_signal = pyqtSignal(int, int, int)
+    import_error_signal = pyqtSignal(str, str)
+    import_done_signal = pyqtSignal()
+    watch_imported_signal = pyqtSignal(str, bool)
 
     def __init__(self, parent=None):
         super().__init__(parent)
 
         self.optimizer = E7GearOptimizer()
+        # Optimizer runs on a worker thread, the signal queues partial results to the GUI thread
+        self.optimizer.partial_results_callback = self.optimizer_partial_signal.emit
+        self.import_cancel = Event()
+        # Auto-import of a watched screenshot folder, None when not watching
+        self.folder_watcher = None
 
         self.side_bar = TabWidget()
 
@@ -239,7 +683,7 @@ class GUI(QWidget):
 
         # Load gears
         self.optimizer.load()
-        self.gear_added_signal.emit(self.optimizer.gears)
+        self.inventory_changed_signal.emit()
 
     def _init_ui(self):
         self._init_optimizer_tab()
@@ -402,7 +846,7 @@ class GUI(QWidget):
         # Optimize button
         btn_optimize = QPushButton('Optimize')
 
-        def start_optimizer():
+        def read_constraints():
             priorities = []
             for x in range(priorities_selected.count()):
                 priorities.append(GearStat[priorities_selected.item(x).text()].value)
@@ -420,52 +864,103 @@ class GUI(QWidget):
                 max_stat = layout_min_max.itemAt(x + 2).widget().text()
                 min_max[stat] = (int(min_stat) if min_stat else 0, int(max_stat) if max_stat else 100000)
 
-            thread = Thread(target=self.optimize, args=(priorities, required_set, min_max,))
+            return priorities, required_set, min_max
+
+        def start_optimizer():
+            thread = Thread(target=self.optimize, args=read_constraints())
             thread.daemon = True
             thread.start()
 
         btn_optimize.clicked.connect(start_optimizer)
 
+        # Constraint sweep, best loadouts for a series of minimums of one stat
+        group_sweep = QGroupBox('Sweep')
+        layout_sweep = QHBoxLayout()
+        sweep_stat = QComboBox()
+        sweep_stat.addItems([stat.name for stat in GearStat])
+        sweep_from = QLineEdit()
+        sweep_to = QLineEdit()
+        sweep_step = QLineEdit()
+        for line_edit, placeholder in ((sweep_from, 'From'), (sweep_to, 'To'), (sweep_step, 'Step')):
+            line_edit.setValidator(QIntValidator())
+            line_edit.setPlaceholderText(placeholder)
+        btn_sweep = QPushButton('Sweep')
+        layout_sweep.addWidget(sweep_stat)
+        layout_sweep.addWidget(sweep_from)
+        layout_sweep.addWidget(sweep_to)
+        layout_sweep.addWidget(sweep_step)
+        layout_sweep.addWidget(btn_sweep)
+        group_sweep.setLayout(layout_sweep)
+
+        def start_sweep():
+            if not sweep_from.text() or not sweep_to.text():
+                return
+            step = max(int(sweep_step.text() or 1), 1)
+            thresholds = list(range(int(sweep_from.text()), int(sweep_to.text()) + 1, step))
+            if not thresholds:
+                return
+
+            thread = Thread(target=self.sweep, args=read_constraints() + (sweep_stat.currentText(), thresholds))
+            thread.daemon = True
+            thread.start()
+
+        btn_sweep.clicked.connect(start_sweep)
+
         widget_constraints = QWidget()
         layout_constraints = QGridLayout()
         layout_constraints.addWidget(group_priorities, 0, 0, 2, 1)
         layout_constraints.addWidget(group_min_max, 0, 1, 3, 1)
         layout_constraints.addWidget(group_set, 2, 0, 2, 1)
         layout_constraints.addWidget(btn_optimize, 3, 1, 1, 1)
+        layout_constraints.addWidget(group_sweep, 4, 0, 1, 2)
         widget_constraints.setLayout(layout_constraints)
 
         # Optimizer results table
-        table = QTableWidget()
+        self.result_model = ResultTableModel()
+
+        table = ResultTableView()
         table.setObjectName('results_table')
+        table.setModel(self.result_model)
         table.setItemDelegate(CenterAlignDelegate())
-        table.setColumnCount(8)
-        table.setHorizontalHeaderLabels([stat.name for stat in GearStat])
         table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        table.setSelectionMode(QAbstractItemView.SingleSelection)
         table.setMinimumWidth(900)
+        # No sort indicator keeps the optimizer's score order until a header is clicked
+        table.horizontalHeader().setSortIndicator(-1, Qt.DescendingOrder)
+        table.setSortingEnabled(True)
+
+        def show_constraint_gaps():
+            if self.optimizer.constraint_gaps:
+                QMessageBox.warning(self, 'Constraints out of reach',
+                                    '\n'.join(str(gap) for gap in self.optimizer.constraint_gaps))
 
         def populate_result_table():
-            table.setRowCount(0)
-            row_count = 0
-            for final_stat, combo in self.optimizer.optimizer_output:
-                table.insertRow(row_count)
-                for i, stat in enumerate([stat.name for stat in GearStat]):
-                    table.setItem(row_count, i, QTableWidgetItem(str(final_stat[stat])))
-                row_count += 1
+            self.result_model.setResults(self.optimizer.optimizer_output)
+            show_constraint_gaps()
 
         self.optimizer_done_signal.connect(populate_result_table)
+        # Partial results keep the selected result and the scroll position, only the final results reset them
+        self.optimizer_partial_signal.connect(table.setPartialResults)
 
-        def sort_results_header_click(col_index):
-            self.optimizer.optimizer_output.sort(key=lambda a: a[0][GearStat(col_index).name], reverse=True)
-            populate_result_table()
+        # Sweep tradeoff curve, the loadouts of the clicked threshold are shown in the results table
+        sweep_curve = SweepCurveWidget()
+        self.sweep_curve = []
 
-        table.horizontalHeader().sectionClicked.connect(sort_results_header_click)
+        def show_sweep(stat, curve):
+            self.sweep_curve = curve
+            sweep_curve.setCurve(stat, [(threshold, score) for threshold, score, _ in curve])
+            show_constraint_gaps()
 
-        def update_hero_stat_from_selection(item):
-            row = item.row()
-            stats = self.optimizer.optimizer_output[row][0]
+        def show_sweep_threshold(i):
+            self.result_model.setResults(self.sweep_curve[i][2])
+
+        self.sweep_done_signal.connect(show_sweep)
+        sweep_curve.point_clicked.connect(show_sweep_threshold)
+
+        def update_hero_stat_from_selection(index):
+            stats, loadout = self.result_model.result(index.row())
             self.update_hero_stats(stats)
 
-            loadout = self.optimizer.optimizer_output[row][1]
             for i, gear in enumerate(loadout):
                 gear_type_ui_text = widget_hero.findChild(QLabel, GearType(i).name)
                 gear_type_ui_text.setFont(QFont('Courier'))
@@ -475,7 +970,7 @@ class GUI(QWidget):
                 set_img = QPixmap('resources/set_images/{}.png'.format(GearSet(gear.set).name))
                 gear_set_img.setPixmap(set_img)
 
-        table.itemClicked.connect(update_hero_stat_from_selection)
+        table.clicked.connect(update_hero_stat_from_selection)
 
         """layout_results = QVBoxLayout()
         layout_results.addWidget(table)
@@ -484,7 +979,12 @@ class GUI(QWidget):
         # Put everything together
         qlayer_hero = QLayer('Hero', widget_hero)
         qlayer_constraints = QLayer('Constraints', widget_constraints)
-        qlayer_results = QLayer('Results', table)
+        widget_results = QWidget()
+        layout_results = QVBoxLayout()
+        layout_results.addWidget(table)
+        layout_results.addWidget(sweep_curve)
+        widget_results.setLayout(layout_results)
+        qlayer_results = QLayer('Results', widget_results)
 
         layout_tab = QGridLayout()
         layout_tab.addWidget(qlayer_hero, 0, 0)
@@ -495,32 +995,104 @@ class GUI(QWidget):
     def _init_gears_tab(self):
         # Import options
         btn_import_images = QPushButton('Import Images (1280*720p)')
+        btn_cancel_import = QPushButton('Cancel')
+        btn_cancel_import.setEnabled(False)
+        progress_import = QProgressBar()
+        progress_import.setVisible(False)
+        label_import = QLabel()
 
         def import_gear_image():
             file_dialog = QFileDialog()
             files = file_dialog.getOpenFileNames()
             if files[0]:
+                btn_import_images.setEnabled(False)
+                btn_cancel_import.setEnabled(True)
+                progress_import.setRange(0, len(files[0]))
+                progress_import.setValue(0)
+                progress_import.setVisible(True)
+                label_import.clear()
                 self.import_gear(files[0])
 
+        def update_import_progress(done, failed, total):
+            progress_import.setRange(0, total)
+            progress_import.setValue(done)
+            label_import.setText('{}/{} images, {} not imported'.format(done, total, failed))
+
+        def show_import_error(path, error):
+            print('{}: {}'.format(path, error))
+            label_import.setToolTip('\n'.join(filter(None, [label_import.toolTip(),
+                                                               '{}: {}'.format(os.path.basename(path), error)])))
+
+        def import_done():
+            btn_import_images.setEnabled(True)
+            btn_cancel_import.setEnabled(False)
+            progress_import.setVisible(False)
+
+        btn_watch_folder = QPushButton('Watch Folder')
+        label_watch = QLabel()
+        watch_counts = [0, 0]
+
+        def toggle_watch_folder():
+            if self.folder_watcher is not None:
+                self.folder_watcher.stop()
+                self.folder_watcher = None
+                btn_watch_folder.setText('Watch Folder')
+                label_watch.clear()
+                return
+
+            directory = QFileDialog.getExistingDirectory(self, 'Screenshot folder to import automatically')
+            if directory:
+                watch_counts[:] = [0, 0]
+                self.folder_watcher = FolderWatcher(
+                    self.optimizer, directory,
+                    lambda path, gear, error: self.watch_imported_signal.emit(path, gear is not None))
+                self.folder_watcher.start()
+                btn_watch_folder.setText('Stop Watching')
+                label_watch.setText('Watching {}'.format(directory))
+
+        def update_watch(path, imported):
+            watch_counts[0 if imported else 1] += 1
+            label_watch.setText('Watching {}: {} imported, {} not imported'.format(
+                self.folder_watcher.directory if self.folder_watcher else '', *watch_counts))
+            if imported:
+                self.inventory_changed_signal.emit()
+
         btn_import_images.clicked.connect(import_gear_image)
+        btn_cancel_import.clicked.connect(self.import_cancel.set)
+        btn_watch_folder.clicked.connect(toggle_watch_folder)
+        self.watch_imported_signal.connect(update_watch)
+        self.import_progress_signal.connect(update_import_progress)
+        self.import_error_signal.connect(show_import_error)
+        self.import_done_signal.connect(import_done)
+
+        widget_import = QWidget()
+        layout_import = QGridLayout()
+        layout_import.setContentsMargins(0, 0, 0, 0)
+        layout_import.addWidget(btn_import_images, 0, 0, 1, 1)
+        layout_import.addWidget(btn_cancel_import, 0, 1, 1, 1)
+        layout_import.addWidget(progress_import, 1, 0, 1, 2)
+        layout_import.addWidget(label_import, 2, 0, 1, 2)
+        layout_import.addWidget(btn_watch_folder, 3, 0, 1, 2)
+        layout_import.addWidget(label_watch, 4, 0, 1, 2)
+        widget_import.setLayout(layout_import)
 
         # Gears
         self.gear_model = GearTableModel()
         gear_filter = GearFilter()
         gear_filter.setSourceModel(self.gear_model)
+        gear_filter.setSortRole(Qt.UserRole)
         gear_filter.setDynamicSortFilter(True)
 
         gear_table = QTableView()
         gear_table.setModel(gear_filter)
         gear_table.setItemDelegate(CenterAlignDelegate())
         gear_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        gear_table.setSortingEnabled(True)
 
-        def add_gear_to_table(gears):
-            self.gear_model.layoutAboutToBeChanged.emit()
-            self.gear_model.setGears(gears)
-            self.gear_model.layoutChanged.emit()
+        def update_gear_table():
+            self.gear_model.sync(self.optimizer.inventory)
 
-        self.gear_added_signal.connect(add_gear_to_table)
+        self.inventory_changed_signal.connect(update_gear_table)
 
         # Gear filter
         widget_gear_filter = QWidget()
@@ -555,14 +1127,42 @@ class GUI(QWidget):
 
             gear_stat = QComboBox()
             gear_stat.addItems([''] + [stat.name for stat in GearStat])
-            gear_stat.currentIndexChanged.connect(lambda: gear_filter.set_substats(i, gear_stat.currentIndex()))
+            gear_stat.currentIndexChanged.connect(lambda index, num=i: gear_filter.set_substats(num, index))
 
             layout_gear_filter.addRow(label, gear_stat)
+
+        # Minimum stat value
+        label_stat_min = QLabel('Stat >=:')
+        label_stat_min.setFont(QFont('Courier'))
+        combo_stat_min = QComboBox()
+        # Attack, Health and Defense come flat or in %, other stats only one way, stored as flat
+        both_kinds = [GearStat.Attack.value, GearStat.Health.value, GearStat.Defense.value]
+        stat_min_keys = [(stat, False) for stat in both_kinds] + [(stat.value, True) for stat in GearStat]
+        combo_stat_min.addItems([''] + ['{}{}'.format(GearStat(stat).name, ' flat' if is_flat else ' %')
+                                        if stat in both_kinds else GearStat(stat).name
+                                        for stat, is_flat in stat_min_keys])
+        spin_stat_min = QSpinBox()
+        spin_stat_min.setRange(0, 100000)
+
+        def update_stat_min():
+            if combo_stat_min.currentIndex() == 0:
+                gear_filter.set_stat_ranges({})
+            else:
+                gear_filter.set_stat_ranges({stat_min_keys[combo_stat_min.currentIndex() - 1]:
+                                             (spin_stat_min.value(), None)})
+
+        combo_stat_min.currentIndexChanged.connect(update_stat_min)
+        spin_stat_min.valueChanged.connect(update_stat_min)
+
+        layout_stat_min = QHBoxLayout()
+        layout_stat_min.addWidget(combo_stat_min)
+        layout_stat_min.addWidget(spin_stat_min)
+        layout_gear_filter.addRow(label_stat_min, layout_stat_min)
         widget_gear_filter.setLayout(layout_gear_filter)
         widget_gear_filter.setSizePolicy(QSizePolicy.Minimum, QSizePolicy.Minimum)
 
         # Putting all together
-        qlayer_import = QLayer('Import', btn_import_images)
+        qlayer_import = QLayer('Import', widget_import)
         qlayer_gear_filter = QLayer('Filter', widget_gear_filter)
         qlayer_gears = QLayer('Equipment', gear_table)
 
@@ -580,7 +1180,10 @@ class GUI(QWidget):
         self.tab_gears.setLayout(layout_tab)
 
     def closeEvent(self, event):
-        self.optimizer.save()
+        self.import_cancel.set()
+        if self.folder_watcher is not None:
+            self.folder_watcher.stop(wait=True)
+        self.optimizer.close()
 
     def update_hero_stats(self, final_stats):
         hero_stats = self.tab_optimizer.findChild(QLabel, 'hero_stats')
@@ -633,7 +1236,7 @@ class GUI(QWidget):
             # Calculate hero's final stats
             stats = {}
             for stat, multipliers in total_stats.items():
-                stats[stat] = int(self.optimizer.hero_base_stat[stat] * (1 + multipliers[0] / 100) + multipliers[1])
+                stats[stat] = Loadout.final_stat(self.optimizer.hero_base_stat[stat], *multipliers)
 
             for i, gear in enumerate(loadout):
                 gear_type_ui_text = self.tab_optimizer.findChild(QLabel, GearType(i).name)
@@ -652,18 +1255,21 @@ class GUI(QWidget):
         return self.tab_optimizer.findChild(QLineEdit, 'hero_name').text()
 
     def save_loadout(self):
-        results_table = self.tab_optimizer.findChild(QTableWidget, 'results_table')
+        results_table = self.tab_optimizer.findChild(QTableView, 'results_table')
         rows_selected = set(index.row() for index in results_table.selectedIndexes())
         if len(rows_selected) == 1:
-            loadout = self.optimizer.optimizer_output[rows_selected.pop()][1]
+            loadout = self.result_model.result(rows_selected.pop())[1]
             save_loadout = []
             for gear in loadout:
                 self.optimizer.set_gear_usage(gear.id, True)
                 save_loadout.append(gear.id)
 
             self.optimizer.hero_loadouts[self.get_hero_name().strip()] = save_loadout
-            self.optimizer.save()
+            self.optimizer.mark_dirty(loadouts=True)
+            self.inventory_changed_signal.emit()
             print('Saved loadout for', self.get_hero_name())
+        else:
+            print('Select a loadout in the results to save it')
 
     def delete_loadout(self):
         gear_loadout = self.optimizer.hero_loadouts.pop(self.get_hero_name().strip(), None)
@@ -673,13 +1279,54 @@ class GUI(QWidget):
         for gear_id in gear_loadout:
             self.optimizer.set_gear_usage(gear_id, False)
 
-        self.optimizer.save()
+        self.optimizer.mark_dirty(loadouts=True)
+        self.inventory_changed_signal.emit()
         print('Deleted loadout for', self.get_hero_name())
 
     def import_gear(self, image_paths):
-        self.optimizer.import_gear(image_paths)
-        self.gear_added_signal.emit(self.optimizer.gears)
+        """
+        Imports gear images on a background thread, the gear table grows as each image is read
+        """
+        self.import_cancel.clear()
+        thread = Thread(target=self._import_gear_job, args=(image_paths,))
+        thread.daemon = True
+        thread.start()
+
+    def _import_gear_job(self, image_paths):
+        done = 0
+        failed = 0
+        changed = False
+        last_update = 0
+        try:
+            for path, gear, error in self.optimizer.import_gear_iter(image_paths, self.import_cancel):
+                done += 1
+                if gear is None:
+                    failed += 1
+                else:
+                    changed = True
+                # Added gears may come with a note, e.g. identical to a gear imported before
+                if error is not None:
+                    self.import_error_signal.emit(path, error)
+
+                # Exports yield thousands of gears per second, the GUI is updated at most every IMPORT_UPDATE_INTERVAL
+                if time.monotonic() - last_update >= IMPORT_UPDATE_INTERVAL:
+                    last_update = time.monotonic()
+                    if changed:
+                        changed = False
+                        self.inventory_changed_signal.emit()
+                    # Videos and exports yield one result per gear, their count isn't known in advance
+                    self.import_progress_signal.emit(done, failed, max(done, len(image_paths)))
+        finally:
+            if changed:
+                self.inventory_changed_signal.emit()
+            self.import_progress_signal.emit(done, failed, max(done, len(image_paths)))
+            self.import_done_signal.emit()
 
     def optimize(self, priorities, required_sets, min_max_constraints):
         self.optimizer.optimize(priorities, required_sets, min_max_constraints)
         self.optimizer_done_signal.emit()
+
+    def sweep(self, priorities, required_sets, min_max_constraints, stat, thresholds):
+        curve = self.optimizer.sweep_constraint(priorities, required_sets, min_max_constraints, stat, thresholds,
+                                                max_results=10)
+        self.sweep_done_signal.emit(stat, curve)
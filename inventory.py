@@ -0,0 +1,419 @@
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import islice
+from threading import RLock
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from gear import *
+
+# Number of changes kept for consumers to catch up with, older consumers have to rebuild
+CHANGE_LOG_SIZE = 100000
+# Kinds of changes, the change feed stores each change as gear id * len(CHANGE_KINDS) + kind index
+CHANGE_KINDS = ('added', 'removed', 'updated')
+# FNV-1a offset basis and prime of the fingerprint hashes
+FINGERPRINT_HASH_OFFSET = np.uint64(14695981039346656037)
+FINGERPRINT_HASH_PRIME = np.uint64(1099511628211)
+# Criteria of Inventory.query() with an index each
+INDEXED_FIELDS = ('type', 'set', 'main_stat', 'in_use')
+
+
+def _read(column: array, indexes=None) -> np.ndarray:
+    """
+    Copies values out of a store column. Numpy views over the column itself would keep it from growing.
+
+    :param column: store column
+    :param indexes: numpy index of the values, None for all of them
+    :return: numpy array of the values
+    """
+    view = np.frombuffer(column, dtype=column.typecode)
+    return np.array(view if indexes is None else view[indexes])
+
+
+def _gear_fields(gear: Gear) -> List[int]:
+    """
+    Returns the fields of gear_fingerprint() laid out as in the store: type, set, then type, flat and value of
+    SNAPSHOT_STATS stats
+    """
+    stats = [gear.main_stat] + list(gear.substats)
+    fields = [gear.type, gear.set]
+    for i in range(SNAPSHOT_STATS):
+        if i < len(stats):
+            fields += [stats[i].type, bool(stats[i].is_flat), stats[i].value]
+        else:
+            fields += [SNAPSHOT_NO_STAT, 0, 0]
+    return fields
+
+
+def _fingerprint_hashes(fields: np.ndarray) -> np.ndarray:
+    """
+    Hashes the fingerprint fields of many gears at once
+
+    :param fields: (gears, fields) array, see _gear_fields()
+    :return: uint64 hash of each gear
+    """
+    hashes = np.full(len(fields), FINGERPRINT_HASH_OFFSET, dtype=np.uint64)
+    for values in fields.T.astype(np.uint64):
+        hashes ^= values
+        hashes *= FINGERPRINT_HASH_PRIME
+    return hashes
+
+
+@dataclass
+class InventoryChanges:
+    """
+    Gear ids added, removed and updated between two inventory versions.
+    A gear appears in at most one list, e.g. a gear added then updated is only reported as added.
+    """
+    version: int
+    added: List[int] = field(default_factory=list)
+    removed: List[int] = field(default_factory=list)
+    updated: List[int] = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.updated)
+
+
+class Inventory:
+    """
+    Gear inventory indexed by id, queried by gear type, set, main stat and usage.
+
+    Gears are kept in a columnar GearStore and handed out as GearView objects. Every gear type, set, main stat and
+    usage has a bitmap over the store rows, kept up to date as gears are added, removed or change usage, so queries
+    intersect bitmaps instead of scanning columns and return gears in id order. Duplicates are found through a column
+    of fingerprint hashes, filled lazily for the rows added since the last lookup.
+
+    Each change bumps a monotonically increasing version and is recorded in a change feed, so consumers can remember
+    the version they last saw and catch up with changes_since() instead of rebuilding.
+
+    Inventory is thread safe, e.g. a background import can add gears while the GUI reads it.
+    """
+
+    def __init__(self, gears: Iterable[Gear] = ()):
+        self.__lock = RLock()
+        # Views read the store under the inventory's lock
+        self.__store = GearStore(lock=self.__lock)
+        # Fingerprint hash of each row, valid below __hashed except for the reused rows in __stale
+        self.__hashes = np.zeros(0, dtype=np.uint64)
+        self.__hashed = 0
+        self.__stale = []
+        # Field -> value -> bitmap of the rows of the gears with that value, little endian bits packed into uint8
+        self.__indexes = {name: {} for name in INDEXED_FIELDS}
+        self.__index_size = 0
+        self.__next_id = 0
+
+        self.__version = 0
+        self.__changes = deque(maxlen=CHANGE_LOG_SIZE)
+
+        self.add_many(gears)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_Inventory__lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__ = state
+        self.__lock = RLock()
+        self.__store.lock = self.__lock
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, array]) -> 'Inventory':
+        """
+        Builds an inventory straight from gear columns, without decoding gears
+
+        :param columns: dict of column name -> array, e.g. GearSnapshot.columns()
+        :return: Inventory
+        """
+        inventory = cls()
+        inventory.__store = GearStore(columns, inventory.__lock)
+        if len(columns['id']):
+            inventory.__next_id = int(_read(columns['id']).max()) + 1
+            inventory.__build_indexes()
+        # Not a change per gear: consumers of version 0 find the change feed empty and rebuild
+        inventory.__version = 1
+        return inventory
+
+    def __len__(self):
+        return len(self.__store)
+
+    def __iter__(self):
+        with self.__lock:
+            return iter(self.__views(self.__store))
+
+    def __views(self, gear_ids) -> List[GearView]:
+        return [GearView(self.__store, gear_id) for gear_id in gear_ids]
+
+    @property
+    def columns(self) -> Dict[str, array]:
+        """
+        Copies of the gear arrays of the underlying GearStore, consistent with each other, for going through many gears
+        without views. Rows of removed gears have an id of -1.
+        """
+        with self.__lock:
+            return {name: column[:] for name, column in self.__store.columns.items()}
+
+    def snapshot(self) -> bytes:
+        """
+        Encodes the inventory into the snapshot format
+
+        :return: snapshot bytes
+        """
+        with self.__lock:
+            return self.__store.snapshot()
+
+    def materialized_gears(self, gear_ids: Iterable[int] = None):
+        """
+        Copies gears out of the store, for code keeping them while other threads may remove them
+
+        :param gear_ids: IDs of the gears, those no longer in the inventory are skipped, None for all the gears
+        :return: (version the gears are up to date with, list of Gear)
+        """
+        with self.__lock:
+            if gear_ids is None:
+                gear_ids = self.__store
+            return self.__version, [self.__store.gear(gear_id) for gear_id in gear_ids if gear_id in self.__store]
+
+    def __contains__(self, gear_id: int):
+        return gear_id in self.__store
+
+    @property
+    def next_id(self) -> int:
+        return self.__next_id
+
+    @property
+    def version(self) -> int:
+        return self.__version
+
+    def __record(self, kind: str, gear_id: int):
+        self.__version += 1
+        self.__changes.append(gear_id * len(CHANGE_KINDS) + CHANGE_KINDS.index(kind))
+
+    def changes_since(self, version: int) -> Optional[InventoryChanges]:
+        """
+        Returns the changes made after the given version
+
+        :param version: version the consumer last saw
+        :return: InventoryChanges up to the current version, or None if the change feed no longer goes back that far
+        """
+        with self.__lock:
+            if version == self.__version:
+                return InventoryChanges(version)
+            # Versions are consecutive, the last change is the current version
+            first_version = self.__version - len(self.__changes) + 1
+            if version > self.__version or not self.__changes or first_version > version + 1:
+                return None
+
+            # Collapse multiple changes of the same gear
+            changes = {}
+            for change in islice(reversed(self.__changes), self.__version - version):
+                gear_id, kind = divmod(change, len(CHANGE_KINDS))
+                kind = CHANGE_KINDS[kind]
+                first_kind = kind
+                last_kind = changes.get(gear_id, (None, kind))[1]
+                changes[gear_id] = (first_kind, last_kind)
+
+            output = InventoryChanges(self.__version)
+            for gear_id, (first_kind, last_kind) in reversed(changes.items()):
+                if first_kind == 'added':
+                    if last_kind != 'removed':
+                        output.added.append(gear_id)
+                elif last_kind == 'removed':
+                    output.removed.append(gear_id)
+                else:
+                    output.updated.append(gear_id)
+
+            return output
+
+    def __index_values(self, row: int) -> Dict[str, int]:
+        columns = self.__store.columns
+        return {'type': columns['type'][row], 'set': columns['set'][row],
+                'main_stat': columns['stat_type'][row * SNAPSHOT_STATS], 'in_use': bool(columns['in_use'][row])}
+
+    def __bitmap(self, name: str, value) -> np.ndarray:
+        bitmap = self.__indexes[name].get(value)
+        if bitmap is None:
+            bitmap = self.__indexes[name][value] = np.zeros(self.__index_size, dtype=np.uint8)
+        return bitmap
+
+    def __index(self, row: int, name: str, value, present: bool):
+        """
+        Sets or clears the bit of a row in the bitmap of a field value
+        """
+        if row >= 8 * self.__index_size:
+            # Grow every bitmap at once so they all cover the same rows
+            self.__index_size = max(row // 8 + 1, 2 * self.__index_size)
+            for bitmaps in self.__indexes.values():
+                for key, bitmap in bitmaps.items():
+                    bitmaps[key] = np.concatenate([bitmap, np.zeros(self.__index_size - len(bitmap), np.uint8)])
+        bitmap = self.__bitmap(name, value)
+        if present:
+            bitmap[row >> 3] |= 1 << (row & 7)
+        else:
+            bitmap[row >> 3] &= ~(1 << (row & 7)) & 0xff
+
+    def __build_indexes(self):
+        """
+        Builds the bitmaps of all the rows of the store at once
+        """
+        columns = self.__store.columns
+        live = _read(columns['id']) >= 0
+        values = {'type': _read(columns['type']), 'set': _read(columns['set']),
+                  'main_stat': _read(columns['stat_type'], slice(None, None, SNAPSHOT_STATS)),
+                  'in_use': _read(columns['in_use']) != 0}
+        self.__index_size = (len(live) + 7) // 8
+        for name, column in values.items():
+            self.__indexes[name] = {value.item(): np.packbits(live & (column == value), bitorder='little')
+                                    for value in np.unique(column[live])}
+
+    def __update_hashes(self):
+        """
+        Hashes the fingerprints of the rows added since the last call
+        """
+        rows = len(self.__store.columns['id'])
+        if self.__hashed == rows and not self.__stale:
+            return
+        if len(self.__hashes) < rows:
+            hashes = np.zeros(max(rows, 2 * len(self.__hashes)), dtype=np.uint64)
+            hashes[:self.__hashed] = self.__hashes[:self.__hashed]
+            self.__hashes = hashes
+
+        pending = np.concatenate([np.array(self.__stale, dtype=np.intp), np.arange(self.__hashed, rows)])
+        columns = self.__store.columns
+        stats = pending[:, None] * SNAPSHOT_STATS + np.arange(SNAPSHOT_STATS)
+        fields = np.empty((len(pending), 2 + 3 * SNAPSHOT_STATS), dtype=np.uint64)
+        fields[:, 0] = _read(columns['type'], pending)
+        fields[:, 1] = _read(columns['set'], pending)
+        fields[:, 2::3] = _read(columns['stat_type'], stats)
+        fields[:, 3::3] = _read(columns['stat_flat'], stats)
+        fields[:, 4::3] = _read(columns['stat_value'], stats)
+        self.__hashes[pending] = _fingerprint_hashes(fields)
+        self.__hashed = rows
+        self.__stale = []
+
+    def add(self, gear: Gear) -> GearView:
+        """
+        Adds a gear to the inventory, assigning it the next id if it doesn't have one. The gear is copied into the
+        store, later changes to it don't affect the inventory.
+
+        :param gear: Gear to add, id < 0 means unassigned
+        :return: view of the added gear
+        """
+        with self.__lock:
+            if gear.id < 0:
+                gear.id = self.__next_id
+
+            row = self.__store.add(gear)
+            for name, value in self.__index_values(row).items():
+                self.__index(row, name, value, True)
+            if row < self.__hashed:
+                self.__stale.append(row)
+            self.__next_id = max(self.__next_id, gear.id + 1)
+            self.__record('added', gear.id)
+
+            return GearView(self.__store, gear.id)
+
+    def add_many(self, gears: Iterable[Gear]) -> List[GearView]:
+        """
+        Adds gears to the inventory
+
+        :param gears: Gears to add, the ones without an id get consecutive ids
+        :return: views of the added gears
+        """
+        with self.__lock:
+            return [self.add(gear) for gear in gears]
+
+    def get(self, gear_id: int) -> GearView:
+        """
+        Returns the gear given gear ID
+
+        :param gear_id: ID of the gear
+        :return: view of the gear with the given ID
+        """
+        with self.__lock:
+            if gear_id not in self.__store:
+                raise IndexError('Gear ID not found in inventory...')
+            return GearView(self.__store, gear_id)
+
+    def remove(self, gear_id: int) -> Gear:
+        """
+        Removes a gear from the inventory
+
+        :param gear_id: ID of the gear
+        :return: the removed gear
+        """
+        with self.__lock:
+            gear = self.__store.gear(gear_id)
+            row = self.__store.row(gear_id)
+            for name, value in self.__index_values(row).items():
+                self.__index(row, name, value, False)
+            self.__store.remove(gear_id)
+            self.__record('removed', gear_id)
+
+            return gear
+
+    def set_usage(self, gear_id: int, in_use: bool) -> GearView:
+        """
+        Sets the gear usage to either being in use or not
+
+        :param gear_id: ID of the gear
+        :param in_use: whether it's in use or not
+        :return: view of the updated gear
+        """
+        with self.__lock:
+            gear = self.get(gear_id)
+            if gear.in_use == bool(in_use):
+                return gear
+
+            row = self.__store.row(gear_id)
+            self.__index(row, 'in_use', not in_use, False)
+            self.__store.set_in_use(gear_id, in_use)
+            self.__index(row, 'in_use', bool(in_use), True)
+            self.__record('updated', gear_id)
+
+            return gear
+
+    def query(self, gear_type: int = None, gear_set: int = None, main_stat: int = None,
+              in_use: bool = None) -> List[GearView]:
+        """
+        Returns the gears matching every given criteria, None means any
+
+        :param gear_type: GearType value
+        :param gear_set: GearSet value
+        :param main_stat: GearStat value of the main stat
+        :param in_use: whether the gear is in use
+        :return: list of views of the matching gears, in id order
+        """
+        with self.__lock:
+            criteria = {'type': gear_type, 'set': gear_set, 'main_stat': main_stat,
+                        'in_use': None if in_use is None else bool(in_use)}
+            bitmaps = [self.__indexes[name].get(value) for name, value in criteria.items() if value is not None]
+            if not bitmaps:
+                return self.__views(sorted(self.__store))
+            if any(bitmap is None for bitmap in bitmaps):
+                return []
+
+            selected = bitmaps[0]
+            for bitmap in bitmaps[1:]:
+                selected = selected & bitmap
+            rows = np.flatnonzero(np.unpackbits(selected, bitorder='little'))
+            return self.__views(np.sort(_read(self.__store.columns['id'], rows)).tolist())
+
+    def find_duplicates(self, gear: Gear) -> List[GearView]:
+        """
+        Returns the gears in the inventory with the same type, set, main stat and substats as the given gear
+
+        :param gear: Gear to look for, doesn't have to be in the inventory
+        :return: list of views of the matching gears in id order, excluding the given gear itself
+        """
+        with self.__lock:
+            self.__update_hashes()
+            target = _fingerprint_hashes(np.array([_gear_fields(gear)], dtype=np.uint64))[0]
+            ids = self.__store.columns['id']
+            # Rows of removed gears and hash collisions are filtered out by comparing fingerprints
+            candidates = [ids[row] for row in np.flatnonzero(self.__hashes[:self.__hashed] == target).tolist()]
+            fingerprint = gear_fingerprint(gear)
+            return self.__views(sorted(gear_id for gear_id in candidates if gear_id >= 0 and gear_id != gear.id
+                                       and self.__store.fingerprint(gear_id) == fingerprint))
@@ -0,0 +1,969 @@
+import io
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from threading import Lock
+from typing import Iterator, List, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+from PIL import Image
+from tesserocr import PyTessBaseAPI, PSM, OEM, RIL, iterate_level
+
+from gear import *
+from writer import atomic_write
+
+# Minimum template matching score for an anchor to be trusted
+MIN_MATCH_SCORE = 0.6
+# Pixels around the previous screenshot's anchor searched before falling back to a full search
+ANCHOR_PRIOR_MARGIN = 8
+# Pixels around the downscaled search's match refined at full resolution
+ANCHOR_REFINE_MARGIN = 4
+
+# Binarization thresholds of the first read of a field and of its retry
+OCR_THRESHOLD = 50
+OCR_RETRY_THRESHOLD = 90
+# Tesseract confidence, from 0 to 100, under which a field is read again
+MIN_OCR_CONFIDENCE = 75
+
+# Learned glyphs of the gear panel font
+GLYPHS_FILE = 'glyphs.npz'
+# Side of the square glyphs are normalized to before being compared
+GLYPH_SIZE = 16
+# Weight of a glyph's width and vertical position relative to its shape, tells apart e.g. '.' from '-'
+GLYPH_GEOMETRY_WEIGHT = 4
+# Maximum mean squared distance to the nearest known sample for a glyph to be trusted
+MAX_GLYPH_DISTANCE = 0.05
+# Samples kept per character
+MAX_GLYPH_SAMPLES = 20
+# Samples a character needs before glyph reads using it are trusted without Tesseract agreeing
+MIN_TRUSTED_GLYPH_SAMPLES = 5
+# Newly learned samples after which the glyphs file is updated
+GLYPH_SAVE_INTERVAL = 50
+# Empty columns between two glyphs, relative to the line height, making a space
+GLYPH_SPACE_RATIO = 0.3
+
+# Video frames decoded for every frame compared, the others are skipped
+VIDEO_FRAME_STEP = 2
+# Size of the gear panel thumbnails compared between video frames
+VIDEO_THUMBNAIL_SIZE = (32, 44)
+# Mean thumbnail difference under which two frames show the same panel
+VIDEO_STABLE_DIFFERENCE = 4
+# Compared frames the panel must stay the same for before being read
+VIDEO_STABLE_FRAMES = 2
+# Stable frames of the same panel read before giving up on it, e.g. when a read fails on a blurred frame
+VIDEO_READ_ATTEMPTS = 3
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.webm')
+# Start of the error of an image whose OCR worker crashed, the crash isn't the image's fault
+WORKER_CRASH_ERROR = 'BrokenProcessPool'
+# Times an image is read again on new worker processes after crashing one before it fails
+WORKER_CRASH_RETRIES = 1
+
+# Fields read from a gear panel, each is a single text line
+GEAR_FIELDS = ['type', 'set', 'main_stat', 'substat0', 'substat1', 'substat2', 'substat3']
+
+
+class PanelNotFound(ValueError):
+    """
+    Raised when an image doesn't show a gear panel, e.g. a video frame of a menu transition
+    """
+
+
+class GlyphRecognizer:
+    """
+    Nearest neighbour recognizer for the fixed font of the gear panel.
+
+    A text line is binarized and cut into glyphs along empty pixel columns, every glyph is normalized to a small
+    square and compared against known samples. Samples are learned from lines Tesseract read confidently and whose
+    text is exactly what they parse to, so no manual labeling is needed. A line with any glyph too far from every
+    known sample isn't recognized and the caller falls back to Tesseract.
+
+    The recognizer is thread safe, so a single one can be shared by every import of a process.
+    """
+
+    def __init__(self, path: str = None, read_only: bool = False):
+        """
+        :param path: glyphs file samples are loaded from and saved to, None keeps them in memory
+        :param read_only: only recognize with the loaded samples, learn() does nothing
+        """
+        self.path = path
+        self.read_only = read_only
+        self.__labels = []
+        self.__samples = []
+        self.__counts = {}
+        self.__matrix = None
+        self.__norms = None
+        self.__unsaved = 0
+        self.__lock = Lock()
+
+        if path is not None and os.path.exists(path):
+            data = np.load(path)
+            for label, sample in zip(data['labels'], data['samples']):
+                self.__add(str(label), sample)
+
+    def __len__(self):
+        return len(self.__labels)
+
+    def samples(self, label: str) -> int:
+        """
+        :param label: character
+        :return: number of known samples of the character
+        """
+        return self.__counts.get(label, 0)
+
+    def __add(self, label: str, sample) -> bool:
+        if self.__counts.get(label, 0) >= MAX_GLYPH_SAMPLES:
+            return False
+        self.__labels.append(label)
+        self.__samples.append(sample)
+        self.__counts[label] = self.__counts.get(label, 0) + 1
+        self.__matrix = None
+        return True
+
+    @staticmethod
+    def _segment(image) -> Tuple[np.ndarray, List[bool]]:
+        """
+        Cuts a text line into glyphs
+
+        :param image: grayscale image of a single line, light text on a dark background
+        :return: (matrix of glyph features, one row per glyph from left to right,
+                  for each glyph whether a space precedes it)
+        """
+        ink = image > OCR_THRESHOLD
+        rows = np.flatnonzero(ink.any(axis=1))
+        columns = ink.any(axis=0)
+        if len(rows) == 0:
+            return np.zeros((0, GLYPH_SIZE * GLYPH_SIZE + 3), dtype=np.float32), []
+
+        line_top = rows[0]
+        line_height = rows[-1] - rows[0] + 1
+
+        # Runs of columns with ink
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], columns.astype(np.int8), [0]))))
+        features = []
+        spaces = []
+        previous_end = None
+        for start, end in zip(edges[::2], edges[1::2]):
+            glyph = ink[:, start:end]
+            glyph_rows = np.flatnonzero(glyph.any(axis=1))
+            top, bottom = glyph_rows[0], glyph_rows[-1] + 1
+
+            shape = cv.resize(glyph[top:bottom].astype(np.float32), (GLYPH_SIZE, GLYPH_SIZE),
+                              interpolation=cv.INTER_AREA)
+            geometry = np.array([(end - start) / line_height, (top - line_top) / line_height,
+                                 (bottom - line_top) / line_height], dtype=np.float32)
+            features.append(np.concatenate((shape.ravel(), geometry * GLYPH_GEOMETRY_WEIGHT)))
+
+            spaces.append(previous_end is not None and start - previous_end > line_height * GLYPH_SPACE_RATIO)
+            previous_end = end
+
+        return np.array(features, dtype=np.float32), spaces
+
+    def recognize(self, image) -> Optional[str]:
+        """
+        Recognizes a text line
+
+        :param image: grayscale image of a single line, light text on a dark background
+        :return: line text, or None if a glyph isn't close enough to any known sample
+        """
+        if not self.__labels:
+            return None
+        features, spaces = self._segment(image)
+        if len(features) == 0:
+            return None
+
+        with self.__lock:
+            if self.__matrix is None:
+                self.__matrix = np.array(self.__samples, dtype=np.float32)
+                self.__norms = (self.__matrix ** 2).sum(axis=1)
+            matrix, norms, labels = self.__matrix, self.__norms, self.__labels
+
+        # Squared distances between every glyph and every sample at once
+        distances = (features ** 2).sum(axis=1)[:, None] + norms[None, :] - 2 * features @ matrix.T
+        nearest = distances.argmin(axis=1)
+        if distances[np.arange(len(features)), nearest].max() / features.shape[1] > MAX_GLYPH_DISTANCE:
+            return None
+
+        return ''.join((' ' if space else '') + labels[i] for i, space in zip(nearest, spaces))
+
+    def learn(self, image, text: str) -> bool:
+        """
+        Learns the glyphs of a line whose text is known. Lines whose glyph count doesn't match the text (e.g. touching
+        characters) are ignored.
+
+        :param image: grayscale image of a single line, light text on a dark background
+        :param text: text of the line
+        :return: whether the line was learned from
+        """
+        if self.read_only:
+            return False
+        labels = [char for char in text if not char.isspace()]
+        features, _ = self._segment(image)
+        if not labels or len(labels) != len(features):
+            return False
+
+        with self.__lock:
+            for label, sample in zip(labels, features):
+                self.__unsaved += self.__add(label, sample)
+            if self.path is not None and self.__unsaved >= GLYPH_SAVE_INTERVAL:
+                self.__save()
+        return True
+
+    def save(self):
+        """
+        Writes the known samples to the glyphs file
+
+        :return: None
+        """
+        with self.__lock:
+            self.__save()
+
+    def __save(self):
+        if self.path is None or not self.__unsaved:
+            return
+        output = io.BytesIO()
+        np.savez(output, labels=np.array(self.__labels), samples=np.array(self.__samples, dtype=np.float32))
+        atomic_write(self.path, output.getvalue())
+        self.__unsaved = 0
+
+
+def panel_image(image):
+    """
+    Crops the gear panel side of a screenshot
+
+    :param image: 1280x720 grayscale screenshot in numpy array format
+    :return: cropped image
+    """
+    return image[60:image.shape[0], 395:880]
+
+
+def panel_thumbnail(image):
+    """
+    Small blurred thumbnail of the gear panel, cheap to compare between video frames
+
+    :param image: 1280x720 grayscale screenshot in numpy array format
+    :return: thumbnail in numpy array format
+    """
+    return cv.resize(panel_image(image), VIDEO_THUMBNAIL_SIZE, interpolation=cv.INTER_AREA)
+
+
+def thumbnail_difference(a, b) -> float:
+    """
+    :return: mean absolute pixel difference between two thumbnails, from 0 to 255
+    """
+    return float(cv.absdiff(a, b).mean())
+
+
+def video_frame_png(path: str, frame_number: int) -> Optional[bytes]:
+    """
+    Decodes a single frame of a video, e.g. to keep a frame that couldn't be read
+
+    :param path: video path
+    :param frame_number: frame number, as in the labels of GearReader.read_video()
+    :return: frame encoded as PNG, None if it can't be decoded
+    """
+    capture = cv.VideoCapture(path)
+    try:
+        capture.set(cv.CAP_PROP_POS_FRAMES, frame_number)
+        ok, frame = capture.read()
+        if not ok:
+            return None
+        ok, content = cv.imencode('.png', frame)
+        return content.tobytes() if ok else None
+    finally:
+        capture.release()
+
+
+class GearReader:
+    """
+    Reads gears from 1280x720 screenshots of the in-game gear panel.
+
+    Each reader owns its Tesseract engine and matching templates, so every OCR worker process initializes its own
+    once instead of sharing a module level engine.
+
+    Fields are first read with the glyph recognizer, Tesseract only reads the fields it couldn't recognize or whose
+    text didn't parse, and teaches the recognizer the lines it reads confidently and exactly. Until every character of
+    a glyph read has MIN_TRUSTED_GLYPH_SAMPLES samples, Tesseract reads the field too and wins if they disagree.
+    """
+
+    def __init__(self, glyphs_path: str = GLYPHS_FILE, glyphs: GlyphRecognizer = None, learn: bool = True):
+        """
+        :param glyphs_path: glyphs file, None reads with Tesseract only unless glyphs is given
+        :param glyphs: recognizer shared with other readers, instead of loading glyphs_path
+        :param learn: learn from the lines read, otherwise they are kept in learned for the caller to learn from,
+                      e.g. OCR worker processes send them to the process owning the glyphs file
+        """
+        self.__tesseract = PyTessBaseAPI(path='resources/tessdata', psm=PSM.SINGLE_LINE, oem=OEM.LSTM_ONLY, )
+
+        self.__triangle = cv.imread('resources/ocr/triangle.jpg', 0)
+        self.__top_bar = cv.imread('resources/ocr/top.jpg', 0)
+
+        # Templates at full and half resolution, and where each was found in the last screenshot
+        self.__templates = {
+            'triangle': (self.__triangle, cv.pyrDown(self.__triangle)),
+            'top_bar': (self.__top_bar, cv.pyrDown(self.__top_bar)),
+        }
+        self.__anchors = {}
+
+        self.glyphs = glyphs if glyphs is not None else GlyphRecognizer(glyphs_path)
+        self.learn = learn
+        # (image, text) of the lines worth learning from, while learn is off
+        self.learned = []
+
+        # Seconds spent in each reading stage and number of fields read by each recognizer, for benchmarking
+        self.timings = defaultdict(float)
+        self.field_sources = Counter()
+
+    def close(self):
+        self.glyphs.save()
+        self.__tesseract.End()
+
+    @contextmanager
+    def _timed(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] += time.perf_counter() - start
+
+    @staticmethod
+    def _match(image, template, x0=0, y0=0, x1=None, y1=None) -> Tuple[float, Tuple[int, int]]:
+        """
+        Finds the best match of a template within a region of an image
+
+        :param image: image in numpy array format
+        :param template: template in numpy array format
+        :param x0, y0, x1, y1: region of possible template top left corners, defaults to the whole image
+        :return: (matching score, top left corner of the match in image coordinates)
+        """
+        h, w = template.shape
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1 = image.shape[1] - w if x1 is None else min(x1, image.shape[1] - w)
+        y1 = image.shape[0] - h if y1 is None else min(y1, image.shape[0] - h)
+        if x1 < x0 or y1 < y0:
+            return -1, (x0, y0)
+
+        result = cv.matchTemplate(image[y0:y1 + h, x0:x1 + w], template, cv.TM_CCOEFF_NORMED)
+        _, score, _, loc = cv.minMaxLoc(result)
+        return score, (loc[0] + x0, loc[1] + y0)
+
+    def _locate(self, image, name: str) -> Tuple[int, int]:
+        """
+        Locates an anchor template in a screenshot. Screenshots of a batch share the same layout, so the last anchor
+        position is tried first, its match only counts if it peaks inside the window. Otherwise the template is searched
+        at half resolution and refined around the match at full resolution.
+
+        :param image: cropped screenshot in numpy array format
+        :param name: template name, 'triangle' or 'top_bar'
+        :return: top left corner of the anchor
+        :raise PanelNotFound: the template doesn't match anywhere
+        """
+        template, small_template = self.__templates[name]
+
+        prior = self.__anchors.get(name)
+        if prior is not None:
+            score, loc = self._match(image, template, prior[0] - ANCHOR_PRIOR_MARGIN, prior[1] - ANCHOR_PRIOR_MARGIN,
+                                     prior[0] + ANCHOR_PRIOR_MARGIN, prior[1] + ANCHOR_PRIOR_MARGIN)
+            # A peak on the window border may be the slope of a better match outside of it
+            on_border = max(abs(loc[0] - prior[0]), abs(loc[1] - prior[1])) >= ANCHOR_PRIOR_MARGIN
+            if score >= MIN_MATCH_SCORE and not on_border:
+                self.__anchors[name] = loc
+                return loc
+
+        _, coarse_loc = self._match(cv.pyrDown(image), small_template)
+        score, loc = self._match(image, template,
+                                 coarse_loc[0] * 2 - ANCHOR_REFINE_MARGIN, coarse_loc[1] * 2 - ANCHOR_REFINE_MARGIN,
+                                 coarse_loc[0] * 2 + ANCHOR_REFINE_MARGIN, coarse_loc[1] * 2 + ANCHOR_REFINE_MARGIN)
+        if score < MIN_MATCH_SCORE:
+            # Small features can get lost when downscaling, last resort is a full resolution search
+            score, loc = self._match(image, template)
+        if score < MIN_MATCH_SCORE:
+            raise PanelNotFound('Gear panel not found, {} matching score {:.2f}'.format(name, score))
+
+        self.__anchors[name] = loc
+        return loc
+
+    @staticmethod
+    def _preprocess(image, threshold: int = OCR_THRESHOLD):
+        """
+        Upscales and binarizes an image region into dark text on a white background for OCR
+
+        :param image: image in numpy array format
+        :param threshold: pixels brighter than the threshold are text
+        :return: processed image
+        """
+        return cv.threshold(cv.resize(image, None, fx=5, fy=5), threshold, 255, cv.THRESH_BINARY_INV)[1]
+
+    def _ocr(self, image, threshold: int = OCR_THRESHOLD, psm=PSM.SINGLE_LINE) -> Tuple[str, int]:
+        """
+        Performs OCR on image and returns output.
+
+        :param image: image in numpy array format
+        :param threshold: binarization threshold
+        :param psm: Tesseract page segmentation mode
+        :return: (OCR string, mean confidence from 0 to 100)
+        """
+        self.__tesseract.SetPageSegMode(psm)
+        try:
+            self.__tesseract.SetImage(Image.fromarray(self._preprocess(image, threshold)))
+            return self.__tesseract.GetUTF8Text().strip(), self.__tesseract.MeanTextConf()
+        finally:
+            self.__tesseract.SetPageSegMode(PSM.SINGLE_LINE)
+
+    def _ocr_block(self, images) -> List[List[Tuple[float, str, float]]]:
+        """
+        Performs OCR on several image regions in a single recognition pass. The regions are stacked into one
+        composite image which is recognized as a block, then every text line is mapped back to the region it lies in.
+
+        :param images: list of images in numpy array format
+        :return: for each region, list of (relative vertical position of the line center from 0 to 1, line text,
+                 line confidence from 0 to 100) from top to bottom
+        """
+        processed = [self._preprocess(image) for image in images]
+        width = max(image.shape[1] for image in processed)
+        # Blank gap keeps regions from being merged into the same line
+        gap = np.full((40, width), 255, dtype=np.uint8)
+
+        parts = [gap]
+        bands = []
+        y = gap.shape[0]
+        for image in processed:
+            part = np.full((image.shape[0], width), 255, dtype=np.uint8)
+            part[:, :image.shape[1]] = image
+            parts.extend([part, gap])
+            bands.append((y, y + image.shape[0]))
+            y += image.shape[0] + gap.shape[0]
+
+        output = [[] for _ in images]
+        self.__tesseract.SetPageSegMode(PSM.SINGLE_BLOCK)
+        try:
+            self.__tesseract.SetImage(Image.fromarray(np.vstack(parts)))
+            self.__tesseract.Recognize()
+            for line in iterate_level(self.__tesseract.GetIterator(), RIL.TEXTLINE):
+                text = line.GetUTF8Text(RIL.TEXTLINE).strip()
+                box = line.BoundingBox(RIL.TEXTLINE)
+                if not text or box is None:
+                    continue
+
+                center = (box[1] + box[3]) / 2
+                for i, (top, bottom) in enumerate(bands):
+                    if top <= center < bottom:
+                        output[i].append(((center - top) / (bottom - top), text, line.Confidence(RIL.TEXTLINE)))
+                        break
+        finally:
+            self.__tesseract.SetPageSegMode(PSM.SINGLE_LINE)
+
+        for lines in output:
+            lines.sort()
+        return output
+
+    # Name normalization is shared with structured imports
+    _post_process_gear_type = staticmethod(parse_gear_type)
+    _post_process_gear_set = staticmethod(parse_gear_set)
+    _post_process_gear_stat = staticmethod(parse_gear_stat)
+
+    def _regions(self, image) -> dict:
+        """
+        Locates the gear panel in a screenshot and crops every field
+
+        :param image: 1280x720 grayscale screenshot in numpy array format
+        :return: dict of field name -> image, along with the whole 'substats' box and the 'type_high' retry crop
+        """
+        gear_image = panel_image(image)
+
+        with self._timed('match'):
+            triangle_loc = self._locate(gear_image, 'triangle')
+            top_loc = self._locate(gear_image, 'top_bar')
+
+        # Box coordinates
+        main_stat_box = (top_loc[0] + 30, top_loc[1] + self.__top_bar.shape[0],
+                         top_loc[0] + self.__top_bar.shape[1], top_loc[1] + self.__top_bar.shape[0] + 52)
+        substats_box = (top_loc[0], top_loc[1] + + self.__top_bar.shape[0] + 73,
+                        top_loc[0] + self.__top_bar.shape[1], top_loc[1] + + self.__top_bar.shape[0] + 165)
+        set_box = (substats_box[0] + 37, substats_box[3] + 25,
+                   triangle_loc[0], substats_box[3] + 65)
+        type_box = (triangle_loc[0] - 185, triangle_loc[1],
+                    triangle_loc[0], triangle_loc[1] + 45)
+
+        regions = {
+            'type': gear_image[type_box[1]:type_box[3], type_box[0]:type_box[2]],
+            # Certain gears seems to have the gear type placed higher than usual
+            'type_high': gear_image[type_box[1]:(type_box[3] - 5), type_box[0]:type_box[2]],
+            'set': gear_image[set_box[1]:set_box[3], set_box[0]:set_box[2]],
+            'main_stat': gear_image[main_stat_box[1]:main_stat_box[3], main_stat_box[0]:main_stat_box[2]],
+            'substats': gear_image[substats_box[1]:substats_box[3], substats_box[0]:substats_box[2]],
+        }
+        substat_height = int(regions['substats'].shape[0] / 4)
+        for x in range(4):
+            regions['substat{}'.format(x)] = regions['substats'][x * substat_height:(x + 1) * substat_height, :]
+        return regions
+
+    def _ocr_fields(self, regions: dict, fields: List[str]) -> dict:
+        """
+        Reads fields with Tesseract, in a single recognition pass over every field then retrying the ones it couldn't
+        read one by one
+
+        :param regions: dict of field name -> image from _regions()
+        :param fields: names of the fields to read
+        :return: dict of field name -> (text, confidence from 0 to 100)
+        """
+        substat_fields = [field for field in fields if field.startswith('substat')]
+        block_fields = [field for field in fields if field not in substat_fields]
+        images = [regions[field] for field in block_fields]
+        if substat_fields:
+            images.append(regions['substats'])
+
+        def join(field_lines):
+            if not field_lines:
+                return '', 0
+            return ' '.join(text for _, text, _ in field_lines), min(confidence for _, _, confidence in field_lines)
+
+        lines = self._ocr_block(images)
+        reads = {field: join(field_lines) for field, field_lines in zip(block_fields, lines)}
+
+        if substat_fields:
+            # Each substat line belongs to the quarter of the substats box its center lies in
+            substats = [[] for _ in range(4)]
+            for line in lines[-1]:
+                substats[min(int(line[0] * 4), 3)].append(line)
+            for field in substat_fields:
+                reads[field] = join(substats[int(field[-1])])
+
+        for field in fields:
+            if not reads[field][0]:
+                reads[field] = self._ocr(regions[field])
+
+        return reads
+
+    @staticmethod
+    def _retries(regions: dict, field: str):
+        """
+        Alternate ways of reading a field, cheapest first
+
+        :param regions: dict of field name -> image from _regions()
+        :param field: field name
+        :return: iterator of (image, binarization threshold, page segmentation mode)
+        """
+        image = regions[field]
+        yield image, OCR_RETRY_THRESHOLD, PSM.SINGLE_LINE
+        # Certain gears seems to have the gear type placed higher than usual, other fields get a tighter crop
+        yield regions['type_high'] if field == 'type' else image[2:-2], OCR_THRESHOLD, PSM.SINGLE_LINE
+        yield image, OCR_THRESHOLD, PSM.SINGLE_BLOCK
+
+    def _parse_field(self, field: str, text: str):
+        """
+        Parses the text of a field
+
+        :param field: field name
+        :param text: text read
+        :return: GearType value, GearSet value or Stat depending on the field
+        """
+        if field == 'type':
+            return self._post_process_gear_type(text)
+        if field == 'set':
+            return self._post_process_gear_set(text)
+        return self._post_process_gear_stat(text)
+
+    @staticmethod
+    def _is_exact(field: str, text: str, value) -> bool:
+        """
+        Whether a text is exactly what it parsed to, without any of the parsers' corrections (e.g. 'T%' read as '7%',
+        'Rina' as Ring) or characters they ignore, so its glyphs can be labeled by it
+
+        :param field: field name
+        :param text: text read
+        :param value: value parsed from the text
+        :return: True if the text only holds the parsed value
+        """
+        words = text.split()
+        if field in ('type', 'set'):
+            name = (GearType(value) if field == 'type' else GearSet(value)).name.lower()
+            return all(word.isalpha() for word in words) and name in (word.lower() for word in words)
+
+        matched = re.fullmatch(r'([A-Za-z. ]+?) ?([0-9]{1,3}(?:,[0-9]{3})*)(%?)', ' '.join(words))
+        if matched is None or int(matched.group(2).replace(',', '')) != value.value:
+            return False
+        try:
+            return parse_gear_stat(matched.group(1) + ' 0').type == value.type
+        except NameError:
+            return False
+
+    def _learn(self, image, field: str, text: str, value):
+        """
+        Learns the glyphs of a line read by Tesseract if its text is exactly the parsed value
+
+        :param image: image of the line
+        :param field: field name
+        :param text: text read
+        :param value: value parsed from the text
+        :return: None
+        """
+        if not self._is_exact(field, text, value):
+            return
+        if self.learn:
+            with self._timed('glyphs'):
+                self.glyphs.learn(image, text)
+        else:
+            self.learned.append((image, text))
+
+    def _read_field(self, regions: dict, field: str, text: str, confidence: float):
+        """
+        Parses a field read by Tesseract. While the read isn't confident enough or doesn't parse, the field is read
+        again with the next alternate settings, so only doubtful fields cost extra OCR.
+
+        :param regions: dict of field name -> image from _regions()
+        :param field: field name
+        :param text: text of the first read
+        :param confidence: confidence of the first read
+        :return: (value, image, text, confidence) of the most confident read that parsed
+        """
+        image = regions[field]
+        retries = self._retries(regions, field)
+        best = None
+        error = None
+        while True:
+            try:
+                with self._timed('parse'):
+                    value = self._parse_field(field, text)
+                if best is None or confidence > best[3]:
+                    best = (value, image, text, confidence)
+            except (NameError, ValueError) as e:
+                error = error or e
+
+            if best is not None and best[3] >= MIN_OCR_CONFIDENCE:
+                break
+            retry = next(retries, None)
+            if retry is None:
+                break
+
+            image, threshold, psm = retry
+            with self._timed('ocr'):
+                text, confidence = self._ocr(image, threshold, psm)
+            self.field_sources['retries'] += 1
+
+        if best is None:
+            raise error
+        return best
+
+    def read(self, path: str) -> Gear:
+        """
+        Reads a gear from a screenshot
+
+        :param path: image path
+        :return: Gear, without an ID yet
+        """
+        with self._timed('decode'):
+            image = cv.imread(path, 0)
+        if image is None:
+            raise ValueError('Unreadable image: {}'.format(path))
+        return self.read_image(image)
+
+    def read_image(self, image) -> Gear:
+        """
+        Reads a gear from a decoded screenshot
+
+        :param image: 1280x720 grayscale screenshot in numpy array format
+        :return: Gear, without an ID yet
+        """
+        regions = self._regions(image)
+
+        values = {}
+        # Glyph reads of characters with few samples, only kept if Tesseract reads the same
+        unverified = {}
+        for field in GEAR_FIELDS:
+            with self._timed('glyphs'):
+                text = self.glyphs.recognize(regions[field])
+            if text:
+                try:
+                    with self._timed('parse'):
+                        value = self._parse_field(field, text)
+                except (NameError, ValueError):
+                    continue
+                if min(self.glyphs.samples(char) for char in text if not char.isspace()) >= MIN_TRUSTED_GLYPH_SAMPLES:
+                    values[field] = value
+                    self.field_sources['glyphs'] += 1
+                else:
+                    unverified[field] = value
+
+        missing = [field for field in GEAR_FIELDS if field not in values]
+        if missing:
+            with self._timed('ocr'):
+                reads = self._ocr_fields(regions, missing)
+            for field in missing:
+                values[field], image, text, confidence = self._read_field(regions, field, *reads[field])
+                self.field_sources['tesseract'] += 1
+                if field in unverified and unverified[field] != values[field]:
+                    self.field_sources['glyph_mismatches'] += 1
+                # Only confident reads are worth learning from
+                if confidence >= MIN_OCR_CONFIDENCE:
+                    self._learn(image, field, text, values[field])
+
+        return Gear(
+            -1,
+            values['type'],
+            values['set'],
+            values['main_stat'],
+            [values['substat{}'.format(x)] for x in range(4)],
+            False
+        )
+
+    def read_safe(self, path: str) -> Tuple[str, Gear, str]:
+        """
+        Reads a gear from a screenshot, returning the error instead of raising it
+
+        :param path: image path
+        :return: (path, gear, error), gear is None if the image couldn't be read
+        """
+        try:
+            return path, self.read(path), None
+        except Exception as e:
+            return path, None, '{}: {}'.format(type(e).__name__, e)
+
+    def read_video(self, path: str, cancel=None) -> Iterator[Tuple[str, Gear, str]]:
+        """
+        Reads the gears shown in a screen recording of the inventory.
+
+        Frames are decoded sequentially and compared through a small thumbnail of the gear panel. Once the panel
+        stops changing for a few frames and differs from the last gear read, the frame is read if the panel anchors
+        are found in it, so each distinct gear is read once no matter how long it stays on screen. A failed read is
+        retried on the next stable frames, up to VIDEO_READ_ATTEMPTS, and only reported if no frame of the panel could
+        be read.
+
+        :param path: video path
+        :param cancel: threading.Event stopping the reading when set
+        :return: iterator of ('<path>#<frame number>', gear, error) for each distinct gear shown
+        """
+        capture = cv.VideoCapture(path)
+        if not capture.isOpened():
+            yield path, None, 'ValueError: Unreadable video: {}'.format(path)
+            return
+
+        try:
+            frame_number = -1
+            previous = None
+            stable_frames = 0
+            last_read = None
+            # Reads tried on the current panel and the error of the last failed one, reported once the panel is left
+            attempts = 0
+            error = None
+            while cancel is None or not cancel.is_set():
+                with self._timed('decode'):
+                    # Skipped frames are only grabbed, not converted
+                    for _ in range(VIDEO_FRAME_STEP - 1):
+                        capture.grab()
+                        frame_number += 1
+                    ok, frame = capture.read()
+                    frame_number += 1
+                    if not ok:
+                        break
+                    image = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+                    if image.shape != (720, 1280):
+                        image = cv.resize(image, (1280, 720), interpolation=cv.INTER_AREA)
+
+                thumbnail = panel_thumbnail(image)
+                if previous is not None and thumbnail_difference(thumbnail, previous) < VIDEO_STABLE_DIFFERENCE:
+                    stable_frames += 1
+                else:
+                    stable_frames = 0
+                    attempts = 0
+                    if error is not None:
+                        yield error
+                        error = None
+                previous = thumbnail
+
+                if stable_frames < VIDEO_STABLE_FRAMES or attempts >= VIDEO_READ_ATTEMPTS:
+                    continue
+                if last_read is not None and thumbnail_difference(thumbnail, last_read) < VIDEO_STABLE_DIFFERENCE:
+                    # Same gear as before, e.g. scrolling paused without selecting another gear
+                    continue
+
+                attempts += 1
+                label = '{}#{}'.format(path, frame_number)
+                try:
+                    gear = self.read_image(image)
+                except PanelNotFound:
+                    # Not a gear panel, e.g. a menu transition
+                    continue
+                except Exception as e:
+                    error = label, None, '{}: {}'.format(type(e).__name__, e)
+                else:
+                    yield label, gear, None
+                    error = None
+                    last_read = thumbnail
+
+            if error is not None:
+                yield error
+        finally:
+            capture.release()
+
+
+# Reader of the current OCR worker process
+_reader = None
+
+
+def _init_worker(glyphs_path: str):
+    global _reader
+    # Glyphs are only learned by the parent process, which owns the glyphs file
+    _reader = GearReader(glyphs_path, learn=False)
+
+
+def _read_worker(path: str) -> Tuple[Tuple[str, Gear, str], list]:
+    try:
+        return _reader.read_safe(path), _reader.learned
+    finally:
+        _reader.learned = []
+
+
+class OcrPool:
+    """
+    Reusable pool of OCR worker processes, each with its own GearReader.
+
+    Images are handed to whichever worker is free and results come back per image in completion order. A worker
+    crashing doesn't block the import: its images are read again on new processes, and an image crashing them
+    WORKER_CRASH_RETRIES more times fails with a WORKER_CRASH_ERROR error.
+
+    Workers recognize glyphs with the glyphs file as it was when they started and send back the lines worth learning
+    from, which are learned in this process and saved on shutdown, so workers never write the glyphs file.
+
+    Several threads may read on the same pool, e.g. a watched folder and a manual import, the worker processes are
+    created, replaced and shut down under a lock.
+    """
+
+    def __init__(self, processes: int, glyphs_path: str = GLYPHS_FILE, glyphs: GlyphRecognizer = None):
+        """
+        :param processes: number of worker processes
+        :param glyphs_path: glyphs file the workers recognize glyphs with, None reads with Tesseract only
+        :param glyphs: recognizer of this process learning what the workers read, None doesn't learn
+        """
+        self.processes = processes
+        self.glyphs_path = glyphs_path
+        self.glyphs = glyphs
+        self.__executor = None
+        self.__lock = Lock()
+
+    def __submit(self, path: str):
+        """
+        Queues an image on the current worker processes, started if there are none
+
+        :param path: image path
+        :return: (future of the _read_worker result, executor it was queued on)
+        """
+        with self.__lock:
+            for _ in range(2):
+                if self.__executor is None:
+                    self.__executor = ProcessPoolExecutor(self.processes, initializer=_init_worker,
+                                                          initargs=(self.glyphs_path,))
+                executor = self.__executor
+                try:
+                    return executor.submit(_read_worker, path), executor
+                except BrokenProcessPool:
+                    # Broke since the last result, retried once on new processes
+                    self.__executor = None
+                    executor.shutdown(wait=False, cancel_futures=True)
+            raise BrokenProcessPool('OCR workers keep breaking')
+
+    def __retire(self, executor: ProcessPoolExecutor, cancel: bool = True):
+        """
+        Shuts down worker processes if they are still the current ones, the next image starts new ones
+
+        :param executor: executor to shut down
+        :param cancel: drop the images queued on it, otherwise they are still read before it exits
+        :return: None
+        """
+        with self.__lock:
+            if self.__executor is executor:
+                self.__executor = None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=cancel)
+
+    def __result(self, future):
+        result, learned = future.result()
+        if self.glyphs is not None:
+            for image, text in learned:
+                self.glyphs.learn(image, text)
+        return result
+
+    def imap_unordered(self, image_paths: List[str], cancel=None) -> Iterator[Tuple[str, Gear, str]]:
+        """
+        Reads images on the pool
+
+        :param image_paths: list of image paths
+        :param cancel: Event stopping the reading when set, images not started yet are dropped
+        :return: iterator of (path, gear, error) in completion order
+        """
+        paths = iter(image_paths)
+        # future -> (path, executor it was queued on, times it was read again after a crash)
+        pending = {}
+
+        def submit(image_path, retries=0):
+            future, future_executor = self.__submit(image_path)
+            pending[future] = image_path, future_executor, retries
+
+        try:
+            # Keep a couple of images queued per worker, the rest is fed as workers free up
+            for path in paths:
+                submit(path)
+                if len(pending) >= self.processes * 2:
+                    break
+
+            while pending:
+                done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                if cancel is not None and cancel.is_set():
+                    return
+
+                for future in done:
+                    if future not in pending:
+                        # Resubmitted after the pool broke
+                        continue
+                    path, executor, retries = pending.pop(future)
+
+                    try:
+                        yield self.__result(future)
+                    except (BrokenProcessPool, CancelledError) as e:
+                        # Worker died, or another thread shut its processes down and dropped the images queued on
+                        # them. Its images go to new processes, another thread may have replaced them already.
+                        # Every image queued on it fails the same way, the one seen first is blamed for the crash
+                        self.__retire(executor)
+                        if retries < WORKER_CRASH_RETRIES:
+                            submit(path, retries + 1)
+                        else:
+                            yield path, None, '{}: {}'.format(WORKER_CRASH_ERROR, e or type(e).__name__)
+                        for lost_future, (lost_path, lost_executor, lost_retries) in list(pending.items()):
+                            if lost_executor is executor:
+                                del pending[lost_future]
+                                submit(lost_path, lost_retries)
+                        if retries < WORKER_CRASH_RETRIES:
+                            # Still pending, no room for the next image
+                            continue
+
+                    next_path = next(paths, None)
+                    if next_path is not None:
+                        submit(next_path)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def resize(self, processes: int):
+        """
+        Changes the number of worker processes, images already queued are still read by the current ones
+
+        :param processes: number of worker processes
+        :return: None
+        """
+        with self.__lock:
+            if processes == self.processes:
+                return
+            self.processes = processes
+            executor = self.__executor
+        self.__retire(executor, cancel=False)
+
+    def shutdown(self):
+        with self.__lock:
+            executor = self.__executor
+        self.__retire(executor)
+        if self.glyphs is not None:
+            self.glyphs.save()
@@ -1,65 +1,351 @@
+import bisect
+import copy
+import csv
+import hashlib
+import math
 import multiprocessing as mp
 import os
+import queue
 import re
-from itertools import product
-from typing import List, Tuple, Dict
-
-import cv2 as cv
+import shutil
+from collections import Counter
+from dataclasses import dataclass
+from itertools import combinations, product
+from threading import Lock
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
 import requests
-from PIL import Image
-from tesserocr import PyTessBaseAPI, PSM, OEM
 
 from gear import *
+from inventory import Inventory
+from ocr import (GLYPHS_FILE, VIDEO_EXTENSIONS, WORKER_CRASH_ERROR, GearReader, GlyphRecognizer, OcrPool,
+                 video_frame_png)
+from writer import DebouncedWriter, atomic_write
 import time
 
-tesseract = PyTessBaseAPI(path='resources/tessdata', psm=PSM.SINGLE_LINE, oem=OEM.LSTM_ONLY, )
+GEARS_JSON = 'gears.json'
+GEARS_SNAPSHOT = 'gears.bin'
+HERO_LOADOUTS_JSON = 'hero_loadouts.json'
+OCR_CACHE_JSON = 'ocr_cache.json'
+OCR_FAILURES_JSON = 'ocr_failures.json'
+QUARANTINE_DIR = 'quarantine'
+# Gear exports of other tools, imported without OCR
+RECORD_EXTENSIONS = ('.json', '.jsonl', '.csv')
+# Records added to the inventory at once
+RECORD_BATCH_SIZE = 1000
+# Number of distinct stats, GearStat has aliases
+STAT_COUNT = len({stat.value for stat in GearStat})
+# Single swaps per slot, and per slot and set, combined into two piece upgrade suggestions
+UPGRADE_PAIR_CANDIDATES = 20
+UPGRADE_PAIR_SET_CANDIDATES = 2
+# Sums stat_distribution() adds a slot's gears to at once, bounds the memory each slot takes
+STAT_DISTRIBUTION_CHUNK = 1000000
+
+
+@dataclass
+class ConstraintGap:
+    """
+    A min-max constraint no loadout can meet, along with the range of final values the loadouts can reach
+    """
+    stat: str
+    minimum: int
+    maximum: int
+    reachable_min: int
+    reachable_max: int
+    # Whether the loadouts are those of the candidate gears optimize() picks rather than of every unused gear
+    candidates: bool = False
+
+    @property
+    def gap(self) -> int:
+        """
+        How far the constraint is out of reach
+        """
+        if self.minimum > self.reachable_max:
+            return self.minimum - self.reachable_max
+        return self.reachable_min - self.maximum
+
+    def __str__(self):
+        if self.minimum > self.reachable_max:
+            text = '{} min {} is {} above the highest reachable {}'.format(self.stat, self.minimum, self.gap,
+                                                                          self.reachable_max)
+        else:
+            text = '{} max {} is {} below the lowest reachable {}'.format(self.stat, self.maximum, self.gap,
+                                                                         self.reachable_min)
+        return text + (' with the best candidate gears of each slot' if self.candidates else '')
 
 
 class E7GearOptimizer:
     def __init__(self):
-        self.gears = []
+        self.inventory = Inventory()
         self.hero_loadouts = {}
 
+        # Gears read from screenshots by image content hash, so re-imported screenshots skip OCR
+        self.ocr_cache = {}
+        # Errors of the screenshots that couldn't be read by image content hash, watched folders don't read them again
+        self.ocr_failures = {}
+        # Skip imported gears identical to one read earlier in the same import (e.g. 2 screenshots of the same item) or
+        # read from the same screenshot before. Gears identical to one of an earlier import may be distinct items, they
+        # are added with a note naming the identical gear
+        self.skip_duplicates = True
+        # Screenshots that couldn't be read are copied there along with the error for inspection, None disables it
+        self.quarantine_dir = QUARANTINE_DIR
+
         self.hero_base_stat = None
 
         self.optimizer_output = []
-
-        self.__triangle = cv.imread('resources/ocr/triangle.jpg', 0)
-        self.__top_bar = cv.imread('resources/ocr/top.jpg', 0)
+        # Constraints found out of reach by the last optimize() or sweep_constraint(), which then didn't run
+        self.constraint_gaps = []
+        # Best loadouts of each set pattern of the last optimize() given set patterns
+        self.pattern_outputs = []
+        # Number of best loadouts kept by optimize(), per set pattern if given
+        self.max_results = 5000
+        # Called with a snapshot of the best loadouts found so far while optimize() runs, at most every
+        # partial_results_interval seconds
+        self.partial_results_callback = None
+        self.partial_results_interval = 0.5
 
         self.cores = mp.cpu_count() // 2 - 1
 
+        # Glyphs file the OCR learns the gear panel font into, None reads with Tesseract only
+        self.glyphs_path = GLYPHS_FILE
+        # Whether imports teach the glyph recognizer, off keeps the glyphs as loaded
+        self.learn_glyphs = True
+
+        # Glyph recognizer shared by every import of this process, OCR engine for imports done in this process and
+        # pool of OCR processes, all created when first needed
+        self.__glyphs = None
+        self.__reader = None
+        self.__reader_lock = Lock()
+        self.__ocr_pool = None
+        self.__ocr_pool_lock = Lock()
+
+        self.__writer = DebouncedWriter(self._write)
+
     def __getstate__(self):
-        return self.__dict__
+        # Background writer holds threads and locks and the callback may be bound to GUI objects, they stay in the
+        # parent process
+        state = self.__dict__.copy()
+        state.pop('_E7GearOptimizer__writer', None)
+        state['partial_results_callback'] = None
+        state['_E7GearOptimizer__glyphs'] = None
+        state['_E7GearOptimizer__reader'] = None
+        state.pop('_E7GearOptimizer__reader_lock', None)
+        state['_E7GearOptimizer__ocr_pool'] = None
+        state.pop('_E7GearOptimizer__ocr_pool_lock', None)
+        return state
 
     def __setstate__(self, state):
         self.__dict__ = state
+        self.__reader_lock = Lock()
+        self.__ocr_pool_lock = Lock()
 
     def load(self):
         """
-        Loads gears and saved hero loadouts if exists
+        Loads gears and saved hero loadouts if exists.
+        The binary gear snapshot is preferred unless gears.json is newer (e.g. older save or edited by hand), or it
+        can't be read (e.g. truncated by a crash).
 
         :return: None
         """
-        if os.path.exists('gears.json'):
-            with open('gears.json', 'r') as file_input:
-                self.gears = json.load(file_input, object_hook=json_to_gear)
-
-        if os.path.exists('hero_loadouts.json'):
-            with open('hero_loadouts.json', 'r') as file_input:
+        loaded = False
+        if os.path.exists(GEARS_SNAPSHOT) and \
+                (not os.path.exists(GEARS_JSON) or os.path.getmtime(GEARS_SNAPSHOT) >= os.path.getmtime(GEARS_JSON)):
+            try:
+                with GearSnapshot(GEARS_SNAPSHOT) as snapshot:
+                    self.inventory = Inventory.from_columns(snapshot.columns())
+                loaded = True
+            except (OSError, ValueError) as e:
+                print('Failed to load {}, falling back to {}: {}'.format(GEARS_SNAPSHOT, GEARS_JSON, e))
+        if not loaded and os.path.exists(GEARS_JSON):
+            self.inventory = Inventory(self.read_gears_json(GEARS_JSON))
+
+        if os.path.exists(HERO_LOADOUTS_JSON):
+            with open(HERO_LOADOUTS_JSON, 'r') as file_input:
                 self.hero_loadouts = json.load(file_input)
 
+        if os.path.exists(OCR_CACHE_JSON):
+            with open(OCR_CACHE_JSON, 'r') as file_input:
+                self.ocr_cache = dict(json.load(file_input, object_hook=json_to_gear))
+
+        if os.path.exists(OCR_FAILURES_JSON):
+            with open(OCR_FAILURES_JSON, 'r') as file_input:
+                self.ocr_failures = json.load(file_input)
+
     def save(self):
         """
-        Saves gears and loadout
+        Saves gears as a binary snapshot and hero loadouts immediately on the calling thread
+
+        :return: None
+        """
+        self.__writer.mark('gears', 'loadouts')
+        self.__writer.flush()
+
+    def mark_dirty(self, gears: bool = False, loadouts: bool = False, ocr_cache: bool = False):
+        """
+        Marks gears, hero loadouts and/or the OCR cache as modified. Bursts of changes are coalesced into a single
+        write on a background thread.
+
+        :param gears: gears were modified
+        :param loadouts: hero loadouts were modified
+        :param ocr_cache: OCR cache was modified
+        :return: None
+        """
+        keys = [key for key, dirty in (('gears', gears), ('loadouts', loadouts), ('ocr_cache', ocr_cache)) if dirty]
+        if keys:
+            self.__writer.mark(*keys)
+
+    def flush(self):
+        """
+        Writes any pending changes and waits for it to finish
+
+        :return: None
+        """
+        self.__writer.flush()
+
+    def close(self):
+        """
+        Writes pending changes, stops the OCR processes and saves the glyphs the reader learned
+
+        :return: None
+        """
+        self.flush()
+        if self.__reader is not None:
+            self.__reader.close()
+            self.__reader = None
+        with self.__ocr_pool_lock:
+            if self.__ocr_pool is not None:
+                self.__ocr_pool.shutdown()
+                self.__ocr_pool = None
+        if self.__glyphs is not None:
+            self.__glyphs.save()
+
+    def _write(self, dirty):
+        """
+        Writes the dirty parts of the optimizer to disk atomically
 
+        :param dirty: set of dirty keys, 'gears', 'loadouts' and/or 'ocr_cache', which also covers the OCR failures
         :return: None
         """
-        with open('gears.json', 'w') as file_output:
-            json.dump(self.gears, file_output, cls=GearJSONEncoder, indent=2, separators=(',', ': '))
+        if 'gears' in dirty:
+            atomic_write(GEARS_SNAPSHOT, self.inventory.snapshot())
+
+        if 'loadouts' in dirty:
+            atomic_write(HERO_LOADOUTS_JSON, json.dumps(dict(self.hero_loadouts), indent=2), 'w')
 
-        with open('hero_loadouts.json', 'w') as file_output:
-            json.dump(self.hero_loadouts, file_output, indent=2)
+        if 'ocr_cache' in dirty:
+            # Imports and watched folders keep adding entries on other threads, the dicts are copied before being
+            # encoded, which would otherwise go through them as they change
+            ocr_cache = list(self.ocr_cache.items())
+            ocr_failures = dict(self.ocr_failures)
+            # List of [hash, gear] pairs, a dict would be taken for a gear or stat by json_to_gear
+            atomic_write(OCR_CACHE_JSON, json.dumps(ocr_cache, cls=GearJSONEncoder), 'w')
+            atomic_write(OCR_FAILURES_JSON, json.dumps(ocr_failures, indent=2), 'w')
+
+    @staticmethod
+    def read_gears_json(path: str) -> List[Gear]:
+        """
+        Reads gears from a JSON export
+
+        :param path: path of the JSON file
+        :return: list of gears
+        """
+        with open(path, 'r') as file_input:
+            return json.load(file_input, object_hook=json_to_gear)
+
+    @staticmethod
+    def read_gear_records(path: str) -> Iterator[Tuple[str, dict]]:
+        """
+        Reads the gear records of an export, CSV and JSON Lines files are streamed
+
+        :param path: path of a CSV file with a header row, a JSON Lines file, or a JSON file holding a list of records
+                     (or a dict with a 'gears' or 'items' list)
+        :return: iterator of (location of the record, record dict)
+        """
+        extension = os.path.splitext(path)[1].lower()
+        with open(path, 'r', newline='' if extension == '.csv' else None, encoding='utf-8-sig') as file_input:
+            if extension == '.csv':
+                for line, record in enumerate(csv.DictReader(file_input), 2):
+                    yield '{}:{}'.format(path, line), record
+                return
+
+            if extension == '.jsonl':
+                for line, text in enumerate(file_input, 1):
+                    if text.strip():
+                        yield '{}:{}'.format(path, line), json.loads(text)
+                return
+
+            records = json.load(file_input)
+            if isinstance(records, dict):
+                records = records.get('gears', records.get('items', []))
+            for i, record in enumerate(records):
+                yield '{}[{}]'.format(path, i), record
+
+    def import_gear_records(self, paths: List[str], cancel=None) -> Iterator[Tuple[str, Gear, str]]:
+        """
+        Imports gears exported by other tools, without OCR. Records are mapped with gear_from_record, added to the
+        inventory in batches and saved with a single write once done.
+
+        :param paths: list of CSV, JSON or JSON Lines paths
+        :param cancel: threading.Event stopping the import when set
+        :return: iterator of (location of the record, gear, error) for each record, gear is None if the record couldn't
+                 be mapped or is a duplicate of an earlier record, error is a note if the gear was added but is
+                 identical to a gear of an earlier import
+        """
+        # (location, gear, note)
+        batch = []
+        # Fingerprints of the gears of this import
+        fingerprints = set()
+
+        def add_batch():
+            gears = self.inventory.add_many(gear for _, gear, _ in batch)
+            results = [(location, gear, note) for (location, _, note), gear in zip(batch, gears)]
+            batch.clear()
+            return results
+
+        added = False
+        try:
+            for path in paths:
+                try:
+                    for location, record in self.read_gear_records(path):
+                        if cancel is not None and cancel.is_set():
+                            return
+
+                        try:
+                            gear = gear_from_record(record)
+                        except (KeyError, NameError, TypeError, ValueError) as e:
+                            yield location, None, '{}: {}'.format(type(e).__name__, e)
+                            continue
+
+                        fingerprint = gear_fingerprint(gear)
+                        if self.skip_duplicates and fingerprint in fingerprints:
+                            yield location, None, 'Duplicate of an earlier record'
+                            continue
+                        fingerprints.add(fingerprint)
+
+                        batch.append((location, gear, self._identical_note(gear)))
+                        if len(batch) >= RECORD_BATCH_SIZE:
+                            added = True
+                            yield from add_batch()
+                except (OSError, ValueError) as e:
+                    # Unreadable file or malformed JSON, the records read before it are kept
+                    yield path, None, '{}: {}'.format(type(e).__name__, e)
+
+            if batch:
+                added = True
+                yield from add_batch()
+        finally:
+            self.mark_dirty(gears=added)
+
+    def export_gears(self, path: str = GEARS_JSON):
+        """
+        Exports gears to JSON
+
+        :param path: path of the JSON file
+        :return: None
+        """
+        with open(path, 'w') as file_output:
+            json.dump(list(self.inventory), file_output, cls=GearJSONEncoder, indent=2, separators=(',', ': '))
 
     @staticmethod
     def get_hero_list() -> Tuple[str]:
@@ -101,89 +387,6 @@ class E7GearOptimizer:
 
         return hero_base_stats
 
-    def _ocr(self, image) -> str:
-        """
-        Performs OCR on image and returns output.
-
-        :param image: image in numpy array format
-        :return: OCR string
-        """
-        processed_image = cv.threshold(cv.resize(image, None, fx=5, fy=5), 50, 255, cv.THRESH_BINARY_INV)[1]
-        tesseract.SetImage(Image.fromarray(processed_image))
-        return tesseract.GetUTF8Text().strip()
-
-    @staticmethod
-    def _post_process_gear_type(gear_type: str) -> int:
-        """
-        Process the string passed from OCR and return the equipment type
-
-        :param gear_type: gear type string passed from OCR
-        :return: the equipment type
-        """
-        gear_type = gear_type.replace('Rina', 'Ring').lower()
-        for g_type in GearType:
-            if g_type.name.lower() in gear_type.lower():
-                return g_type.value
-
-        raise NameError('Unknown equipment type:', gear_type)
-
-    @staticmethod
-    def _post_process_gear_set(gear_set: str) -> int:
-        """
-        Process the string passed from OCR and return the equipment set
-
-        :param gear_set: gear set string passed from OCR
-        :return: the equipment set
-        """
-        gear_set = [x.lower() for x in gear_set.split()]
-        for g_set in GearSet:
-            if g_set.name.lower() in gear_set:
-                return g_set.value
-
-        raise NameError('Unknown equipment set:', gear_set)
-
-    @staticmethod
-    def _post_process_gear_stat(equip_stat: str) -> Stat:
-        """
-        Process the string passed from OCR and return a Stat object holding the stat and value
-
-        :param equip_stat: stat string passed from OCR
-        :return: Stat object
-        """
-        matched = re.findall(r'([^\d][a-zA-Z\s]+).*?([0-9]+%*)',
-                             equip_stat.replace(',', '').replace('T%', '7%'))
-        if matched:
-            stat = -1
-            if 'attack' in matched[0][0].lower():
-                stat = GearStat.Attack.value
-            if 'health' in matched[0][0].lower():
-                stat = GearStat.Health.value
-            if 'defense' in matched[0][0].lower():
-                stat = GearStat.Defense.value
-            if 'speed' in matched[0][0].lower():
-                stat = GearStat.Speed.value
-            if 'chance' in matched[0][0].lower():
-                stat = GearStat.CritC.value
-            if 'damage' in matched[0][0].lower():
-                stat = GearStat.CritD.value
-            if 'effectiveness' in matched[0][0].lower():
-                stat = GearStat.Eff.value
-            if 'resistance' in matched[0][0].lower():
-                stat = GearStat.ER.value
-
-            if stat == -1:
-                raise NameError('Unknown equipment stat:', equip_stat)
-
-            value = matched[0][1]
-            if '%' in value and GearStat(stat) not in [GearStat.CritC, GearStat.CritD, GearStat.Eff, GearStat.ER]:
-                is_flat = False
-            else:
-                is_flat = True
-            value = int(value.replace('%', ''))
-            return Stat(stat, value, is_flat)
-        else:
-            raise NameError('No matches from regex found for \'{}\''.format(equip_stat))
-
     def score_stat(self, stat: Stat) -> float:
         """
         Given a stat and value, return a score grading "how good" the stat is
@@ -258,7 +461,7 @@ class E7GearOptimizer:
                 if GearStat.Attack.value not in priorities:
                     dmg = stats['Health'] / 10000
             elif GearStat(priority_stat) == GearStat.CritC:
-                crit = max(0, min(stats['Crit. C'], 100)) / 100
+                crit = np.clip(stats['Crit. C'], 0, 100) / 100
                 crit = 1
             elif GearStat(priority_stat) == GearStat.CritD:
                 crit_dmg = stats['Crit. D'] / 100 - 1
@@ -277,112 +480,256 @@ class E7GearOptimizer:
 
         return (e_dps + e_hp + utility) * spd
 
-    def _import_gear_aux(self, image_paths: List[str], return_output=None):
+    @property
+    def glyphs(self) -> GlyphRecognizer:
+        if self.__glyphs is None:
+            self.__glyphs = GlyphRecognizer(self.glyphs_path, read_only=not self.learn_glyphs)
+        return self.__glyphs
+
+    @property
+    def reader(self) -> GearReader:
+        if self.__reader is None:
+            self.__reader = GearReader(glyphs=self.glyphs)
+        return self.__reader
+
+    def _import_gear_aux(self, image_paths: List[str]) -> List[Tuple[str, Gear, str]]:
         """
-        Helper function for import_gear
+        Helper function for import_gear, reads images in this process
 
         :param image_paths: List of image paths
-        :param return_output: the shared output for multiprocessing
-        :return:
-        """
-        output = []
-        for path in image_paths:
-            gear_image = cv.imread(path, 0)
-            h, w = gear_image.shape
-            gear_image = gear_image[60:h, 395:880]
-
-            triangle = cv.matchTemplate(gear_image, self.__triangle, cv.TM_CCOEFF_NORMED)
-            _, a, _, triangle_loc = cv.minMaxLoc(triangle)
-            top = cv.matchTemplate(gear_image, self.__top_bar, cv.TM_CCOEFF_NORMED)
-            _, b, _, top_loc = cv.minMaxLoc(top)
-
-            # Box coordinates
-            main_stat_box = (top_loc[0] + 30, top_loc[1] + self.__top_bar.shape[0],
-                             top_loc[0] + self.__top_bar.shape[1], top_loc[1] + self.__top_bar.shape[0] + 52)
-            substats_box = (top_loc[0], top_loc[1] + + self.__top_bar.shape[0] + 73,
-                            top_loc[0] + self.__top_bar.shape[1], top_loc[1] + + self.__top_bar.shape[0] + 165)
-            set_box = (substats_box[0] + 37, substats_box[3] + 25,
-                       triangle_loc[0], substats_box[3] + 65)
-            type_box = (triangle_loc[0] - 185, triangle_loc[1],
-                        triangle_loc[0], triangle_loc[1] + 45)
-            set_image = gear_image[set_box[1]:set_box[3], set_box[0]:set_box[2]]
-            type_image = gear_image[type_box[1]:type_box[3], type_box[0]:type_box[2]]
-            main_stat_image = gear_image[main_stat_box[1]:main_stat_box[3], main_stat_box[0]:main_stat_box[2]]
-            substats_image = gear_image[substats_box[1]:substats_box[3], substats_box[0]:substats_box[2]]
-
-            equip_type = self._ocr(type_image)
-            equip_set = self._ocr(set_image)
-            main_stat = self._ocr(main_stat_image)
-
-            # Certain gears seems to have the gear type placed higher than usual, we retry except crop higher
-            if len(equip_type) == 0:
-                type_image = gear_image[type_box[1]:(type_box[3] - 5), type_box[0]:type_box[2]]
-                processed_image = cv.threshold(cv.resize(type_image, None, fx=5, fy=5), 50, 255, cv.THRESH_BINARY_INV)[
-                    1]
-                tesseract.SetImage(Image.fromarray(processed_image))
-                equip_type = tesseract.GetUTF8Text().strip()
-
-            substats = []
-            substat_height = int(substats_image.shape[0] / 4)
-            for x in range(4):
-                substat_image = substats_image[x * substat_height:(x + 1) * substat_height,
-                                0:substats_image.shape[1]]
-                substats.append(self._ocr(substat_image))
-
-            gear = Gear(
-                -1,
-                self._post_process_gear_type(equip_type),
-                self._post_process_gear_set(equip_set),
-                self._post_process_gear_stat(main_stat),
-                [self._post_process_gear_stat(sub) for sub in substats],
-                False
-            )
-            output.append(gear)
-
-        if return_output:
-            return_output.put(output)
-
-        return output
-
-    def import_gear(self, image_paths: List[str]):
+        :return: list of (path, gear, error), gear is None if the image couldn't be read
         """
-        Import gear image into a Gear object and adds it to list of gears
-        Image resolution must be in 1280x720 resolution.
+        # Tesseract isn't thread safe, e.g. a watched folder and a manual import both reading in this process
+        with self.__reader_lock:
+            return [self.reader.read_safe(path) for path in image_paths]
 
-        :param image_paths: list of image path or a string path
+    @staticmethod
+    def _image_fingerprint(path: str) -> str:
+        """
+        Returns the content hash of an image file
+
+        :param path: image path
+        :return: hex digest, None if the file can't be read
+        """
+        try:
+            with open(path, 'rb') as file_input:
+                return hashlib.sha1(file_input.read()).hexdigest()
+        except OSError:
+            return None
+
+    def _quarantine(self, path: str, fingerprint: str, error: str):
+        """
+        Copies an image that couldn't be read into the quarantine directory, next to a text file holding the error. A
+        video frame is saved as a PNG image, the video itself is never copied.
+
+        :param path: image path, or '<video path>#<frame number>' label of a video frame
+        :param fingerprint: content hash of the image, keeps screenshots with the same file name apart
+        :param error: reading error
         :return: None
         """
-        if len(image_paths) < self.cores:
-            output = self._import_gear_aux(image_paths)
-            for gear in output:
-                gear.id = self.gears[-1].id + 1 if len(self.gears) != 0 else 0
-                self.gears.append(gear)
+        if self.quarantine_dir is None:
+            return
+
+        video, _, frame_number = path.rpartition('#')
+        if os.path.splitext(video)[1].lower() in VIDEO_EXTENSIONS and frame_number.isdigit():
+            content = video_frame_png(video, int(frame_number))
+            if content is None:
+                return
+            fingerprint = hashlib.sha1(content).hexdigest()
+            file_name = os.path.basename(path) + '.png'
+        elif os.path.exists(path):
+            content = None
+            file_name = os.path.basename(path)
         else:
-            mp_output = mp.Queue(maxsize=self.cores)
-            processes = []
-            for x in range(self.cores):
-                p = mp.Process(target=self._import_gear_aux, args=(image_paths[x + 1::self.cores + 1], mp_output))
-                processes.append(p)
-                p.start()
+            return
+
+        try:
+            os.makedirs(self.quarantine_dir, exist_ok=True)
+            name = '{}_{}'.format((fingerprint or '')[:8], file_name)
+            if content is None:
+                shutil.copy2(path, os.path.join(self.quarantine_dir, name))
+            else:
+                with open(os.path.join(self.quarantine_dir, name), 'wb') as file_output:
+                    file_output.write(content)
+            with open(os.path.join(self.quarantine_dir, name + '.txt'), 'w') as file_output:
+                file_output.write('{}\n{}\n'.format(path, error))
+        except OSError as e:
+            print('Failed to quarantine {}: {}'.format(path, e))
+
+    def is_imported(self, path: str) -> bool:
+        """
+        Returns whether a screenshot was already read, according to the OCR cache
 
-            output = self._import_gear_aux(image_paths[::self.cores + 1])
+        :param path: image path
+        :return: True if the image content is in the OCR cache
+        """
+        return self._image_fingerprint(path) in self.ocr_cache
 
-            # Get results and add to optimizer's list of gear
-            results = [mp_output.get() for _ in processes]
-            results.append(output)
+    def was_read(self, path: str) -> bool:
+        """
+        Returns whether a screenshot was already read, successfully or not, e.g. for watched folders to skip it
 
-            for result in results:
-                for gear in result:
-                    gear.id = self.gears[-1].id + 1 if len(self.gears) != 0 else 0
-                    self.gears.append(gear)
+        :param path: image path
+        :return: True if the image content is in the OCR cache or failures
+        """
+        fingerprint = self._image_fingerprint(path)
+        return fingerprint in self.ocr_cache or fingerprint in self.ocr_failures
 
-            # Join processes
-            for process in processes:
-                process.join()
-        self.save()
+    def _identical_note(self, gear: Gear) -> str:
+        """
+        :param gear: gear about to be added
+        :return: note naming the gears of the inventory identical to it, None if there are none
+        """
+        duplicates = self.inventory.find_duplicates(gear)
+        if not duplicates:
+            return None
+        return 'Identical to gear {}, added as a separate item'.format(
+            ', '.join(str(duplicate.id) for duplicate in duplicates))
+
+    def import_gear_iter(self, image_paths: List[str], cancel=None) -> Iterator[Tuple[str, Gear, str]]:
+        """
+        Imports gear images one by one, adding each gear to the inventory as soon as it is read.
+        Image resolution must be in 1280x720 resolution. Screen recordings of the inventory are read as well, one gear
+        per distinct gear panel shown, and gear exports of other tools are imported with import_gear_records().
+
+        Screenshots already read before are taken from the OCR cache, see skip_duplicates for the gears that are
+        skipped. Screenshots that can't be read are quarantined and their errors kept in ocr_failures, they are still
+        read again by later imports. Screenshots whose OCR worker crashed aren't, see OcrPool. Only the frames of a
+        video that can't be read are quarantined, and a video that can't be opened only has its error kept.
+
+        :param image_paths: list of image path or a string path
+        :param cancel: threading.Event stopping the import when set
+        :return: iterator of (path, gear, error) for each image in completion order, gear is None if the image
+                 couldn't be read or is a duplicate, error is a note if the gear was added but is identical to a gear of
+                 an earlier import
+        """
+        if isinstance(image_paths, str):
+            image_paths = [image_paths]
+
+        extensions = {path: os.path.splitext(path)[1].lower() for path in image_paths}
+        video_paths = [path for path in image_paths if extensions[path] in VIDEO_EXTENSIONS]
+        record_paths = [path for path in image_paths if extensions[path] in RECORD_EXTENSIONS]
+        image_paths = [path for path in image_paths if path not in video_paths and path not in record_paths]
+
+        fingerprints = {path: self._image_fingerprint(path) for path in image_paths}
+        cached = [path for path in image_paths if fingerprints[path] in self.ocr_cache]
+        image_paths = [path for path in image_paths if fingerprints[path] not in self.ocr_cache]
+
+        changed = set()
+        # Gear fingerprint -> id of the gear this import added with it
+        imported = {}
+
+        def add_gear(path, gear, error, cached=False):
+            if gear is not None:
+                # A misread may not fit the inventory, e.g. a stray digit making a value too large
+                try:
+                    validate_gear(gear)
+                except ValueError as e:
+                    gear, error = None, 'ValueError: {}'.format(e)
+            fingerprint = fingerprints.get(path)
+            if gear is None:
+                # A worker crash isn't the screenshot's fault
+                if not error.startswith(WORKER_CRASH_ERROR):
+                    if path in video_paths:
+                        # The video couldn't be opened, there is no frame to keep
+                        fingerprint = self._image_fingerprint(path)
+                    else:
+                        self._quarantine(path, fingerprint, error)
+                    if fingerprint is not None:
+                        self.ocr_failures[fingerprint] = error
+                        changed.add('ocr_cache')
+                return path, gear, error
+
+            if fingerprint is not None and fingerprint not in self.ocr_cache:
+                self.ocr_cache[fingerprint] = copy.deepcopy(gear)
+                self.ocr_failures.pop(fingerprint, None)
+                changed.add('ocr_cache')
+
+            gear_print = gear_fingerprint(gear)
+            if self.skip_duplicates:
+                if gear_print in imported:
+                    return path, None, 'Duplicate of gear {} of this import'.format(imported[gear_print])
+                # Same screenshot as before, its gear is still there
+                duplicates = self.inventory.find_duplicates(gear) if cached else []
+                if duplicates:
+                    return path, None, 'Already imported as gear {}'.format(duplicates[0].id)
+
+            note = self._identical_note(gear)
+            imported[gear_print] = self.inventory.add(gear).id
+            changed.add('gears')
+            return path, gear, note
+
+        try:
+            yield from self.import_gear_records(record_paths, cancel)
+
+            for path in cached:
+                if cancel is not None and cancel.is_set():
+                    return
+
+                gear = copy.deepcopy(self.ocr_cache[fingerprints[path]])
+                gear.id = -1
+                yield add_gear(path, gear, None, cached=True)
+
+            if self.cores < 1 or len(image_paths) < self.cores:
+                for path in image_paths:
+                    if cancel is not None and cancel.is_set():
+                        break
+
+                    yield add_gear(*self._import_gear_aux([path])[0])
+            else:
+                # A watched folder and a manual import may share the pool, resizing it lets the other one finish
+                with self.__ocr_pool_lock:
+                    if self.__ocr_pool is None:
+                        self.__ocr_pool = OcrPool(self.cores, self.glyphs_path, self.glyphs)
+                    else:
+                        self.__ocr_pool.resize(self.cores)
+                    ocr_pool = self.__ocr_pool
+
+                # Results come back as soon as each image is read
+                for result in ocr_pool.imap_unordered(image_paths, cancel):
+                    yield add_gear(*result)
+
+            # Frames have to be decoded in order, videos are read in this process. The reader is only held while
+            # reading a frame, not while the caller handles its gear
+            for path in video_paths:
+                results = self.reader.read_video(path, cancel)
+                try:
+                    while True:
+                        with self.__reader_lock:
+                            result = next(results, None)
+                        if result is None:
+                            break
+                        yield add_gear(*result)
+                finally:
+                    with self.__reader_lock:
+                        results.close()
+        finally:
+            self.mark_dirty(gears='gears' in changed, ocr_cache='ocr_cache' in changed)
+
+    def import_gear(self, image_paths: List[str]) -> List[Tuple[str, str]]:
+        """
+        Import gear image into a Gear object and adds it to list of gears
+        Image resolution must be in 1280x720 resolution.
+
+        :param image_paths: list of image path or a string path
+        :return: list of (path, error) of images that couldn't be read
+        """
+        return [(path, error) for path, gear, error in self.import_gear_iter(image_paths) if gear is None]
+
+    def _top_results(self, results, count: int = None):
+        """
+        Sorts results from best to worst and keeps the top max_results
+
+        :param results: list of (score, final stats, loadout)
+        :param count: number of results kept instead of max_results
+        :return: top results
+        """
+        results.sort(key=lambda a: a[0], reverse=True)
+        return results[:self.max_results if count is None else count]
 
     def _optimize_aux(self, loadouts, priorities: List[str], required_sets: List[str],
-                      min_max_constraints: Dict[str, tuple], output=None):
+                      min_max_constraints: Dict[str, tuple], output=None, worker_id=0, set_patterns=None,
+                      sweep=None):
         """
         Helper function for optimize
 
@@ -390,25 +737,69 @@ class E7GearOptimizer:
         :param priorities: List of stats to focus on, priority based on position in list, 0 = highest
         :param required_sets: List of sets the loadout is required to have
         :param min_max_constraints: Final hero stats min-max constraints
-        :param output: shared output for multiprocessing
-        :return: Top 50 loadouts that meet the requirements
+        :param output: shared output for multiprocessing, receives (worker_id, done, results) every
+                       partial_results_interval seconds and once done, results only holding the entries found since the
+                       previous message that made the top. The main process' output is checked on the same timer, hits
+                       or not, so it drains worker output meanwhile
+        :param worker_id: ID of the worker in the output messages
+        :param set_patterns: list of set patterns, lists of sets that must all be present, replacing required_sets
+        :param sweep: (stat, ascending thresholds, count), results are kept by highest threshold of stat met instead
+        :return: dict of set pattern index, threshold index with a sweep, or None -> top max_results (count with a
+                 sweep) (score, final stats, loadout) that meet the requirements
         """
-        results = []
+        if sweep is not None:
+            sweep_stat, thresholds, count = sweep
+            results = {i: [] for i in range(len(thresholds))}
+        elif set_patterns is not None:
+            count = None
+            results = {i: [] for i in range(len(set_patterns))}
+        else:
+            count = None
+            results = {None: []}
+        # Results found since the last output
+        new_results = {pattern: [] for pattern in results}
+
+        def send(done):
+            trimmed = {}
+            for pattern, top in results.items():
+                trimmed[pattern] = self._top_results(top, count)
+                # Entries under the top's cutoff were dropped by the trim
+                kept = {id(result) for result in trimmed[pattern]}
+                new_results[pattern] = [result for result in new_results[pattern] if id(result) in kept]
+            output.put((worker_id, done, new_results))
+            return trimmed
+
+        last_output = time.monotonic()
         for loadout in loadouts:
+            # Worker output is sent, and drained by the main process, whether or not loadouts qualify
+            if output and time.monotonic() - last_output >= self.partial_results_interval:
+                if worker_id == 0 or any(new_results.values()):
+                    results = send(False)
+                    new_results = {pattern: [] for pattern in results}
+                last_output = time.monotonic()
+
             loadout.post_init()
 
-            # Skip if loadout doesn't contain the required sets
-            if len(required_sets) != 0:
-                if len(loadout.set) == 0:
-                    continue
-                else:
-                    if not any(r_set in loadout.set for r_set in required_sets):
+            if set_patterns is None:
+                # Skip if loadout doesn't contain the required sets
+                if len(required_sets) != 0:
+                    if len(loadout.set) == 0:
                         continue
+                    else:
+                        if not any(r_set in loadout.set for r_set in required_sets):
+                            continue
+                matched = [None]
+            else:
+                # Tag the loadout with every pattern it satisfies
+                matched = [i for i, pattern in enumerate(set_patterns)
+                           if all(gear_set in loadout.set for gear_set in pattern)]
+                if not matched:
+                    continue
 
             # Calculate hero's final stats
             final_stats = {}
             for stat, multipliers in loadout.stats_given.items():
-                final_stats[stat] = int(self.hero_base_stat[stat] * (1 + multipliers[0] / 100) + multipliers[1])
+                final_stats[stat] = Loadout.final_stat(self.hero_base_stat[stat], *multipliers)
 
             # Check if stats meet min-max constraints
             within_constraint = True
@@ -416,51 +807,50 @@ class E7GearOptimizer:
                 if not (min_max[0] <= final_stats[stat] <= min_max[1]):
                     within_constraint = False
 
+            if within_constraint and sweep is not None:
+                # Highest threshold met, the curve is merged from the highest threshold down once done
+                threshold = bisect.bisect_right(thresholds, final_stats[sweep_stat]) - 1
+                within_constraint = threshold >= 0
+                matched = [threshold]
+
             # Add to output
             if within_constraint:
-                results.append((final_stats, loadout))
-
-        results.sort(key=lambda a: self.score_final_stats(a[0], priorities), reverse=True)
-        results = results[:50]
+                result = (self.score_final_stats(final_stats, priorities), final_stats, loadout)
+                for pattern in matched:
+                    results[pattern].append(result)
+                    if output:
+                        new_results[pattern].append(result)
 
         if output:
-            output.put(results)
-        return results
+            return send(True)
+        return {pattern: self._top_results(top, count) for pattern, top in results.items()}
 
-    def optimize(self, priorities: List[str], required_sets: List[str], min_max_constraints: Dict[str, tuple]):
+    def _candidate_slots(self, priorities: List[str], preferred_sets: List[int]) -> List[List[Gear]]:
         """
-        Optimizes best gear loadout based on parameters passed in and saves it into a list before sorting the output
-        list from best to worst using eDPS/eHP as a scoring
-        factor.
+        Picks the best unused gears of each slot, optimize() combines them into loadouts
 
         :param priorities: List of stats to focus on, priority based on position in list, 0 = highest
-        :param required_sets: List of sets the loadout is required to have
-        :param min_max_constraints: Final hero stats min-max constraints
-        :return: None
+        :param preferred_sets: sets whose gears are preferred
+        :return: list of candidate gears for each gear type
         """
-        # No hero selected
-        if self.hero_base_stat is None:
-            return
-        if len(self.gears) == 0:
-            return
-
-        self.optimizer_output.clear()
-        print("Starting optimizer")
-
-        # Grab/sort/grade equips for smaller combination
-        weapons = [x for x in self.gears if x.type == GearType.Weapon.value if not x.in_use]
-        helmets = [x for x in self.gears if x.type == GearType.Helmet.value if not x.in_use]
-        armors = [x for x in self.gears if x.type == GearType.Armor.value if not x.in_use]
-        necklaces = [x for x in self.gears if x.type == GearType.Necklace.value if not x.in_use]
-        rings = [x for x in self.gears if x.type == GearType.Ring.value if not x.in_use]
-        boots = [x for x in self.gears if x.type == GearType.Boot.value if not x.in_use]
-
-        weapons.sort(key=lambda x: self.score_gear(x, required_sets, priorities), reverse=True)
-        helmets.sort(key=lambda x: self.score_gear(x, required_sets, priorities), reverse=True)
-        armors.sort(key=lambda x: self.score_gear(x, required_sets, priorities), reverse=True)
-        necklaces.sort(key=lambda x: self.score_gear(x, required_sets, priorities), reverse=True)
-        rings.sort(key=lambda x: self.score_gear(x, required_sets, priorities), reverse=True)
-        boots.sort(key=lambda x: self.score_gear(x, required_sets, priorities), reverse=True)
+        # Grab/sort/grade equips for smaller combination. Scoring and combining read every stat many times, so the
+        # gears are materialized out of the inventory store once
+        def candidates(gear_type: GearType) -> List[Gear]:
+            return [gear.to_gear() for gear in self.inventory.query(gear_type=gear_type.value, in_use=False)]
+
+        weapons = candidates(GearType.Weapon)
+        helmets = candidates(GearType.Helmet)
+        armors = candidates(GearType.Armor)
+        necklaces = candidates(GearType.Necklace)
+        rings = candidates(GearType.Ring)
+        boots = candidates(GearType.Boot)
+
+        weapons.sort(key=lambda x: self.score_gear(x, preferred_sets, priorities), reverse=True)
+        helmets.sort(key=lambda x: self.score_gear(x, preferred_sets, priorities), reverse=True)
+        armors.sort(key=lambda x: self.score_gear(x, preferred_sets, priorities), reverse=True)
+        necklaces.sort(key=lambda x: self.score_gear(x, preferred_sets, priorities), reverse=True)
+        rings.sort(key=lambda x: self.score_gear(x, preferred_sets, priorities), reverse=True)
+        boots.sort(key=lambda x: self.score_gear(x, preferred_sets, priorities), reverse=True)
 
         # top 10 equipments, lowers combinations to 10^6
         weapons = weapons[:10]
@@ -470,36 +860,528 @@ class E7GearOptimizer:
         rings = rings[:10]
         boots = boots[:10]
 
-        loadouts = [Loadout(loadout) for loadout in product(weapons, helmets, armors, necklaces, rings, boots)]
-        results = []
+        return [weapons, helmets, armors, necklaces, rings, boots]
+
+    def _unused_contributions(self):
+        """
+        Reads every unused gear as a row of what it adds to Loadout.stats_given, straight from the inventory arrays
+
+        :return: (gear ids, gear types, gear sets, (gears, STAT_COUNT * 2) int64 array of (%, flat) contributions)
+        """
+        columns = {name: np.frombuffer(column, dtype=column.typecode)
+                   for name, column in self.inventory.columns.items()}
+        rows = np.flatnonzero((columns['id'] >= 0) & (columns['in_use'] == 0))
+        stat_type = columns['stat_type'].reshape(-1, SNAPSHOT_STATS)[rows]
+        stat_flat = columns['stat_flat'].reshape(-1, SNAPSHOT_STATS)[rows]
+        stat_value = columns['stat_value'].reshape(-1, SNAPSHOT_STATS)[rows]
+        has_stat = stat_type != SNAPSHOT_NO_STAT
+        cells = np.nonzero(has_stat)[0] * (STAT_COUNT * 2) + stat_type[has_stat].astype(np.intp) * 2 + \
+            stat_flat[has_stat]
+        contribution = np.bincount(cells, stat_value[has_stat], len(rows) * STAT_COUNT * 2).astype(np.int64)
+        contribution = contribution.reshape(len(rows), STAT_COUNT * 2)
+        return (columns['id'][rows], columns['type'][rows].astype(np.intp), columns['set'][rows].astype(np.intp),
+                contribution)
+
+    def _slot_contributions(self, slots: List[List[Gear]] = None):
+        """
+        :param slots: candidate gears of each gear type, every unused gear if None, read from the inventory arrays
+        :return: (slot index of each gear, gear sets, (gears, STAT_COUNT * 2) int64 array of (%, flat) contributions)
+        """
+        if slots is None:
+            return self._unused_contributions()[1:]
+        gear_slots = np.array([i for i, gears in enumerate(slots) for _ in gears], dtype=np.intp)
+        gear_sets = np.array([gear.set for gears in slots for gear in gears], dtype=np.intp)
+        contribution = np.array([_stat_contribution([gear.main_stat] + list(gear.substats))
+                                 for gears in slots for gear in gears], dtype=np.int64).reshape(-1, STAT_COUNT * 2)
+        return gear_slots, gear_sets, contribution
+
+    def stat_bounds(self, slots: List[List[Gear]] = None) -> Dict[str, Tuple[int, int]]:
+        """
+        Bounds the final stats of the loadouts combining one gear of each slot, from the lowest and highest
+        contribution of each slot, the set bonuses enough slots can complete and hero_base_stat. Nothing is enumerated,
+        so not every value between the bounds is reachable, but no loadout goes past them.
+
+        :param slots: candidate gears of each gear type, every unused gear if None, read from the inventory arrays
+        :return: dict of stat -> (lowest, highest) final value
+        """
+        gear_slots, gear_sets, contribution = self._slot_contributions(slots)
+
+        stat_names = [stat.name for stat in _stat_order()]
+        base_stats = [self.hero_base_stat[name] for name in stat_names]
+        low = np.array([Loadout.stat_units(base, 100, 0) for base in base_stats], dtype=np.int64)
+        high = low.copy()
+        # What each gear adds to each final stat, % stats scale with the base stat
+        values = np.stack([Loadout.stat_units(base, contribution[:, i * 2], contribution[:, i * 2 + 1])
+                           for i, base in enumerate(base_stats)], axis=-1)
+        for slot in np.unique(gear_slots):
+            slot_values = values[gear_slots == slot]
+            low += slot_values.min(axis=0)
+            high += slot_values.max(axis=0)
+
+        # Set bonuses only raise stats, and at most once per set since they need an exact piece count
+        slot_sets = np.zeros((len(GearType), len(GearSet)), dtype=bool)
+        slot_sets[gear_slots, gear_sets] = True
+        for gear_set in GearSet:
+            bonus = Loadout.set_bonus(gear_set.value)
+            slots_of_set = int(slot_sets[:, gear_set.value].sum())
+            if bonus is not None and slots_of_set >= Loadout.set_requirement(gear_set.value):
+                high[bonus.type] += Loadout.stat_units(base_stats[bonus.type], *((0, bonus.value) if bonus.is_flat
+                                                                                  else (bonus.value, 0)))
+
+        return {name: (int(low[i] // FINAL_STAT_UNITS), int(high[i] // FINAL_STAT_UNITS))
+                for i, name in enumerate(stat_names)}
+
+    def check_constraints(self, min_max_constraints: Dict[str, tuple],
+                          slots: List[List[Gear]] = None) -> List[ConstraintGap]:
+        """
+        Finds the min-max constraints no loadout can meet from stat_bounds(), without enumerating loadouts
 
+        :param min_max_constraints: Final hero stats min-max constraints
+        :param slots: candidate gears of each gear type, e.g. optimize()'s, every unused gear if None
+        :return: list of ConstraintGap, empty if the constraints may be met
+        """
+        bounds = self.stat_bounds(slots)
+        gaps = []
+        for stat, (minimum, maximum) in min_max_constraints.items():
+            reachable_min, reachable_max = bounds[stat]
+            if minimum > reachable_max or maximum < reachable_min:
+                gaps.append(ConstraintGap(stat, minimum, maximum, reachable_min, reachable_max, slots is not None))
+        return gaps
+
+    def stat_distribution(self, stat: str, slots: List[List[Gear]] = None) -> Dict[int, int]:
+        """
+        Counts the loadouts reaching each final value of a stat, among every combination of one gear of each slot.
+
+        Loadouts aren't enumerated: the distribution of the % and flat sums the slots add up to is built one slot at a
+        time, combining it with the distinct values of the slot's gears while keeping apart the piece counts of the set
+        whose bonus raises the stat. Only the sums reached are kept, and they are turned into final values once done, so
+        % stats cost no more than flat ones. Counts are exact, final values are those of optimize(), and cover the whole
+        inventory rather than optimize()'s candidates.
+
+        :param stat: stat name, e.g. 'Speed'
+        :param slots: candidate gears of each gear type, every unused gear if None
+        :return: dict of final value -> number of loadouts, from lowest to highest value
+        """
+        return {values[0]: count for values, count in self._stat_distribution([stat], slots).items()}
+
+    def joint_stat_distribution(self, stat_a: str, stat_b: str,
+                                slots: List[List[Gear]] = None) -> Dict[Tuple[int, int], int]:
+        """
+        Counts the loadouts reaching each pair of final values of two stats, like stat_distribution()
+
+        :param stat_a: first stat name, e.g. 'Speed'
+        :param stat_b: second stat name, e.g. 'Crit. C'
+        :param slots: candidate gears of each gear type, every unused gear if None
+        :return: dict of (final value of stat_a, final value of stat_b) -> number of loadouts
+        """
+        return self._stat_distribution([stat_a, stat_b], slots)
+
+    @staticmethod
+    def count_at_least(distribution: dict, minimum) -> int:
+        """
+        :param distribution: stat_distribution() or joint_stat_distribution() output
+        :param minimum: minimum final value, or pair of minimums for a joint distribution
+        :return: number of loadouts reaching the minimum
+        """
+        if isinstance(minimum, tuple):
+            return sum(count for values, count in distribution.items()
+                       if all(value >= low for value, low in zip(values, minimum)))
+        return sum(count for value, count in distribution.items() if value >= minimum)
+
+    def _stat_distribution(self, stats: List[str], slots: List[List[Gear]] = None) -> Dict[tuple, int]:
+        """
+        Helper function for stat_distribution and joint_stat_distribution
+
+        :param stats: stat names
+        :param slots: candidate gears of each gear type, every unused gear if None
+        :return: dict of tuple of final values of stats -> number of loadouts
+        """
+        gear_slots, gear_sets, contribution = self._slot_contributions(slots)
+        slot_count = len(GearType) if slots is None else len(slots)
+        slot_gears = [np.flatnonzero(gear_slots == slot) for slot in range(slot_count)]
+        if not all(len(gears) for gears in slot_gears):
+            return {}
+
+        stat_names = [stat.name for stat in _stat_order()]
+        columns = [stat_names.index(stat) for stat in stats]
+        base_stats = [self.hero_base_stat[stat] for stat in stats]
+
+        # Sets whose bonus raises one of the stats, as (stat position, set, piece requirement, bonus)
+        bonus_sets = []
+        for gear_set in GearSet:
+            bonus = Loadout.set_bonus(gear_set.value)
+            if bonus is not None and bonus.type in columns:
+                bonus_sets.append((columns.index(bonus.type), gear_set.value, Loadout.set_requirement(gear_set.value),
+                                   bonus))
+
+        # What each gear adds: a piece to each bonus set, then the % and flat sums of each stat
+        pieces = gear_sets[:, None] == np.array([gear_set for _, gear_set, _, _ in bonus_sets], dtype=np.intp)
+        rows = np.concatenate([pieces.astype(np.int64),
+                               contribution[:, [column * 2 + i for column in columns for i in (0, 1)]]], axis=1)
+        # A state is kept as one number, its columns as digits wide enough for the highest sum, piece counts past the
+        # requirement are merged as the bonus needs the exact count, with room for the piece added before merging
+        caps = [requirement + 1 for _, _, requirement, _ in bonus_sets]
+        radices = [cap + 2 for cap in caps] + [int(high) + 1 for high in
+                                               sum(rows[gears].max(axis=0) for gears in slot_gears)[len(bonus_sets):]]
+        places = [math.prod(radices[i + 1:]) for i in range(len(radices))]
+        # The highest final values, with every bonus of the stat
+        final_radices = [Loadout.final_stat(base, *(radices[len(bonus_sets) + d * 2 + i] - 1 +
+                                                    sum(bonus.value for bonus_d, _, _, bonus in bonus_sets
+                                                        if bonus_d == d and bonus.is_flat == i) for i in (0, 1))) + 1
+                         for d, base in enumerate(base_stats)]
+        # Python ints when a state or the number of loadouts overflows int64
+        dtype = np.int64 if np.prod([len(gears) for gears in slot_gears], dtype=np.float64) < 2 ** 62 else object
+
+        def encode(digits, radices):
+            """
+            :param digits: list of int arrays, one per column
+            :return: state of each row, its columns as digits in the given radices
+            """
+            key_dtype = np.int64 if math.prod(radices) < 2 ** 62 else object
+            states = np.zeros(len(digits[0]), dtype=key_dtype)
+            for column, radix in zip(digits, radices):
+                states = states * radix + column.astype(key_dtype)
+            return states
+
+        def decode(states, radices):
+            """
+            :return: list of int arrays, the digits of states in the given radices, one per column
+            """
+            return [states // math.prod(radices[i + 1:]) % radix for i, radix in enumerate(radices)]
+
+        def final_states(digits):
+            """
+            :param digits: digits of states in radices
+            :return: final values of the states encoded in final_radices, with the bonuses of the sets at their exact
+                     piece count
+            """
+            finals = []
+            for d, base in enumerate(base_stats):
+                given = digits[len(bonus_sets) + d * 2:len(bonus_sets) + d * 2 + 2]
+                for k, (bonus_d, _, requirement, bonus) in enumerate(bonus_sets):
+                    if bonus_d == d:
+                        given[bonus.is_flat] = given[bonus.is_flat] + np.where(digits[k] == requirement, bonus.value, 0)
+                finals.append(Loadout.final_stat(base, *given))
+            return encode(finals, final_radices)
+
+        def merge(states, counts):
+            """
+            Adds up the counts of the same state
+
+            :return: (distinct states, their counts)
+            """
+            order = np.argsort(states)
+            states = states[order]
+            starts = np.concatenate(([0], np.flatnonzero(states[1:] != states[:-1]) + 1))
+            return states[starts], np.add.reduceat(counts[order], starts)
+
+        # Slot by slot, the states reached so far with each distinct state of the slot's gears
+        keys = encode(list(rows.T), radices)
+        states, counts = np.zeros(1, dtype=keys.dtype), np.ones(1, dtype=dtype)
+        for slot, gears in enumerate(slot_gears):
+            values, value_counts = merge(keys[gears], np.ones(len(gears), dtype=dtype))
+            value_digits = decode(values, radices)
+            chunk = max(1, STAT_DISTRIBUTION_CHUNK // len(values))
+            parts = []
+            for start in range(0, len(states), chunk):
+                if slot == len(slot_gears) - 1:
+                    # Far fewer final values than sums, the last slot's sums are never kept
+                    combined = final_states([(state[:, None] + value[None, :]).reshape(-1) for state, value in
+                                             zip(decode(states[start:start + chunk], radices), value_digits)])
+                else:
+                    combined = (states[start:start + chunk, None] + values[None, :]).reshape(-1)
+                    for cap, place, radix in zip(caps, places, radices):
+                        have = combined // place % radix
+                        combined -= (have - np.minimum(have, cap)) * place
+                parts.append(merge(combined, (counts[start:start + chunk, None] * value_counts[None, :]).reshape(-1)))
+                # Merged as they pile up past the states merged so far
+                if sum(len(part[0]) for part in parts[1:]) > max(len(parts[0][0]), STAT_DISTRIBUTION_CHUNK):
+                    parts = [merge(np.concatenate([part[0] for part in parts]),
+                                   np.concatenate([part[1] for part in parts]))]
+            states, counts = merge(np.concatenate([part[0] for part in parts]),
+                                   np.concatenate([part[1] for part in parts]))
+
+        return {tuple(int(value) for value in values): int(count)
+                for values, count in zip(zip(*decode(states, final_radices)), counts)}
+
+    def _evaluate(self, loadouts: List[Loadout], priorities: List[str], required_sets: List[str],
+                  min_max_constraints: Dict[str, tuple], set_patterns=None, sweep=None,
+                  publish: bool = True) -> '_PartialResults':
+        """
+        Runs _optimize_aux over the loadouts, split between the main process and cores worker processes
+
+        :param loadouts: List of loadouts combinations to check
+        :param priorities: List of stats to focus on, priority based on position in list, 0 = highest
+        :param required_sets: List of sets the loadout is required to have
+        :param min_max_constraints: Final hero stats min-max constraints
+        :param set_patterns: see _optimize_aux
+        :param sweep: see _optimize_aux
+        :param publish: whether partial_results_callback receives snapshots while running
+        :return: results of every worker
+        """
+        count = None if sweep is None else sweep[2]
         if len(loadouts) < self.cores:
-            output = self._optimize_aux(loadouts, priorities, required_sets, min_max_constraints)
-            results.extend(output)
+            results = _PartialResults(self, publish=publish, count=count)
+            self._optimize_aux(loadouts, priorities, required_sets, min_max_constraints, results,
+                               set_patterns=set_patterns, sweep=sweep)
         else:
-            mp_output = mp.Queue(maxsize=self.cores)
+            mp_output = mp.Queue()
+            results = _PartialResults(self, mp_output, publish, count)
             processes = []
             for x in range(self.cores):
                 p = mp.Process(target=self._optimize_aux, args=(loadouts[x + 1::self.cores + 1], priorities,
-                                                                required_sets, min_max_constraints, mp_output))
+                                                                required_sets, min_max_constraints, mp_output,
+                                                                x + 1, set_patterns, sweep))
                 processes.append(p)
                 p.start()
 
-            output = self._optimize_aux(loadouts[::self.cores + 1], priorities, required_sets, min_max_constraints)
-            results.extend(output)
+            # Main process' share also drains worker output every time it has partial results
+            self._optimize_aux(loadouts[::self.cores + 1], priorities, required_sets, min_max_constraints, results,
+                               set_patterns=set_patterns, sweep=sweep)
 
-            # Get results, sort and put top 50 into results
-            for _ in processes:
-                results.extend(mp_output.get())
+            # Get remaining results
+            while results.workers_done < len(processes):
+                results.put(mp_output.get())
 
             # Join processes
             for process in processes:
                 process.join()
 
-        results.sort(key=lambda a: self.score_final_stats(a[0], priorities), reverse=True)
-        self.optimizer_output = results[:50]
+        return results
+
+    def optimize(self, priorities: List[str], required_sets: List[str], min_max_constraints: Dict[str, tuple],
+                 set_patterns: List[List[int]] = None):
+        """
+        Optimizes best gear loadout based on parameters passed in and saves it into a list before sorting the output
+        list from best to worst using eDPS/eHP as a scoring
+        factor.
+
+        Several set patterns (e.g. Speed + Critical, Speed + Hit, Destruction + Critical) can be compared in a single
+        pass: candidates are enumerated once, every loadout is tagged with the patterns it satisfies and each pattern
+        keeps its own top max_results in pattern_outputs. optimizer_output then holds the best loadouts of all
+        patterns.
+
+        While running, partial_results_callback (if set) receives snapshots of the best loadouts found so far.
+
+        :param priorities: List of stats to focus on, priority based on position in list, 0 = highest
+        :param required_sets: List of sets the loadout is required to have, any of them, ignored when set_patterns is
+                              given
+        :param min_max_constraints: Final hero stats min-max constraints
+        :param set_patterns: List of set patterns, each a list of sets the loadout is required to have all of, replaces
+                             required_sets when given
+        :return: None
+        """
+        self.constraint_gaps = []
+        # No hero selected
+        if self.hero_base_stat is None:
+            return
+        if len(self.inventory) == 0:
+            return
+
+        self.optimizer_output.clear()
+        self.pattern_outputs = []
+        print("Starting optimizer")
+
+        # Gears of the wanted sets are preferred when narrowing down candidates
+        preferred_sets = required_sets if set_patterns is None else sorted(set(itertools.chain(*set_patterns)))
+        slots = self._candidate_slots(priorities, preferred_sets)
+
+        # Impossible constraints are reported before enumerating anything
+        self.constraint_gaps = self.check_constraints(min_max_constraints, slots)
+        if self.constraint_gaps:
+            print("Constraints out of reach:", ', '.join(str(gap) for gap in self.constraint_gaps))
+            return
+
+        loadouts = [Loadout(loadout) for loadout in product(*slots)]
+        results = self._evaluate(loadouts, priorities, required_sets, min_max_constraints, set_patterns=set_patterns)
+
+        self.optimizer_output = results.snapshot()
+        if set_patterns is not None:
+            self.pattern_outputs = [results.snapshot(i) for i in range(len(set_patterns))]
         print("Finished optimization")
 
+    def sweep_constraint(self, priorities: List[str], required_sets: List[str], min_max_constraints: Dict[str, tuple],
+                         stat: str, thresholds: List[int], max_results: int = 1) -> List[Tuple[int, float, list]]:
+        """
+        Finds the best loadouts for a series of minimums of one stat, e.g. the best attack at speed >= 200, 210, ...
+        260, as a tradeoff curve.
+
+        The candidate loadouts are evaluated once: each one meeting the other constraints is kept among the top
+        max_results of the highest threshold it reaches, then the curve is built in a single pass from the highest
+        threshold down, every threshold's best loadouts being its own merged with the ones of the threshold above.
+
+        The sweep doesn't publish partial results, its loadouts mix thresholds until the curve is built.
+
+        :param priorities: List of stats to focus on, priority based on position in list, 0 = highest
+        :param required_sets: List of sets the loadout is required to have
+        :param min_max_constraints: Final hero stats min-max constraints, a constraint on the swept stat is ignored
+        :param stat: swept stat, e.g. 'Speed'
+        :param thresholds: minimums of the swept stat
+        :param max_results: number of loadouts kept per threshold
+        :return: list of (threshold, best score or None if unreachable, best (final stats, loadout) from best to
+                 worst) in ascending threshold order
+        """
+        self.constraint_gaps = []
+        if self.hero_base_stat is None or len(self.inventory) == 0:
+            return []
+
+        thresholds = sorted(set(thresholds))
+        min_max_constraints = {name: min_max for name, min_max in min_max_constraints.items() if name != stat}
+        slots = self._candidate_slots(priorities, required_sets)
+
+        self.constraint_gaps = self.check_constraints(min_max_constraints, slots)
+        if self.constraint_gaps:
+            return [(threshold, None, []) for threshold in thresholds]
+
+        loadouts = [Loadout(loadout) for loadout in product(*slots)]
+        results = self._evaluate(loadouts, priorities, required_sets, min_max_constraints,
+                                 sweep=(stat, thresholds, max_results), publish=False)
+
+        curve = []
+        best = []
+        for i in reversed(range(len(thresholds))):
+            best = self._top_results(best + results.results(i), max_results)
+            curve.append((thresholds[i], best[0][0] if best else None,
+                          [(final_stats, loadout) for _, final_stats, loadout in best]))
+        curve.reverse()
+        return curve
+
+    def suggest_upgrades(self, hero: str, priorities: List[str], required_sets: List[str],
+                         min_max_constraints: Dict[str, tuple], max_results: int = 20, two_piece: bool = False):
+        """
+        Suggests the unused gears improving a hero's saved loadout the most when swapped in.
+
+        Every candidate is evaluated as a delta on the saved loadout's stats_given, including the set bonuses it
+        completes or breaks, and the whole inventory is scored at once from the inventory arrays instead of building a
+        Loadout per candidate. Two piece swaps only combine, for each slot, the UPGRADE_PAIR_CANDIDATES best single
+        swaps and the UPGRADE_PAIR_SET_CANDIDATES best single swaps of each set, so set bonuses only reached with two
+        new pieces are still found.
+
+        :param hero: hero name in hero_loadouts, hero_base_stat must hold that hero's base stats
+        :param priorities: List of stats to focus on, priority based on position in list, 0 = highest
+        :param required_sets: List of sets the loadout is required to have
+        :param min_max_constraints: Final hero stats min-max constraints
+        :param max_results: number of suggestions returned
+        :param two_piece: also suggest swapping two pieces at once
+        :return: list of (score improvement, final stats, gears swapped in) from best to worst, each gear replaces the
+                 saved gear of its slot
+        """
+        if self.hero_base_stat is None or hero not in self.hero_loadouts:
+            return []
+
+        current = {}
+        for gear_id in self.hero_loadouts[hero]:
+            if gear_id in self.inventory:
+                gear = self.inventory.get(gear_id).to_gear()
+                current[gear.type] = gear
+        loadout = Loadout(tuple(current.values()))
+        loadout.post_init()
+
+        stat_names = [stat.name for stat in _stat_order()]
+        base_stats = [self.hero_base_stat[name] for name in stat_names]
+        base_given = np.array([loadout.stats_given[name][column] for name in stat_names for column in (0, 1)],
+                              dtype=np.float64)
+        current_contribution = np.zeros((len(GearType), STAT_COUNT * 2))
+        for slot, gear in current.items():
+            current_contribution[slot] = _stat_contribution([gear.main_stat] + list(gear.substats))
+        set_counts = [0] * len(GearSet)
+        for gear in current.values():
+            set_counts[gear.set] += 1
+
+        def set_effect(swaps):
+            """
+            :param swaps: list of (slot, set) swapped in
+            :return: (change of stats_given from set bonuses gained or lost, whether a required set is complete)
+            """
+            counts = list(set_counts)
+            for slot, gear_set in swaps:
+                if slot in current:
+                    counts[current[slot].set] -= 1
+                counts[gear_set] += 1
+
+            delta = np.zeros(STAT_COUNT * 2)
+            for gear_set in range(len(GearSet)):
+                # Bonus only applies with exactly the required piece count
+                requirement = Loadout.set_requirement(gear_set)
+                before, after = set_counts[gear_set] == requirement, counts[gear_set] == requirement
+                bonus = Loadout.set_bonus(gear_set)
+                if before != after and bonus is not None:
+                    delta[bonus.type * 2 + (1 if bonus.is_flat else 0)] += bonus.value if after else -bonus.value
+
+            complete = not required_sets or any(counts[gear_set] == Loadout.set_requirement(gear_set)
+                                                for gear_set in required_sets)
+            return delta, complete
+
+        def score(given):
+            """
+            :param given: stats_given as (%, flat) columns, any leading shape
+            :return: (scores, final stats, whether within constraints)
+            """
+            given = np.rint(given).astype(np.int64)
+            final = np.stack([Loadout.final_stat(base, given[..., i * 2], given[..., i * 2 + 1])
+                              for i, base in enumerate(base_stats)], axis=-1)
+            valid = np.ones(final.shape[:-1], dtype=bool)
+            for stat, (low, high) in min_max_constraints.items():
+                column = final[..., stat_names.index(stat)]
+                valid &= (low <= column) & (column <= high)
+            scores = self.score_final_stats({name: final[..., i] for i, name in enumerate(stat_names)}, priorities)
+            return np.broadcast_to(scores, valid.shape), final, valid
+
+        base_score = float(score(base_given)[0])
+
+        # Every unused gear as a row of (%, flat) contributions
+        gear_ids, slots, sets, contribution = self._unused_contributions()
+        delta = contribution - current_contribution[slots]
+
+        # Set effects only depend on the slot and set swapped in
+        single_effects = np.zeros((len(GearType), len(GearSet), STAT_COUNT * 2))
+        single_complete = np.zeros((len(GearType), len(GearSet)), dtype=bool)
+        for slot in range(len(GearType)):
+            for gear_set in range(len(GearSet)):
+                single_effects[slot, gear_set], single_complete[slot, gear_set] = set_effect([(slot, gear_set)])
+
+        scores, finals, valid = score(base_given + delta + single_effects[slots, sets])
+        improvements = scores - base_score
+        valid &= single_complete[slots, sets] & (improvements > 0)
+
+        # (improvement, final stats, indexes of the candidates swapped in)
+        results = [(improvements[i], finals[i], (i,)) for i in np.flatnonzero(valid)]
+
+        if two_piece:
+            # Prune each slot to its best single swaps overall and per set, constraints aside as a second piece may
+            # fix them
+            pruned = {}
+            for i in np.argsort(-scores, kind='stable'):
+                slot_candidates, set_picks = pruned.setdefault(slots[i], ([], Counter()))
+                if len(slot_candidates) < UPGRADE_PAIR_CANDIDATES or \
+                        set_picks[sets[i]] < UPGRADE_PAIR_SET_CANDIDATES:
+                    slot_candidates.append(i)
+                    set_picks[sets[i]] += 1
+
+            for slot_a, slot_b in combinations(sorted(pruned), 2):
+                a = np.array(pruned[slot_a][0])
+                b = np.array(pruned[slot_b][0])
+                effects = {}
+                complete = {}
+                for set_a in set(sets[a]):
+                    for set_b in set(sets[b]):
+                        effects[set_a, set_b], complete[set_a, set_b] = set_effect([(slot_a, set_a),
+                                                                                    (slot_b, set_b)])
+                pair_effects = np.array([[effects[set_a, set_b] for set_b in sets[b]] for set_a in sets[a]])
+                pair_complete = np.array([[complete[set_a, set_b] for set_b in sets[b]] for set_a in sets[a]])
+
+                pair_scores, pair_finals, pair_valid = score(
+                    base_given + delta[a][:, None, :] + delta[b][None, :, :] + pair_effects)
+                pair_improvements = pair_scores - base_score
+                pair_valid &= pair_complete & (pair_improvements > 0)
+                for i, j in zip(*np.nonzero(pair_valid)):
+                    results.append((pair_improvements[i, j], pair_finals[i, j], (a[i], b[j])))
+
+        results.sort(key=lambda a: a[0], reverse=True)
+        return [(float(improvement), {name: int(final[i]) for i, name in enumerate(stat_names)},
+                 tuple(self.inventory.get(int(gear_ids[i])).to_gear() for i in candidates))
+                for improvement, final, candidates in results[:max_results]]
+
     def get_gear(self, gear_id: int) -> Gear:
         """
         Returns the gear given gear ID
@@ -507,18 +1389,7 @@ class E7GearOptimizer:
         :param gear_id: ID of the gear
         :return: Gear with the given ID
         """
-        start = 0
-        end = len(self.gears) - 1
-        while start <= end:
-            idx = (start + end) // 2
-            if self.gears[idx].id == gear_id:
-                return self.gears[idx]
-            elif self.gears[idx].id > gear_id:
-                end = idx - 1
-            else:
-                start = idx + 1
-
-        raise IndexError('Gear ID not found in inventory...')
+        return self.inventory.get(gear_id)
 
     def set_gear_usage(self, gear_id: int, in_use: bool):
         """
@@ -528,16 +1399,119 @@ class E7GearOptimizer:
         :param in_use: whether it's in use or not
         :return None
         """
-        start = 0
-        end = len(self.gears) - 1
-        while start <= end:
-            idx = (start + end) // 2
-            if self.gears[idx].id == gear_id:
-                self.gears[idx].in_use = in_use
-                return
-            elif self.gears[idx].id > gear_id:
-                end = idx - 1
-            else:
-                start = idx + 1
+        self.inventory.set_usage(gear_id, in_use)
+        self.mark_dirty(gears=True)
+
+    def delete_gear(self, gear_id: int) -> Gear:
+        """
+        Deletes a gear from the inventory and from any hero loadout using it
+
+        :param gear_id: ID of gear
+        :return: the deleted gear
+        """
+        gear = self.inventory.remove(gear_id)
+
+        loadouts_changed = False
+        for hero, gear_ids in list(self.hero_loadouts.items()):
+            if gear_id in gear_ids:
+                del self.hero_loadouts[hero]
+                loadouts_changed = True
+                for other_id in gear_ids:
+                    if other_id != gear_id and other_id in self.inventory:
+                        self.inventory.set_usage(other_id, False)
+
+        self.mark_dirty(gears=True, loadouts=loadouts_changed)
+        return gear
+
+
+def _stat_order() -> List[GearStat]:
+    """
+    :return: GearStat members in value order, one per stat
+    """
+    return [GearStat(value) for value in sorted({stat.value for stat in GearStat})]
+
+
+def _stat_contribution(stats: List[Stat]) -> tuple:
+    """
+    Flattens stats into what they add to Loadout.stats_given
+
+    :param stats: list of Stat
+    :return: tuple of (%, flat) for each stat in GearStat value order
+    """
+    contribution = [0] * (STAT_COUNT * 2)
+    for stat in stats:
+        contribution[stat.type * 2 + (1 if stat.is_flat else 0)] += stat.value
+    return tuple(contribution)
+
+
+class _PartialResults:
+    """
+    Collects the best results of every optimizer worker and publishes merged snapshots through the optimizer's
+    partial_results_callback, at most every partial_results_interval seconds.
+    """
+
+    def __init__(self, optimizer: 'E7GearOptimizer', queue=None, publish: bool = True, count: int = None):
+        """
+        :param optimizer: optimizer the workers run for
+        :param queue: output of the worker processes, drained whenever the main process puts its results
+        :param publish: whether partial_results_callback receives snapshots
+        :param count: number of results kept per worker and key, None for max_results
+        """
+        self.__optimizer = optimizer
+        self.__queue = queue
+        self.__publish = publish
+        self.__count = count
+        self.__results = {}
+        self.__last_publish = time.monotonic()
+        self.workers_done = 0
+
+    def put(self, message):
+        """
+        :param message: (worker_id, done, results found since its previous message), see E7GearOptimizer._optimize_aux
+        :return: None
+        """
+        worker_id, done, new_results = message
+        worker_results = self.__results.setdefault(worker_id, {})
+        for key, new in new_results.items():
+            worker_results[key] = self.__optimizer._top_results(worker_results.get(key, []) + new, self.__count)
+        if done and worker_id != 0:
+            self.workers_done += 1
+
+        # Pick up whatever the workers sent meanwhile
+        if self.__queue is not None and worker_id == 0:
+            while True:
+                try:
+                    self.put(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+
+        if self.__publish and self.__optimizer.partial_results_callback and \
+                time.monotonic() - self.__last_publish >= self.__optimizer.partial_results_interval:
+            self.__optimizer.partial_results_callback(self.snapshot())
+            self.__last_publish = time.monotonic()
+
+    def results(self, key) -> list:
+        """
+        :param key: result key of the workers' results, see E7GearOptimizer._optimize_aux
+        :return: (score, final stats, loadout) of every worker for that key, unsorted
+        """
+        return list(itertools.chain.from_iterable(results.get(key, []) for results in self.__results.values()))
+
+    def snapshot(self, pattern: int = None):
+        """
+        :param pattern: index of a set pattern, None for the best results of every pattern
+        :return: best (final stats, loadout) across all workers so far, from best to worst
+        """
+        if pattern is None:
+            # A loadout satisfying several patterns is the same object in each of them
+            unique = {}
+            for results in self.__results.values():
+                for top in results.values():
+                    for result in top:
+                        unique[id(result[2])] = result
+            candidates = list(unique.values())
+        else:
+            candidates = self.results(pattern)
 
-        raise IndexError('Gear ID not found in inventory...')
+        merged = self.__optimizer._top_results(candidates)
+        return [(final_stats, loadout) for _, final_stats, loadout in merged]
@@ -0,0 +1,29 @@
+import json
+from collections import Counter
+
+from benchmark import load_corpus, report, unlabeled_images
+from gear import *
+
+
+def test_corpus_and_report_per_field_accuracy(tmp_path, capsys):
+    gear = Gear(-1, GearType.Ring.value, GearSet.Speed.value, Stat(GearStat.Health.value, 60, False),
+                [Stat(GearStat.Speed.value, 4, True)], False)
+    for name in ('0001.png', '0002.png', '0003.png'):
+        (tmp_path / name).write_bytes(b'screenshot')
+    for name in ('0001.json', '0002.json'):
+        with open(str(tmp_path / name), 'w') as file_output:
+            json.dump(gear, file_output, cls=GearJSONEncoder)
+
+    corpus = load_corpus(str(tmp_path))
+    assert corpus == [(str(tmp_path / '0001.png'), gear), (str(tmp_path / '0002.png'), gear)]
+    assert unlabeled_images(str(tmp_path)) == [str(tmp_path / '0003.png')]
+
+    capsys.readouterr()
+    report({'images': 2, 'elapsed': 1.0, 'failed': [(corpus[1][0], 'ValueError: Unreadable substat')],
+            'correct': Counter({'type': 1, 'set': 1, 'main_stat': 1, 'substat0': 1, 'substat1': 1,
+                                'substat2': 1, 'substat3': 1, 'gear': 1}),
+            'timings': {}, 'field_sources': {}})
+    output = capsys.readouterr().out
+    assert 'Throughput: 2.00 images/s' in output
+    for field in ('type', 'set', 'main_stat', 'substat0', 'substat3', 'gear'):
+        assert '{:<12}{:>12}{:>9.1f}%'.format(field, '1/2', 50) in output
@@ -0,0 +1,99 @@
+import pytest
+
+from gear import *
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('Attack 12%', Stat(GearStat.Attack.value, 12, False)),
+    ('Attack 45', Stat(GearStat.Attack.value, 45, True)),
+    ('Health 1,234', Stat(GearStat.Health.value, 1234, True)),
+    ('Crit. C 12', Stat(GearStat.CritC.value, 12, True)),
+    ('Crit. D 20%', Stat(GearStat.CritD.value, 20, True)),
+    ('Eff. Resist 8%', Stat(GearStat.ER.value, 8, True)),
+    ('Critical Damage 20%', Stat(GearStat.CritD.value, 20, True)),
+    ({'type': 'Crit. C', 'value': 12}, Stat(GearStat.CritC.value, 12, True)),
+    ({'type': 'Crit. D', 'value': '20'}, Stat(GearStat.CritD.value, 20, True)),
+    ({'type': 'Eff', 'value': 9}, Stat(GearStat.Eff.value, 9, True)),
+    ({'type': 'eff. resist', 'value': 9, 'is_flat': False}, Stat(GearStat.ER.value, 9, True)),
+    ({'type': 'Speed', 'value': 4}, Stat(GearStat.Speed.value, 4, True)),
+    ({'type': 'Defense', 'value': 6, 'is_flat': False}, Stat(GearStat.Defense.value, 6, False)),
+    ({'type': 1, 'value': 6, 'is_flat': False}, Stat(GearStat.Defense.value, 6, False)),
+    ({'type': '3', 'value': 4}, Stat(GearStat.Speed.value, 4, True)),
+])
+def test_parse_record_stat(value, expected):
+    assert parse_record_stat(value) == expected
+
+
+def test_parse_record_stat_unknown_name():
+    with pytest.raises(NameError):
+        parse_record_stat({'type': 'Luck', 'value': 3})
+
+
+def test_gear_from_record_names():
+    gear = gear_from_record({'Type': 'Ring', 'Set': 'Speed Set', 'Main': 'Crit. D 60%',
+                             'Substat1': 'Crit. C 12', 'Substat2': 'Speed 4', 'Substat3': '', 'in_use': 'yes'})
+    assert gear == Gear(-1, GearType.Ring.value, GearSet.Speed.value, Stat(GearStat.CritD.value, 60, True),
+                        [Stat(GearStat.CritC.value, 12, True), Stat(GearStat.Speed.value, 4, True)], False)
+
+
+def test_gear_from_record_values():
+    gear = gear_from_record({'type': '0', 'set': '0', 'main_stat': {'type': 0, 'value': 100},
+                             'substats': [{'type': '3', 'value': '5'}]})
+    assert gear == Gear(-1, GearType(0).value, GearSet(0).value, Stat(0, 100, True), [Stat(3, 5, True)], False)
+
+    assert gear_from_record({'type': 5, 'set': 2, 'main': 'Health 10%'}).type == 5
+
+
+@pytest.mark.parametrize('record', [
+    {'type': '99', 'set': 0, 'main': 'Attack 10'},
+    {'type': 0, 'set': 'Nothing', 'main': 'Attack 10'},
+    {'type': 0, 'set': 0},
+    {'type': 0, 'set': 0, 'main': {'type': 'Speed', 'value': -3}},
+    {'type': 0, 'set': 0, 'main': 'Health 70000'},
+    {'type': 0, 'set': 0, 'main': 'Attack 10', 'substats': ['Speed 1', 'Speed 2', 'Speed 3', 'Speed 4', 'Speed 5']},
+])
+def test_gear_from_record_errors(record):
+    with pytest.raises((KeyError, NameError, ValueError)):
+        gear_from_record(record)
+
+
+def snapshot_gears():
+    return [Gear(0, GearType.Weapon.value, GearSet.Speed.value, Stat(GearStat.Attack.value, 100, True),
+                 [Stat(GearStat.Speed.value, 4, True), Stat(GearStat.CritC.value, 5, True)], True),
+            Gear(1, GearType.Boot.value, GearSet.Hit.value, Stat(GearStat.Speed.value, 45, True),
+                 [Stat(GearStat.Health.value, 1234, True), Stat(GearStat.Attack.value, 8, False),
+                  Stat(GearStat.Defense.value, 7, False), Stat(GearStat.Eff.value, 9, True)], False)]
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / 'gears.bin')
+    with open(path, 'wb') as file_output:
+        file_output.write(gears_to_snapshot(snapshot_gears()))
+
+    with GearSnapshot(path) as snapshot:
+        assert len(snapshot) == 2
+        assert snapshot.gears() == snapshot_gears()
+        assert snapshot[1] == snapshot_gears()[1]
+        assert GearStore(snapshot.columns()).gear(0) == snapshot_gears()[0]
+
+
+def test_store_snapshot_skips_free_rows(tmp_path):
+    store = GearStore()
+    for gear in snapshot_gears():
+        store.add(gear)
+    store.remove(0)
+
+    path = str(tmp_path / 'gears.bin')
+    with open(path, 'wb') as file_output:
+        file_output.write(store.snapshot())
+    with GearSnapshot(path) as snapshot:
+        assert snapshot.gears() == snapshot_gears()[1:]
+
+
+@pytest.mark.parametrize('data', [b'', b'E7GS', SNAPSHOT_HEADER.pack(b'XXXX', SNAPSHOT_VERSION, 0, 0),
+                                  SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, 3)])
+def test_invalid_snapshot(tmp_path, data):
+    path = tmp_path / 'gears.bin'
+    path.write_bytes(data)
+    with pytest.raises(ValueError):
+        GearSnapshot(str(path))
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+pytest.importorskip('PyQt5')
+
+from PyQt5.QtWidgets import QAbstractItemView, QApplication
+
+from gear import *
+from gui import GearFilterIndex, ResultTableModel, ResultTableView
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def make_gear(attack: Stat, speed: int) -> Gear:
+    return Gear(-1, GearType.Weapon.value, GearSet.Speed.value, attack, [Stat(GearStat.Speed.value, speed, True)],
+                False)
+
+
+def test_filter_ranges_flat_and_percent_separately():
+    index = GearFilterIndex()
+    index.reset([make_gear(Stat(GearStat.Attack.value, 100, True), 4),
+                 make_gear(Stat(GearStat.Attack.value, 12, False), 10),
+                 make_gear(Stat(GearStat.Attack.value, 40, False), 18)])
+
+    assert index.query(ranges={(GearStat.Attack.value, False): (20, None)}) == 0b100
+    assert index.query(ranges={(GearStat.Attack.value, True): (20, None)}) == 0b001
+    # Gears without the stat count as 0
+    assert index.query(ranges={(GearStat.Attack.value, False): (None, 20)}) == 0b011
+    assert index.query(ranges={(GearStat.Speed.value, True): (5, 17)}) == 0b010
+
+
+def test_filter_rows_unpack_mask():
+    index = GearFilterIndex()
+    index.reset([make_gear(Stat(GearStat.Attack.value, 10, True), speed) for speed in range(20)])
+
+    rows = index.rows(index.query(ranges={(GearStat.Speed.value, True): (3, 11)}))
+    assert [row for row in range(20) if rows[row >> 3] >> (row & 7) & 1] == list(range(3, 12))
+
+
+def make_result(speed: int, gear_id: int):
+    gear = make_gear(Stat(GearStat.Attack.value, 10, True), speed)
+    gear.id = gear_id
+    return {stat: speed for stat in ResultTableModel.headers}, [gear]
+
+
+def test_partial_results_keep_selection_and_scroll(app):
+    model = ResultTableModel()
+    table = ResultTableView()
+    table.setModel(model)
+    table.setSelectionBehavior(QAbstractItemView.SelectRows)
+    table.resize(400, 200)
+    table.show()
+    model.setResults([make_result(100 - i, i) for i in range(50)])
+    app.processEvents()
+    table.selectRow(30)
+    table.verticalScrollBar().setValue(20)
+    assert table.verticalScrollBar().value() == 20
+
+    # Better results push the selected one down
+    table.setPartialResults([make_result(200 - i, 100 + i) for i in range(5)] + [make_result(100 - i, i)
+                                                                                  for i in range(45)])
+    assert [model.result(index.row())[1][0].id for index in table.selectionModel().selectedRows()] == [30]
+    assert table.verticalScrollBar().value() == 20
+
+    # The selected result stays when the snapshot drops it
+    table.setPartialResults([make_result(300 - i, 200 + i) for i in range(50)])
+    rows = table.selectionModel().selectedRows()
+    assert [model.result(index.row())[1][0].id for index in rows] == [30]
+    assert model.rowCount() == 51
+
+    model.setResults([make_result(300, 200)])
+    assert table.selectionModel().selectedRows() == []
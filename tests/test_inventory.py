@@ -0,0 +1,136 @@
+import pickle
+import tracemalloc
+
+import pytest
+
+from gear import *
+from inventory import CHANGE_LOG_SIZE, Inventory
+
+
+def make_gear(gear_type: int, speed: int) -> Gear:
+    return Gear(-1, gear_type, GearSet.Speed.value, Stat(GearStat.Speed.value, speed, True),
+                [Stat(GearStat.Attack.value, speed, False)], False)
+
+
+def test_view_of_removed_gear_never_reads_reused_row():
+    inventory = Inventory([make_gear(0, 10)])
+    view = inventory.get(0)
+    inventory.remove(0)
+    inventory.add(make_gear(1, 20))
+
+    with pytest.raises(IndexError):
+        view.type
+    with pytest.raises(IndexError):
+        view.main_stat
+
+
+def test_materialized_gears_skip_removed():
+    inventory = Inventory([make_gear(0, 10), make_gear(1, 20), make_gear(2, 30)])
+    inventory.remove(1)
+
+    version, gears = inventory.materialized_gears()
+    assert version == inventory.version
+    assert [gear.id for gear in gears] == [0, 2]
+    assert all(type(gear) is Gear for gear in gears)
+    assert [gear.main_stat.value for gear in inventory.materialized_gears([2, 1, 0])[1]] == [30, 10]
+
+
+def test_pickled_inventory_views_share_its_lock():
+    inventory = pickle.loads(pickle.dumps(Inventory([make_gear(3, 12)])))
+    assert inventory.get(0).type == 3
+    assert inventory.add(make_gear(4, 8)).main_stat.value == 8
+
+
+def test_changes_since_collapses_changes_per_gear():
+    inventory = Inventory([make_gear(0, 10), make_gear(1, 20)])
+    version = inventory.version
+
+    inventory.add(make_gear(2, 30))
+    inventory.set_usage(2, True)
+    inventory.set_usage(0, True)
+    inventory.remove(1)
+    inventory.add(make_gear(3, 40))
+    inventory.remove(3)
+
+    changes = inventory.changes_since(version)
+    assert changes.version == inventory.version
+    assert (changes.added, changes.removed, changes.updated) == ([2], [1], [0])
+    assert not inventory.changes_since(inventory.version)
+
+
+def test_changes_since_too_old_or_future_version():
+    inventory = Inventory([make_gear(0, 10)])
+    assert inventory.changes_since(inventory.version + 1) is None
+
+    for i in range(CHANGE_LOG_SIZE):
+        inventory.set_usage(0, i % 2 == 0)
+    assert inventory.changes_since(0) is None
+    assert inventory.changes_since(inventory.version - 1).updated == [0]
+
+
+def test_find_duplicates_follows_removed_and_reused_rows():
+    inventory = Inventory([make_gear(0, 10), make_gear(0, 10), make_gear(1, 10)])
+    assert [gear.id for gear in inventory.find_duplicates(make_gear(0, 10))] == [0, 1]
+    assert [gear.id for gear in inventory.find_duplicates(inventory.get(1).to_gear())] == [0]
+
+    inventory.remove(0)
+    inventory.add(make_gear(2, 10))
+    assert [gear.id for gear in inventory.find_duplicates(make_gear(0, 10))] == [1]
+    assert [gear.id for gear in inventory.find_duplicates(make_gear(2, 10))] == [3]
+    assert inventory.find_duplicates(make_gear(0, 11)) == []
+
+
+def test_from_columns_queries_and_rebuilds_consumers():
+    inventory = Inventory([make_gear(i % 3, i) for i in range(9)])
+    inventory.set_usage(4, True)
+    loaded = Inventory.from_columns(inventory.columns)
+
+    assert [gear.id for gear in loaded.query(gear_type=1, in_use=False)] == [1, 7]
+    assert [gear.id for gear in loaded.find_duplicates(make_gear(2, 5))] == [5]
+    assert loaded.add(make_gear(0, 1)).id == 9
+    assert loaded.changes_since(0) is None
+
+
+def test_query_indexes_follow_changes():
+    inventory = Inventory([make_gear(i % 3, i) for i in range(6)])
+    inventory.add(Gear(-1, 0, GearSet.Hit.value, Stat(GearStat.Attack.value, 5, False), [], False))
+    inventory.set_usage(3, True)
+    inventory.remove(0)
+    inventory.add(make_gear(0, 7))
+
+    assert [gear.id for gear in inventory.query(gear_type=0)] == [3, 6, 7]
+    assert [gear.id for gear in inventory.query(gear_type=0, in_use=False)] == [6, 7]
+    assert [gear.id for gear in inventory.query(gear_set=GearSet.Speed.value, in_use=True)] == [3]
+    assert [gear.id for gear in inventory.query(main_stat=GearStat.Attack.value)] == [6]
+    assert inventory.query(gear_set=GearSet.Rage.value) == []
+    assert [gear.id for gear in inventory.query()] == [1, 2, 3, 4, 5, 6, 7]
+
+    inventory.set_usage(3, False)
+    for i in range(100):
+        inventory.add(make_gear(1, i))
+    assert len(inventory.query(gear_type=1, in_use=False)) == 102
+    assert [gear.id for gear in inventory.query(gear_type=0, main_stat=GearStat.Speed.value)] == [3, 7]
+
+
+def test_inventory_takes_less_memory_than_gears():
+    def gears():
+        stats = [stat.value for stat in GearStat]
+        return [Gear(-1, i % 6, i % 13, Stat(stats[i % len(stats)], i % 1000, True),
+                     [Stat(stats[(i + j) % len(stats)], i % 100, j % 2 == 0) for j in range(1, 5)], False)
+                for i in range(20000)]
+
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        plain = gears()
+        plain_size = tracemalloc.get_traced_memory()[0] - start
+        del plain
+
+        start = tracemalloc.get_traced_memory()[0]
+        inventory = Inventory(gears())
+        inventory.find_duplicates(make_gear(0, 0))
+        inventory_size = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    assert len(inventory) == 20000
+    assert inventory_size < plain_size / 2
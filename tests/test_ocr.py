@@ -0,0 +1,320 @@
+import os
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import Future
+
+import cv2 as cv
+import numpy as np
+import pytest
+
+from gear import *
+import ocr
+from ocr import MIN_TRUSTED_GLYPH_SAMPLES, VIDEO_READ_ATTEMPTS, GearReader, GlyphRecognizer, OcrPool, PanelNotFound, \
+    panel_image
+
+
+def line_image(text: str):
+    """
+    Light text on a dark background, drawn character by character so glyphs never touch
+    """
+    image = np.zeros((40, 5), dtype=np.uint8)
+    for char in text:
+        if char == ' ':
+            image = np.hstack((image, np.zeros((40, 12), dtype=np.uint8)))
+            continue
+        glyph = np.zeros((40, 40), dtype=np.uint8)
+        cv.putText(glyph, char, (5, 30), cv.FONT_HERSHEY_SIMPLEX, 0.8, 255, 2)
+        columns = np.flatnonzero(glyph.any(axis=0))
+        image = np.hstack((image, glyph[:, columns[0]:columns[-1] + 1], np.zeros((40, 2), dtype=np.uint8)))
+    return image
+
+
+def test_glyphs_learn_and_recognize():
+    glyphs = GlyphRecognizer()
+    assert glyphs.recognize(line_image('Attack 12%')) is None
+
+    assert glyphs.learn(line_image('Attack 12%'), 'Attack 12%')
+    assert glyphs.recognize(line_image('Attack 12%')) == 'Attack 12%'
+    assert glyphs.samples('t') == 2
+    assert glyphs.samples('x') == 0
+
+
+def test_glyphs_skip_lines_with_wrong_glyph_count():
+    glyphs = GlyphRecognizer()
+    assert not glyphs.learn(line_image('Attack 12%'), 'Attack 2%')
+    assert len(glyphs) == 0
+
+
+def test_read_only_glyphs_dont_learn():
+    glyphs = GlyphRecognizer(read_only=True)
+    assert not glyphs.learn(line_image('Speed 4'), 'Speed 4')
+    assert len(glyphs) == 0
+
+
+def test_glyphs_save_and_load(tmp_path):
+    path = str(tmp_path / 'glyphs.npz')
+    glyphs = GlyphRecognizer(path)
+    glyphs.learn(line_image('Health 160'), 'Health 160')
+    glyphs.save()
+
+    loaded = GlyphRecognizer(path)
+    assert len(loaded) == len(glyphs)
+    assert loaded.recognize(line_image('Health 160')) == 'Health 160'
+
+
+def test_glyphs_shared_between_threads():
+    glyphs = GlyphRecognizer()
+    glyphs.learn(line_image('Defense 5%'), 'Defense 5%')
+
+    def learn():
+        for _ in range(20):
+            glyphs.learn(line_image('Speed 4'), 'Speed 4')
+            assert glyphs.recognize(line_image('Defense 5%')) == 'Defense 5%'
+
+    threads = [threading.Thread(target=learn) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert glyphs.recognize(line_image('Speed 4')) == 'Speed 4'
+
+
+@pytest.mark.parametrize('field, text, exact', [
+    ('type', 'Epic Ring', True),
+    ('type', 'Epic Rina', False),
+    ('set', 'Speed Set', True),
+    ('set', 'Speed Set.', False),
+    ('main_stat', 'Attack 12%', True),
+    ('main_stat', 'Health 1,234', True),
+    ('main_stat', 'Attack T%', False),
+    ('main_stat', 'Attack 12%x', False),
+    ('main_stat', 'Attack +12%', False),
+])
+def test_only_exact_text_is_learned(field, text, exact):
+    value = {'type': parse_gear_type, 'set': parse_gear_set}.get(field, parse_gear_stat)(text)
+    assert GearReader._is_exact(field, text, value) == exact
+
+
+def test_trusted_glyph_samples():
+    glyphs = GlyphRecognizer()
+    for _ in range(MIN_TRUSTED_GLYPH_SAMPLES - 1):
+        glyphs.learn(line_image('Speed 4'), 'Speed 4')
+    assert min(glyphs.samples(char) for char in 'Speed4') < MIN_TRUSTED_GLYPH_SAMPLES
+    glyphs.learn(line_image('Speed 4'), 'Speed 4')
+    assert min(glyphs.samples(char) for char in 'Speed4') >= MIN_TRUSTED_GLYPH_SAMPLES
+
+
+class ScriptedReader(GearReader):
+    """
+    Reader without Tesseract whose reads of each panel, told apart by brightness, fail a given number of times, or
+    every time for the frames without a panel
+    """
+
+    def __init__(self, failures, missing=()):
+        self.timings = defaultdict(float)
+        self.failures = failures
+        self.missing = missing
+        self.reads = Counter()
+
+    def read_image(self, image):
+        panel = int(panel_image(image).mean())
+        self.reads[panel] += 1
+        if panel in self.missing:
+            raise PanelNotFound('Gear panel not found, triangle matching score 0.10')
+        if self.reads[panel] <= self.failures[panel]:
+            raise ValueError('Unreadable substat')
+        return Gear(-1, 0, 0, Stat(GearStat.Attack.value, panel, True), [], False)
+
+
+class LadderReader(GearReader):
+    """
+    Reader without Tesseract whose OCR calls return scripted (text, confidence) reads in turn
+    """
+
+    def __init__(self, reads):
+        self.timings = defaultdict(float)
+        self.field_sources = Counter()
+        self.reads = list(reads)
+        self.calls = []
+
+    def _ocr(self, image, threshold=ocr.OCR_THRESHOLD, psm=ocr.PSM.SINGLE_LINE):
+        self.calls.append((image.shape, threshold, psm))
+        return self.reads.pop(0)
+
+
+def field_regions():
+    return {'type': np.zeros((30, 200), dtype=np.uint8), 'type_high': np.zeros((30, 210), dtype=np.uint8),
+            'main_stat': np.zeros((30, 300), dtype=np.uint8)}
+
+
+def test_confident_read_isnt_retried():
+    reader = LadderReader([])
+    value, _, text, confidence = reader._read_field(field_regions(), 'main_stat', 'Attack 12%', 90)
+    assert (value, text, confidence) == (Stat(GearStat.Attack.value, 12, False), 'Attack 12%', 90)
+    assert reader.calls == []
+
+
+@pytest.mark.parametrize('field, reads, expected, second_shape', [
+    ('main_stat', [('Attack 12%', 50), ('Atta#k', 80), ('Attack 72%', 70)], Stat(GearStat.Attack.value, 72, False),
+     (26, 300)),
+    ('type', [('Epic Rina', 60), ('Epic Boot', 65), ('Epic Ring', 40)], GearType.Boot.value, (30, 210)),
+])
+def test_doubtful_read_goes_down_the_retry_ladder(field, reads, expected, second_shape):
+    reader = LadderReader(reads)
+    value, image, _, confidence = reader._read_field(field_regions(), field, '???', 30)
+    # Most confident read that parsed
+    assert (value, confidence) == (expected, max(confidence for text, confidence in reads if text != 'Atta#k'))
+    shape = field_regions()[field].shape
+    assert reader.calls == [(shape, ocr.OCR_RETRY_THRESHOLD, ocr.PSM.SINGLE_LINE),
+                            (second_shape, ocr.OCR_THRESHOLD, ocr.PSM.SINGLE_LINE),
+                            (shape, ocr.OCR_THRESHOLD, ocr.PSM.SINGLE_BLOCK)]
+    assert reader.field_sources['retries'] == 3
+
+
+def test_retries_stop_at_a_confident_read():
+    reader = LadderReader([('Attack 12', 95), ('Attack 13', 99)])
+    assert reader._read_field(field_regions(), 'main_stat', '???', 90)[0] == Stat(GearStat.Attack.value, 12, True)
+    assert len(reader.calls) == 1 and reader.reads == [('Attack 13', 99)]
+
+
+def test_unparsable_field_raises_first_error():
+    reader = LadderReader([('Luck 12', 90), ('', 90), ('%%', 90)])
+    with pytest.raises((NameError, ValueError)):
+        reader._read_field(field_regions(), 'main_stat', '', 90)
+    assert reader.reads == []
+
+
+def write_video(path, panels, frames_per_panel=12) -> str:
+    writer = cv.VideoWriter(path, cv.VideoWriter_fourcc(*'MJPG'), 30, (1280, 720), False)
+    for panel in panels:
+        for _ in range(frames_per_panel):
+            writer.write(np.full((720, 1280), panel, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def test_video_read_retried_on_later_stable_frames(tmp_path):
+    path = write_video(str(tmp_path / 'inventory.avi'), [50, 200])
+    # First panel reads on its second stable frame, the second never does
+    reader = ScriptedReader({50: 1, 200: 100})
+    results = list(reader.read_video(path))
+
+    assert [gear.main_stat.value for _, gear, _ in results if gear is not None] == [50]
+    assert [error for _, gear, error in results if gear is None] == ['ValueError: Unreadable substat']
+    assert reader.reads == {50: 2, 200: VIDEO_READ_ATTEMPTS}
+
+
+def test_video_frames_without_a_panel_are_skipped(tmp_path):
+    path = write_video(str(tmp_path / 'inventory.avi'), [20, 50, 120])
+    reader = ScriptedReader({50: 0, 120: 0}, missing={20, 120})
+    results = list(reader.read_video(path))
+
+    assert [(gear.main_stat.value, error) for _, gear, error in results] == [(50, None)]
+    assert reader.reads[20] == VIDEO_READ_ATTEMPTS
+
+
+def anchor_reader(template, prior):
+    """
+    Reader without Tesseract locating a single 'triangle' anchor, last seen at prior
+    """
+    reader = GearReader.__new__(GearReader)
+    reader._GearReader__templates = {'triangle': (template, cv.pyrDown(template))}
+    reader._GearReader__anchors = {'triangle': prior}
+    return reader
+
+
+@pytest.mark.parametrize('prior', [(50, 50), (57, 46)])
+def test_anchor_found_past_the_prior_window(prior):
+    y, x = np.mgrid[0:24, 0:24]
+    template = (255 * np.exp(-((x - 12) ** 2 + (y - 9) ** 2) / 40)).astype(np.uint8)
+    template[18:] = 120
+    image = np.zeros((200, 200), dtype=np.uint8)
+    image[50:74, 60:84] = template
+
+    # From (50, 50) the window's best match is on its border, 2 pixels short of the anchor
+    assert anchor_reader(template, prior)._locate(image, 'triangle') == (60, 50)
+
+
+def init_fake_worker(glyphs_path):
+    pass
+
+
+def read_fake_worker(path):
+    """
+    Worker reading a gear out of the file name, the first 'crash' file and every 'poison' file kill its process
+    """
+    if os.path.basename(path).startswith('poison'):
+        with open(path + '.crashed', 'a') as file_output:
+            file_output.write('crash\n')
+        os._exit(1)
+    if os.path.basename(path).startswith('crash') and not os.path.exists(path + '.crashed'):
+        open(path + '.crashed', 'w').close()
+        os._exit(1)
+    value = int(os.path.basename(path).split('_')[-1])
+    return (path, Gear(-1, 0, 0, Stat(GearStat.Attack.value, value, True), [], False), None), \
+        [(line_image('Speed 4'), 'Speed 4')]
+
+
+def test_ocr_pool_recovers_from_a_crashed_worker(tmp_path, monkeypatch):
+    # Workers are forked, they run the patched functions
+    monkeypatch.setattr(ocr, '_init_worker', init_fake_worker)
+    monkeypatch.setattr(ocr, '_read_worker', read_fake_worker)
+    paths = [str(tmp_path / 'gear_{}'.format(i)) for i in range(8)]
+    paths.insert(2, str(tmp_path / 'crash_0'))
+
+    pool = OcrPool(2, glyphs_path=None, glyphs=GlyphRecognizer())
+    try:
+        # Every image comes back once, the images lost with the crash are read again on new processes
+        results = list(pool.imap_unordered(paths))
+        assert sorted(path for path, _, _ in results) == sorted(paths)
+        assert all(gear is not None for _, gear, _ in results)
+        assert sorted(gear.main_stat.value for _, gear, _ in results) == sorted(list(range(8)) + [0])
+        assert pool.glyphs.samples('S') > 0
+
+        # The processes keep working for the next images
+        assert all(gear is not None for _, gear, _ in pool.imap_unordered(paths))
+    finally:
+        pool.shutdown()
+
+
+def test_ocr_pool_reads_again_an_image_cancelled_by_another_thread(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr, '_init_worker', init_fake_worker)
+    monkeypatch.setattr(ocr, '_read_worker', read_fake_worker)
+    paths = [str(tmp_path / 'gear_{}'.format(i)) for i in range(4)]
+
+    pool = OcrPool(1, glyphs_path=None)
+    submit = pool._OcrPool__submit
+    submitted = []
+
+    def cancelled_once(path):
+        future, executor = submit(path)
+        submitted.append(path)
+        if len(submitted) == 1:
+            # Dropped by another thread shutting the processes down before the image started
+            future = Future()
+            future.cancel()
+        return future, executor
+
+    monkeypatch.setattr(pool, '_OcrPool__submit', cancelled_once)
+    try:
+        results = list(pool.imap_unordered(paths))
+        assert sorted(path for path, _, _ in results) == sorted(paths)
+        assert all(gear is not None for _, gear, _ in results)
+        assert submitted.count(paths[0]) == 2
+    finally:
+        pool.shutdown()
+
+
+def test_ocr_pool_fails_an_image_crashing_workers_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr, '_init_worker', init_fake_worker)
+    monkeypatch.setattr(ocr, '_read_worker', read_fake_worker)
+    path = str(tmp_path / 'poison_0')
+
+    pool = OcrPool(1, glyphs_path=None)
+    try:
+        [(result_path, gear, error)] = list(pool.imap_unordered([path]))
+        assert (result_path, gear) == (path, None) and error.startswith(ocr.WORKER_CRASH_ERROR)
+        # Read once more before failing
+        assert open(path + '.crashed').read() == 'crash\n' * (ocr.WORKER_CRASH_RETRIES + 1)
+    finally:
+        pool.shutdown()
@@ -0,0 +1,601 @@
+import json
+import os
+import random
+from collections import Counter, defaultdict
+from itertools import combinations, product
+from types import SimpleNamespace
+
+import cv2 as cv
+import numpy as np
+import pytest
+
+import optimizer as optimizer_module
+from gear import Gear, GearStat, Loadout, Stat
+from ocr import GearReader
+from optimizer import E7GearOptimizer, _PartialResults
+
+HERO_BASE_STAT = {'Attack': 1000, 'Health': 5000, 'Defense': 600, 'Speed': 100, 'Crit. C': 15, 'Crit. D': 150,
+                  'Eff': 0, 'Eff. Resist': 0}
+
+
+def random_stat(rng: random.Random, highest: int) -> Stat:
+    return Stat(rng.randrange(len(GearStat)), rng.randrange(1, highest), rng.random() < 0.5)
+
+
+@pytest.fixture
+def optimizer():
+    """
+    Optimizer reading in this process over 3 random gears per slot
+    """
+    rng = random.Random(2)
+    optimizer = E7GearOptimizer()
+    optimizer.cores = 0
+    optimizer.hero_base_stat = dict(HERO_BASE_STAT)
+    for i in range(18):
+        optimizer.inventory.add(Gear(-1, i % 6, rng.choice([0, 2, 3, 4]), random_stat(rng, 60),
+                                     [random_stat(rng, 30) for _ in range(4)], False))
+    yield optimizer
+    optimizer.close()
+
+
+def test_sweep_matches_optimize_per_threshold(optimizer):
+    thresholds = [100, 120, 140, 160, 1000]
+    curve = optimizer.sweep_constraint([0], [], {}, 'Speed', thresholds, max_results=3)
+    assert [threshold for threshold, _, _ in curve] == thresholds
+
+    for threshold, score, best in curve:
+        optimizer.optimize([0], [], {'Speed': (threshold, 10 ** 6)})
+        expected = [optimizer.score_final_stats(final_stats, [0])
+                    for final_stats, _ in optimizer.optimizer_output[:3]]
+        assert [optimizer.score_final_stats(final_stats, [0]) for final_stats, _ in best] == expected
+        assert score == (expected[0] if expected else None)
+
+
+def test_sweep_doesnt_publish_partial_results(optimizer):
+    snapshots = []
+    optimizer.partial_results_callback = snapshots.append
+    optimizer.partial_results_interval = 0
+    optimizer.sweep_constraint([0], [], {}, 'Speed', [100, 140])
+    assert snapshots == []
+
+    optimizer.optimize([0], [], {})
+    assert snapshots
+
+
+@pytest.fixture
+def importer(tmp_path):
+    """
+    Empty optimizer whose imports don't write anything
+    """
+    optimizer = E7GearOptimizer()
+    optimizer.quarantine_dir = None
+    optimizer.mark_dirty = lambda **kwargs: None
+    yield optimizer
+    optimizer.close()
+
+
+@pytest.mark.parametrize('snapshot', [b'', b'E7GS\x01', b'garbage' * 10])
+def test_load_falls_back_to_json_when_snapshot_is_corrupt(tmp_path, monkeypatch, capsys, snapshot):
+    monkeypatch.chdir(tmp_path)
+    gear = Gear(0, 4, 2, Stat(GearStat.Health.value, 60, False), [Stat(GearStat.Speed.value, 4, True)], False)
+    optimizer = E7GearOptimizer()
+    optimizer.inventory.add(gear)
+    optimizer.export_gears(optimizer_module.GEARS_JSON)
+    optimizer.close()
+    # Newer than gears.json, it would be preferred if it could be read
+    (tmp_path / optimizer_module.GEARS_SNAPSHOT).write_bytes(snapshot)
+
+    optimizer = E7GearOptimizer()
+    optimizer.load()
+    assert [view.to_gear() for view in optimizer.inventory] == [gear]
+    assert 'Failed to load {}'.format(optimizer_module.GEARS_SNAPSHOT) in capsys.readouterr().out
+    optimizer.close()
+
+
+def test_close_writes_pending_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    optimizer = E7GearOptimizer()
+    optimizer.hero_loadouts['Hero'] = [0]
+    optimizer.mark_dirty(loadouts=True)
+    optimizer.close()
+
+    with open(optimizer_module.HERO_LOADOUTS_JSON) as file_input:
+        assert json.load(file_input) == {'Hero': [0]}
+
+
+def write_records(path, count: int) -> str:
+    record = {'type': 'Ring', 'set': 'Speed', 'main': 'Health 60%', 'substats': ['Speed 4', 'Crit. C 5']}
+    path.write_text(json.dumps([record] * count))
+    return str(path)
+
+
+def test_import_skips_duplicates_within_an_import_only(importer, tmp_path):
+    path = write_records(tmp_path / 'export.json', 2)
+    # Added records come back in batches, after the skipped ones
+    first = list(importer.import_gear_iter([path]))
+    assert [(gear is not None, error) for _, gear, error in first] == [(False, 'Duplicate of an earlier record'),
+                                                                        (True, None)]
+
+    # Identical gears of another import may be distinct items, they are added with a note
+    second = list(importer.import_gear_iter([write_records(tmp_path / 'other.json', 1)]))
+    assert second[0][1] is not None
+    assert second[0][2] == 'Identical to gear 0, added as a separate item'
+    assert len(importer.inventory) == 2
+
+
+def test_import_reports_bad_records_and_goes_on(importer, tmp_path):
+    good = {'type': 'Ring', 'set': 'Speed', 'main': 'Health 60%', 'substats': ['Speed 4']}
+    records = [{'type': 'Boot', 'set': 'Speed', 'main': {'type': 'Speed', 'value': -3}},
+               {'type': 'Boot', 'set': 'Speed', 'main': 'Health 70000'},
+               dict(good, substats=['Speed 1', 'Speed 2', 'Speed 3', 'Speed 4', 'Speed 5']),
+               good]
+    path = tmp_path / 'export.json'
+    path.write_text(json.dumps(records))
+
+    results = list(importer.import_gear_iter([str(path)]))
+    assert [location[-3:] for location, gear, _ in results if gear is None] == ['[0]', '[1]', '[2]']
+    assert all(error.startswith('ValueError') for _, gear, error in results if gear is None)
+    assert len(importer.inventory) == 1
+
+
+def test_import_rejects_misread_gear(importer, tmp_path):
+    path = tmp_path / 'ring.png'
+    path.write_bytes(b'screenshot')
+    importer.ocr_cache[E7GearOptimizer._image_fingerprint(str(path))] = Gear(
+        0, 0, 0, Stat(GearStat.Attack.value, 100000, True), [], False)
+
+    assert list(importer.import_gear_iter([str(path)]))[0][1:] == (
+        None, 'ValueError: Attack value 100000 out of 0 to 65535')
+    assert len(importer.inventory) == 0
+
+
+def test_import_skips_screenshot_imported_before(importer, tmp_path):
+    path = tmp_path / 'ring.png'
+    path.write_bytes(b'screenshot')
+    importer.ocr_cache[E7GearOptimizer._image_fingerprint(str(path))] = Gear(
+        0, 0, 0, Stat(GearStat.Attack.value, 10, True), [Stat(GearStat.Speed.value, 4, True)], False)
+
+    assert list(importer.import_gear_iter([str(path)]))[0][1] is not None
+    assert list(importer.import_gear_iter([str(path)]))[0][1:] == (None, 'Already imported as gear 0')
+
+    # Read again once its gear was deleted
+    importer.delete_gear(0)
+    assert list(importer.import_gear_iter([str(path)]))[0][1] is not None
+
+
+def test_unreadable_screenshot_is_quarantined(importer, tmp_path):
+    importer.quarantine_dir = str(tmp_path / 'quarantine')
+    importer.cores = 0
+    importer._import_gear_aux = lambda paths: [(paths[0], None, 'ValueError: Unreadable substat')]
+    path = tmp_path / 'ring.png'
+    path.write_bytes(b'screenshot')
+
+    assert list(importer.import_gear_iter([str(path)])) == [(str(path), None, 'ValueError: Unreadable substat')]
+    name = '{}_ring.png'.format(E7GearOptimizer._image_fingerprint(str(path))[:8])
+    assert sorted(os.listdir(importer.quarantine_dir)) == [name, name + '.txt']
+    assert (tmp_path / 'quarantine' / name).read_bytes() == b'screenshot'
+    assert (tmp_path / 'quarantine' / (name + '.txt')).read_text() == \
+        '{}\nValueError: Unreadable substat\n'.format(path)
+
+
+class UnreadableReader(GearReader):
+    """
+    Reader without Tesseract failing every read
+    """
+
+    def __init__(self):
+        self.timings = defaultdict(float)
+
+    def read_image(self, image):
+        raise ValueError('Unreadable substat')
+
+    def close(self):
+        pass
+
+
+def test_only_unreadable_video_frames_are_quarantined(importer, tmp_path):
+    importer.quarantine_dir = str(tmp_path / 'quarantine')
+    importer._E7GearOptimizer__reader = UnreadableReader()
+    video = str(tmp_path / 'inventory.avi')
+    writer = cv.VideoWriter(video, cv.VideoWriter_fourcc(*'MJPG'), 30, (1280, 720), False)
+    for _ in range(12):
+        writer.write(np.full((720, 1280), 120, dtype=np.uint8))
+    writer.release()
+    broken = tmp_path / 'broken.mp4'
+    broken.write_bytes(b'not a video')
+
+    results = list(importer.import_gear_iter([video, str(broken)]))
+    assert [error for _, _, error in results] == \
+        ['ValueError: Unreadable substat', 'ValueError: Unreadable video: {}'.format(broken)]
+    label = results[0][0]
+    assert label.startswith(video + '#')
+
+    # The failed frame is kept as a screenshot, neither video is copied
+    names = sorted(os.listdir(importer.quarantine_dir))
+    assert len(names) == 2 and names[0].endswith('_inventory.avi#{}.png'.format(label.rpartition('#')[2]))
+    assert names[1] == names[0] + '.txt'
+    frame = cv.imread(os.path.join(importer.quarantine_dir, names[0]), cv.IMREAD_GRAYSCALE)
+    assert frame.shape == (720, 1280) and abs(frame.mean() - 120) < 2
+    assert importer.ocr_failures == {E7GearOptimizer._image_fingerprint(str(broken)): results[1][2]}
+
+
+def test_records_in_use_are_imported_unused(importer, tmp_path):
+    path = tmp_path / 'gears.json'
+    path.write_text(json.dumps([{'type': 'Ring', 'set': 'Speed', 'main': 'Health 60%', 'in_use': True},
+                                {'type': 'Boot', 'set': 'Hit', 'main': 'Speed 40', 'in_use': 'yes'}]))
+
+    results = list(importer.import_gear_records([str(path)]))
+    assert [error for _, _, error in results] == [None, None]
+    # No hero loadout holds them, the optimizer has to be able to use them
+    assert [gear.id for gear in importer.inventory.query(in_use=False)] == [0, 1]
+    assert importer.inventory.query(in_use=True) == []
+
+
+def test_screenshot_of_a_crashed_worker_isnt_quarantined(importer, tmp_path):
+    importer.quarantine_dir = str(tmp_path / 'quarantine')
+    importer.cores = 0
+    importer._import_gear_aux = lambda paths: [(paths[0], None, 'BrokenProcessPool: worker died')]
+    path = tmp_path / 'ring.png'
+    path.write_bytes(b'screenshot')
+
+    assert list(importer.import_gear_iter([str(path)])) == [(str(path), None, 'BrokenProcessPool: worker died')]
+    assert not os.path.exists(importer.quarantine_dir)
+    assert importer.ocr_failures == {}
+
+
+def test_failed_screenshot_is_remembered_until_read(importer, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    importer.cores = 0
+    path = tmp_path / 'ring.png'
+    path.write_bytes(b'screenshot')
+    importer._import_gear_aux = lambda paths: [(paths[0], None, 'BrokenProcessPool: worker died')]
+    list(importer.import_gear_iter([str(path)]))
+    assert not importer.was_read(str(path))
+
+    importer._import_gear_aux = lambda paths: [(paths[0], None, 'ValueError: Unreadable substat')]
+    list(importer.import_gear_iter([str(path)]))
+    assert importer.was_read(str(path)) and not importer.is_imported(str(path))
+
+    # Watched folders of the next session skip it too
+    importer._write({'ocr_cache'})
+    loaded = E7GearOptimizer()
+    loaded.load()
+    assert loaded.was_read(str(path))
+    loaded.close()
+
+    # Imports still read it again
+    gear = Gear(-1, 0, 0, Stat(GearStat.Attack.value, 10, True), [], False)
+    importer._import_gear_aux = lambda paths: [(paths[0], gear, None)]
+    assert list(importer.import_gear_iter([str(path)]))[0][1] is not None
+    assert importer.is_imported(str(path)) and importer.ocr_failures == {}
+
+
+def test_partial_results_merge_worker_deltas(optimizer):
+    optimizer.max_results = 3
+    results = _PartialResults(optimizer)
+    loadouts = [object() for _ in range(6)]
+    results.put((1, False, {None: [(5, {'Speed': 5}, loadouts[0]), (1, {'Speed': 1}, loadouts[1])]}))
+    results.put((2, True, {None: [(4, {'Speed': 4}, loadouts[2])]}))
+    results.put((1, True, {None: [(6, {'Speed': 6}, loadouts[3]), (2, {'Speed': 2}, loadouts[4])]}))
+
+    assert results.workers_done == 2
+    # Each worker keeps its own top 3, the snapshot is the top 3 of all of them
+    assert sorted(score for score, _, _ in results.results(None)) == [2, 4, 5, 6]
+    assert [final_stats['Speed'] for final_stats, _ in results.snapshot()] == [6, 5, 4]
+
+
+def test_optimize_in_worker_processes_matches_single_process(optimizer):
+    optimizer.optimize([0], [], {'Speed': (110, 10 ** 6)})
+    expected = [optimizer.score_final_stats(final_stats, [0]) for final_stats, _ in optimizer.optimizer_output]
+    assert len(expected) > 50
+
+    optimizer.cores = 2
+    optimizer.max_results = 50
+    snapshots = []
+    optimizer.partial_results_callback = snapshots.append
+    optimizer.partial_results_interval = 0
+    optimizer.optimize([0], [], {'Speed': (110, 10 ** 6)})
+    assert [optimizer.score_final_stats(final_stats, [0])
+            for final_stats, _ in optimizer.optimizer_output] == expected[:50]
+    assert snapshots
+
+
+def test_set_patterns_keep_their_own_top_loadouts(optimizer):
+    optimizer.max_results = 10
+    patterns = [[0], [3], [0, 4]]
+    # required_sets is ignored along with set patterns
+    optimizer.optimize([0, 3], [2], {'Speed': (110, 10 ** 6)}, set_patterns=patterns)
+    pattern_outputs = optimizer.pattern_outputs
+    assert len(pattern_outputs) == len(patterns)
+
+    slots = [[gear.to_gear() for gear in optimizer.inventory.query(gear_type=gear_type, in_use=False)]
+             for gear_type in range(6)]
+    for pattern, output in zip(patterns, pattern_outputs):
+        expected = []
+        for gears in product(*slots):
+            loadout = Loadout(gears)
+            loadout.post_init()
+            final_stats = {stat: Loadout.final_stat(optimizer.hero_base_stat[stat], *given)
+                           for stat, given in loadout.stats_given.items()}
+            if all(gear_set in loadout.set for gear_set in pattern) and final_stats['Speed'] >= 110:
+                expected.append(optimizer.score_final_stats(final_stats, [0, 3]))
+        expected.sort(reverse=True)
+        assert expected
+        assert [optimizer.score_final_stats(final_stats, [0, 3]) for final_stats, _ in output] == \
+            pytest.approx(expected[:10])
+        assert all(all(gear_set in loadout.set for gear_set in pattern) for _, loadout in output)
+
+        # Same loadouts as a run of the pattern alone
+        optimizer.optimize([0, 3], [], {'Speed': (110, 10 ** 6)}, set_patterns=[pattern])
+        assert [final_stats for final_stats, _ in optimizer.pattern_outputs[0]] == \
+            [final_stats for final_stats, _ in output]
+
+
+def brute_force_final_stats(optimizer):
+    """
+    Final stats of every combination of one unused gear of each slot
+    """
+    slots = [[gear.to_gear() for gear in optimizer.inventory.query(gear_type=gear_type, in_use=False)]
+             for gear_type in range(6)]
+    for gears in product(*slots):
+        loadout = Loadout(gears)
+        loadout.post_init()
+        yield {stat: Loadout.final_stat(optimizer.hero_base_stat[stat], *given)
+               for stat, given in loadout.stats_given.items()}
+
+
+def test_stat_bounds_contain_every_loadout(optimizer):
+    bounds = optimizer.stat_bounds()
+    for final_stats in brute_force_final_stats(optimizer):
+        for stat, value in final_stats.items():
+            assert bounds[stat][0] <= value <= bounds[stat][1]
+
+
+def test_stat_bounds_from_arrays_match_gears(optimizer):
+    optimizer.inventory.set_usage(4, True)
+    slots = [[gear.to_gear() for gear in optimizer.inventory.query(gear_type=gear_type, in_use=False)]
+             for gear_type in range(6)]
+    assert optimizer.stat_bounds() == optimizer.stat_bounds(slots)
+
+
+def test_check_constraints_reports_unreachable_minimum(optimizer):
+    highest = optimizer.stat_bounds()['Speed'][1]
+    assert optimizer.check_constraints({'Speed': (highest, 10 ** 6)}) == []
+
+    gaps = optimizer.check_constraints({'Speed': (highest + 10, 10 ** 6), 'Attack': (0, 10 ** 6)})
+    assert [(gap.stat, gap.gap) for gap in gaps] == [('Speed', 10)]
+
+    # optimize() only combines its candidates, here every gear, and says so
+    optimizer.optimize([0], [], {'Speed': (highest + 10, 10 ** 6)})
+    assert optimizer.optimizer_output == []
+    assert [(gap.stat, gap.gap, gap.candidates) for gap in optimizer.constraint_gaps] == [('Speed', 10, True)]
+    assert str(optimizer.constraint_gaps[0]) == \
+        'Speed min {} is 10 above the highest reachable {} with the best candidate gears of each slot'.format(
+            highest + 10, highest)
+
+    # Gaps of an earlier run don't outlive a run that stops early
+    optimizer.hero_base_stat = None
+    optimizer.optimize([0], [], {})
+    assert optimizer.constraint_gaps == []
+
+
+@pytest.mark.parametrize('stat', list(HERO_BASE_STAT))
+@pytest.mark.parametrize('fraction', [0, 0.5])
+def test_stat_distribution_matches_optimize(optimizer, stat, fraction):
+    # Base stats aren't always whole points
+    optimizer.hero_base_stat[stat] += fraction
+    optimizer.optimize([0], [], {})
+    assert len(optimizer.optimizer_output) == 3 ** 6
+
+    expected = Counter(final_stats[stat] for final_stats, _ in optimizer.optimizer_output)
+    assert optimizer.stat_distribution(stat) == dict(sorted(expected.items()))
+
+
+def test_final_stat_rounds_down_exact_value():
+    assert Loadout.final_stat(1000, 35, 20) == 1370
+    # 25 * (1 + 16 / 100) is 28.999999999999996 in floats
+    assert Loadout.final_stat(25, 16, 0) == 29
+    assert Loadout.final_stat(15.000000000000002, 0, 12) == 27
+    assert Loadout.final_stat(12.5, 10, 0) == 13
+
+
+def test_joint_stat_distribution_matches_brute_force(optimizer):
+    expected = Counter((final_stats['Speed'], final_stats['Crit. C'])
+                       for final_stats in brute_force_final_stats(optimizer))
+    distribution = optimizer.joint_stat_distribution('Speed', 'Crit. C')
+    assert distribution == dict(expected)
+    assert optimizer.count_at_least(distribution, (130, 20)) == \
+        sum(count for (speed, crit), count in expected.items() if speed >= 130 and crit >= 20)
+
+
+@pytest.fixture
+def attack_optimizer():
+    """
+    Optimizer over 4 gears per slot mixing flat and % Attack with realistic values, most from the Speed and Attack sets
+    """
+    rng = random.Random(5)
+    optimizer = E7GearOptimizer()
+    optimizer.cores = 0
+    optimizer.hero_base_stat = dict(HERO_BASE_STAT, Attack=1039.5)
+    for i in range(24):
+        attack = [Stat(GearStat.Attack.value, rng.randrange(20, 520), True),
+                  Stat(GearStat.Attack.value, rng.randrange(4, 66), False)]
+        optimizer.inventory.add(Gear(-1, i % 6, rng.choice([2, 2, 3, 3, 4]), rng.choice(attack),
+                                     [Stat(GearStat.Speed.value, rng.randrange(2, 21), True),
+                                      Stat(GearStat.Attack.value, rng.randrange(4, 40), rng.random() < 0.5),
+                                      random_stat(rng, 30), random_stat(rng, 30)], False))
+    yield optimizer
+    optimizer.close()
+
+
+def test_attack_distribution_matches_brute_force(attack_optimizer):
+    expected = Counter(final_stats['Attack'] for final_stats in brute_force_final_stats(attack_optimizer))
+    assert attack_optimizer.stat_distribution('Attack') == dict(sorted(expected.items()))
+
+
+def test_joint_speed_attack_distribution_matches_brute_force(attack_optimizer):
+    sets = Counter()
+    expected = Counter()
+    slots = [[gear.to_gear() for gear in attack_optimizer.inventory.query(gear_type=gear_type, in_use=False)]
+             for gear_type in range(6)]
+    for gears, final_stats in zip(product(*slots), brute_force_final_stats(attack_optimizer)):
+        sets.update(gear_set for gear_set, count in Counter(gear.set for gear in gears).items() if count == 4)
+        expected[final_stats['Speed'], final_stats['Attack']] += 1
+    # Both 4 piece bonuses are counted
+    assert sets[2] and sets[3]
+    assert attack_optimizer.joint_stat_distribution('Speed', 'Attack') == dict(expected)
+
+
+def brute_force_upgrades(optimizer, hero, priorities, required_sets, min_max_constraints, kept=None):
+    """
+    Score improvement of every swap of one or two unused gears into a hero's saved loadout, building each loadout
+
+    :param kept: unused gears two piece swaps combine, every one if None
+    :return: (dict of swapped gear ids -> (improvement, loadout sets), sets of the saved loadout, dict of gear id ->
+             score of the loadout swapping it in, valid or not)
+    """
+    current = {optimizer.inventory.get(gear_id).type: optimizer.inventory.get(gear_id).to_gear()
+               for gear_id in optimizer.hero_loadouts[hero]}
+
+    def evaluate(swaps):
+        gears = dict(current)
+        gears.update((gear.type, gear) for gear in swaps)
+        loadout = Loadout(tuple(gears.values()))
+        loadout.post_init()
+        final_stats = {stat: Loadout.final_stat(optimizer.hero_base_stat[stat], *given)
+                       for stat, given in loadout.stats_given.items()}
+        valid = all(low <= final_stats[stat] <= high for stat, (low, high) in min_max_constraints.items())
+        valid &= not required_sets or any(gear_set in loadout.set for gear_set in required_sets)
+        return optimizer.score_final_stats(final_stats, priorities), valid, loadout.set
+
+    base_score = evaluate([])[0]
+    unused = [gear.to_gear() for gear in optimizer.inventory.query(in_use=False)]
+    pairs = [(a, b) for a, b in combinations(kept if kept is not None else unused, 2) if a.type != b.type]
+    upgrades = {}
+    for swaps in [(gear,) for gear in unused] + pairs:
+        score, valid, sets = evaluate(swaps)
+        if valid and score > base_score:
+            upgrades[tuple(sorted(gear.id for gear in swaps))] = (score - base_score, sets)
+    return upgrades, evaluate([])[2], {gear.id: evaluate([gear])[0] for gear in unused}
+
+
+@pytest.fixture
+def hero(optimizer):
+    """
+    Saved loadout completing the Critical set, in use, along with 5 unused Critical, Health or Defense gears per slot
+    """
+    rng = random.Random(5)
+    for gear in list(optimizer.inventory):
+        optimizer.inventory.remove(gear.id)
+    for gear_type, gear_set in enumerate([0, 0, 4, 2, 3, 5]):
+        optimizer.inventory.add(Gear(-1, gear_type, gear_set, random_stat(rng, 60),
+                                     [random_stat(rng, 30) for _ in range(4)], True))
+    optimizer.hero_loadouts['Hero'] = [gear.id for gear in optimizer.inventory]
+    for i in range(30):
+        optimizer.inventory.add(Gear(-1, i % 6, rng.choice([0, 4, 5]), random_stat(rng, 60),
+                                     [random_stat(rng, 30) for _ in range(4)], False))
+    return 'Hero'
+
+
+@pytest.mark.parametrize('required_sets, min_max_constraints', [([], {}), ([4], {}), ([], {'Speed': (120, 10 ** 6)})])
+def test_suggest_upgrades_matches_brute_force(optimizer, hero, required_sets, min_max_constraints):
+    priorities = [0, 3]
+    upgrades, current_sets, _ = brute_force_upgrades(optimizer, hero, priorities, required_sets, min_max_constraints)
+    # Set bonuses are gained and lost by some swaps
+    assert any(set(sets) - set(current_sets) for _, sets in upgrades.values())
+    assert any(set(current_sets) - set(sets) for _, sets in upgrades.values())
+
+    suggestions = optimizer.suggest_upgrades(hero, priorities, required_sets, min_max_constraints, max_results=1000,
+                                             two_piece=True)
+    assert {tuple(sorted(gear.id for gear in gears)): pytest.approx(improvement)
+            for improvement, _, gears in suggestions} == \
+        {ids: improvement for ids, (improvement, _) in upgrades.items()}
+    assert [improvement for improvement, _, _ in suggestions] == \
+        sorted((improvement for improvement, _, _ in suggestions), reverse=True)
+
+    single = optimizer.suggest_upgrades(hero, priorities, required_sets, min_max_constraints, max_results=1000)
+    assert sorted(gears[0].id for _, _, gears in single) == sorted(ids[0] for ids in upgrades if len(ids) == 1)
+
+
+def test_suggest_upgrades_prunes_two_piece_candidates(optimizer, hero, monkeypatch):
+    # Each slot keeps its best single swap of each set
+    monkeypatch.setattr(optimizer_module, 'UPGRADE_PAIR_CANDIDATES', 1)
+    monkeypatch.setattr(optimizer_module, 'UPGRADE_PAIR_SET_CANDIDATES', 1)
+    priorities = [0, 3]
+    _, _, scores = brute_force_upgrades(optimizer, hero, priorities, [], {}, kept=[])
+
+    best = {}
+    for gear in sorted((gear.to_gear() for gear in optimizer.inventory.query(in_use=False)),
+                       key=lambda gear: scores[gear.id], reverse=True):
+        best.setdefault((gear.type, gear.set), gear)
+    upgrades, _, _ = brute_force_upgrades(optimizer, hero, priorities, [], {}, kept=list(best.values()))
+    assert len(best) < len(optimizer.inventory.query(in_use=False))
+    assert any(len(ids) == 2 for ids in upgrades)
+
+    suggestions = optimizer.suggest_upgrades(hero, priorities, [], {}, max_results=1000, two_piece=True)
+    assert {tuple(sorted(gear.id for gear in gears)): pytest.approx(improvement)
+            for improvement, _, gears in suggestions} == \
+        {ids: improvement for ids, (improvement, _) in upgrades.items()}
+
+
+def test_score_final_stats_of_arrays_matches_each_loadout(optimizer):
+    final_stats = list(brute_force_final_stats(optimizer))[:50]
+    # Crit chance is clipped with np.clip(), max() and min() can't compare arrays
+    final_stats[0]['Crit. C'], final_stats[1]['Crit. C'] = 130, -5
+    columns = {stat: np.array([stats[stat] for stats in final_stats]) for stat in HERO_BASE_STAT}
+    for priorities in ([0], [0, 3, 4, 5], [2, 1, 6, 7]):
+        assert optimizer.score_final_stats(columns, priorities) == \
+            pytest.approx([optimizer.score_final_stats(stats, priorities) for stats in final_stats])
+
+
+def test_flush_copies_ocr_dicts_added_to_meanwhile(importer, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    gear = Gear(-1, 0, 0, Stat(GearStat.Attack.value, 10, True), [], False)
+    for i in range(10):
+        importer.ocr_failures['failure{}'.format(i)] = 'ValueError: Unreadable substat'
+        importer.ocr_cache['gear{}'.format(i)] = gear
+
+    def dumps(obj, **kwargs):
+        # An import adds entries while the writer encodes them
+        for i, _ in enumerate(obj):
+            importer.ocr_failures['new{}'.format(i)] = 'ValueError: Unreadable substat'
+            importer.ocr_cache['new{}'.format(i)] = gear
+        return json.dumps(obj, **kwargs)
+
+    monkeypatch.setattr(optimizer_module, 'json', SimpleNamespace(dumps=dumps))
+    E7GearOptimizer.mark_dirty(importer, ocr_cache=True)
+    importer.flush()
+
+    with open(optimizer_module.OCR_FAILURES_JSON) as file_input:
+        assert sorted(json.load(file_input)) == sorted('failure{}'.format(i) for i in range(10))
+    with open(optimizer_module.OCR_CACHE_JSON) as file_input:
+        assert len(json.load(file_input)) == 10
+
+
+def test_final_stats_of_a_known_loadout():
+    gears = [Gear(-1, 0, 2, Stat(GearStat.Health.value, 100, True),
+                  [Stat(GearStat.Speed.value, 4, True), Stat(GearStat.Health.value, 7, False)], False),
+             Gear(-1, 1, 2, Stat(GearStat.Health.value, 540, True), [Stat(GearStat.Health.value, 9, False)], False),
+             Gear(-1, 2, 2, Stat(GearStat.Defense.value, 60, True), [Stat(GearStat.Defense.value, 11, False)], False),
+             Gear(-1, 3, 2, Stat(GearStat.CritD.value, 60, True), [Stat(GearStat.Eff.value, 8, True)], False),
+             Gear(-1, 4, 0, Stat(GearStat.Attack.value, 16, False), [Stat(GearStat.ER.value, 5, True)], False),
+             Gear(-1, 5, 0, Stat(GearStat.Speed.value, 40, True), [], False)]
+    # Speed and Critical set bonuses. 50 raised by 16% is exactly 58, float math truncated it to 57
+    expected = {'Attack': 58, 'Health': 6440, 'Defense': 726, 'Speed': 169, 'Crit. C': 27, 'Crit. D': 210, 'Eff': 8,
+                'Eff. Resist': 5}
+    hero_base_stat = dict(HERO_BASE_STAT, Attack=50)
+
+    loadout = Loadout(tuple(gears))
+    loadout.post_init()
+    assert {stat: Loadout.final_stat(hero_base_stat[stat], *given)
+            for stat, given in loadout.stats_given.items()} == expected
+
+    optimizer = E7GearOptimizer()
+    optimizer.cores = 0
+    optimizer.hero_base_stat = hero_base_stat
+    optimizer.inventory.add_many(gears)
+    try:
+        optimizer.optimize([0], [], {})
+        assert [final_stats for final_stats, _ in optimizer.optimizer_output] == [expected]
+    finally:
+        optimizer.close()
@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+
+import pytest
+
+import watcher
+from watcher import FolderWatcher
+
+
+class RecordingOptimizer:
+    """
+    Optimizer stand-in recording the size of each screenshot it imports
+    """
+
+    def __init__(self, read=()):
+        self.read = set(read)
+        self.imports = []
+        self.imported = threading.Event()
+
+    def was_read(self, path):
+        return os.path.basename(path) in self.read
+
+    def import_gear_iter(self, paths, cancel=None):
+        for path in paths:
+            self.imports.append((os.path.basename(path), os.path.getsize(path)))
+            self.read.add(os.path.basename(path))
+            self.imported.set()
+            yield path, None, None
+
+
+@pytest.fixture
+def polling(monkeypatch):
+    monkeypatch.setattr(watcher, 'INotify', None)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+def test_polling_imports_new_and_unread_screenshots(polling, tmp_path):
+    (tmp_path / 'old.png').write_bytes(b'old')
+    (tmp_path / 'read.png').write_bytes(b'read')
+    (tmp_path / 'notes.txt').write_bytes(b'text')
+    optimizer = RecordingOptimizer(read=['read.png'])
+    folder_watcher = FolderWatcher(optimizer, str(tmp_path), poll_interval=0.05)
+    folder_watcher.start()
+    try:
+        wait_for(lambda: optimizer.imports)
+        (tmp_path / 'new.png').write_bytes(b'new')
+        wait_for(lambda: len(optimizer.imports) == 2)
+        time.sleep(0.3)
+    finally:
+        folder_watcher.stop(wait=True)
+    assert optimizer.imports == [('old.png', 3), ('new.png', 3)]
+
+
+def test_polling_waits_for_files_to_settle(polling, tmp_path):
+    optimizer = RecordingOptimizer()
+    folder_watcher = FolderWatcher(optimizer, str(tmp_path), poll_interval=0.1)
+    folder_watcher.start()
+    try:
+        # Written in chunks faster than the scans, as a screenshot tool might
+        with open(str(tmp_path / 'slow.png'), 'wb') as file_output:
+            for _ in range(10):
+                file_output.write(b'x' * 100)
+                file_output.flush()
+                time.sleep(0.04)
+        assert not optimizer.imports
+
+        wait_for(lambda: optimizer.imports)
+        time.sleep(0.3)
+    finally:
+        folder_watcher.stop(wait=True)
+    assert optimizer.imports == [('slow.png', 1000)]
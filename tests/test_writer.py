@@ -0,0 +1,76 @@
+import os
+import time
+from threading import Event
+
+import pytest
+
+from writer import DebouncedWriter, atomic_write
+
+
+def test_atomic_write_keeps_permissions(tmp_path):
+    path = str(tmp_path / 'gears.bin')
+    atomic_write(path, b'new')
+    umask = os.umask(0)
+    os.umask(umask)
+    assert os.stat(path).st_mode & 0o777 == 0o666 & ~umask
+
+    os.chmod(path, 0o640)
+    atomic_write(path, 'replaced', 'w')
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    with open(path) as file_input:
+        assert file_input.read() == 'replaced'
+    assert os.listdir(str(tmp_path)) == ['gears.bin']
+
+
+class Recorder:
+    def __init__(self, failures: int = 0):
+        self.writes = []
+        self.written = Event()
+        self.failures = failures
+
+    def __call__(self, dirty):
+        if self.failures:
+            self.failures -= 1
+            raise OSError('disk full')
+        self.writes.append(set(dirty))
+        self.written.set()
+
+
+def test_marks_are_coalesced_until_they_stop():
+    recorder = Recorder()
+    writer = DebouncedWriter(recorder, delay=0.2)
+    start = time.monotonic()
+    for key in ['gears', 'loadouts', 'gears', 'ocr_cache']:
+        writer.mark(key)
+        time.sleep(0.1)
+
+    assert recorder.written.wait(5)
+    # The delay restarts on each mark
+    assert time.monotonic() - start >= 0.5
+    assert recorder.writes == [{'gears', 'loadouts', 'ocr_cache'}]
+    assert not writer.dirty
+
+
+def test_flush_writes_pending_marks_at_once():
+    recorder = Recorder()
+    writer = DebouncedWriter(recorder, delay=60)
+    writer.mark('gears')
+    writer.mark('loadouts')
+    writer.flush()
+    assert recorder.writes == [{'gears', 'loadouts'}]
+
+    # Nothing left for the background thread, nor for another flush
+    writer.flush()
+    assert recorder.writes == [{'gears', 'loadouts'}] and not writer.dirty
+
+
+def test_failed_write_keeps_marks_dirty():
+    recorder = Recorder(failures=1)
+    writer = DebouncedWriter(recorder, delay=60)
+    writer.mark('gears')
+    with pytest.raises(OSError):
+        writer.flush()
+    assert writer.dirty
+
+    writer.flush()
+    assert recorder.writes == [{'gears'}]
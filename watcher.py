@@ -0,0 +1,147 @@
+import os
+import queue
+from threading import Event, Thread
+
+try:
+    # Optional, Linux only
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+# Seconds between directory scans when inotify isn't available
+WATCH_POLL_INTERVAL = 1.0
+# Screenshots imported together at most, arriving screenshots are imported in batches
+WATCH_BATCH_SIZE = 32
+WATCH_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+class FolderWatcher:
+    """
+    Watches a directory and imports new screenshots in the background as they appear.
+
+    New files are detected with inotify when available, otherwise by scanning the directory every
+    WATCH_POLL_INTERVAL seconds and waiting for a file's size to stop changing. Files seen in this session are
+    remembered, and screenshots read in an earlier session are recognized through the OCR cache and failures, so old
+    files are never read again, even those that couldn't be read. Imports go through E7GearOptimizer.import_gear_iter,
+    whose inventory writes are batched.
+    """
+
+    def __init__(self, optimizer, directory: str, callback=None, poll_interval: float = WATCH_POLL_INTERVAL):
+        """
+        :param optimizer: E7GearOptimizer the screenshots are imported into
+        :param directory: directory to watch
+        :param callback: called with (path, gear, error) for each imported screenshot, from the import thread
+        :param poll_interval: seconds between directory scans when inotify isn't available
+        """
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.__optimizer = optimizer
+        self.__callback = callback
+
+        self.__queue = queue.Queue()
+        self.__seen = set()
+        self.__stop = Event()
+        self.__threads = []
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self.__threads)
+
+    def start(self):
+        """
+        Starts watching, screenshots already in the directory and not imported yet are imported first
+
+        :return: None
+        """
+        if self.running:
+            return
+        self.__stop.clear()
+        self.__threads = [Thread(target=self.__watch, name='FolderWatcher', daemon=True),
+                          Thread(target=self.__import, name='FolderWatcherImport', daemon=True)]
+        for thread in self.__threads:
+            thread.start()
+
+    def stop(self, wait: bool = False):
+        """
+        Stops watching, the screenshot being read is dropped
+
+        :param wait: wait for the threads to finish
+        :return: None
+        """
+        self.__stop.set()
+        if wait:
+            for thread in self.__threads:
+                thread.join()
+
+    @staticmethod
+    def __is_screenshot(name: str) -> bool:
+        return os.path.splitext(name)[1].lower() in WATCH_EXTENSIONS
+
+    def __queue_file(self, name: str):
+        path = os.path.join(self.directory, name)
+        if path not in self.__seen:
+            self.__seen.add(path)
+            self.__queue.put(path)
+
+    def __watch(self):
+        try:
+            if INotify is not None:
+                self.__watch_inotify()
+            else:
+                self.__watch_polling()
+        except OSError as e:
+            # e.g. directory removed or out of inotify watches, keep going by scanning
+            print('Watching {} failed: {}'.format(self.directory, e))
+            if INotify is not None and os.path.isdir(self.directory):
+                self.__watch_polling()
+
+    def __watch_inotify(self):
+        with INotify() as inotify:
+            # Only fully written or moved in files
+            inotify.add_watch(self.directory, flags.CLOSE_WRITE | flags.MOVED_TO)
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and self.__is_screenshot(entry.name):
+                    self.__queue_file(entry.name)
+
+            while not self.__stop.is_set():
+                for event in inotify.read(timeout=int(self.poll_interval * 1000)):
+                    if self.__is_screenshot(event.name):
+                        # A rewritten file is new content
+                        self.__seen.discard(os.path.join(self.directory, event.name))
+                        self.__queue_file(event.name)
+
+    def __watch_polling(self):
+        # Size and modification time of files seen in the previous scan, files are queued once they stop changing
+        previous = {}
+        while not self.__stop.is_set():
+            current = {}
+            for entry in os.scandir(self.directory):
+                path = os.path.join(self.directory, entry.name)
+                if path in self.__seen or not entry.is_file() or not self.__is_screenshot(entry.name):
+                    continue
+
+                stat = entry.stat()
+                current[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                if previous.get(entry.name) == current[entry.name]:
+                    self.__queue_file(entry.name)
+            previous = current
+            self.__stop.wait(self.poll_interval)
+
+    def __import(self):
+        while not self.__stop.is_set():
+            try:
+                paths = [self.__queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            while len(paths) < WATCH_BATCH_SIZE:
+                try:
+                    paths.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            paths = [path for path in paths if not self.__optimizer.was_read(path)]
+            if not paths:
+                continue
+            for result in self.__optimizer.import_gear_iter(paths, self.__stop):
+                if self.__callback is not None:
+                    self.__callback(*result)
@@ -0,0 +1,115 @@
+import os
+import tempfile
+from threading import Condition, Lock, Thread
+import time
+
+# Process umask, new files get its permissions like with open(). Read once since reading it means setting it.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def atomic_write(path: str, data, mode='wb'):
+    """
+    Writes data into a temporary file next to path and replaces path with it, so a crash mid-write never leaves a
+    truncated file behind. The file keeps its permissions, new files get the umask's like with open().
+
+    :param path: destination path
+    :param data: bytes or str to write
+    :param mode: file mode, 'wb' or 'w'
+    :return: None
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.{}.'.format(os.path.basename(path)), suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, mode) as file_output:
+            file_output.write(data)
+            file_output.flush()
+            os.fsync(file_output.fileno())
+        # mkstemp() creates the file readable by its owner only
+        try:
+            permissions = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            permissions = 0o666 & ~_UMASK
+        os.chmod(tmp_path, permissions)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class DebouncedWriter:
+    """
+    Coalesces bursts of save requests into a single write on a background thread.
+
+    Callers mark what is dirty, the writer waits until no new marks arrive for `delay` seconds and then calls
+    `write(dirty)` with the set of dirty keys.
+    """
+
+    def __init__(self, write, delay: float = 0.5):
+        self.__write = write
+        self.__delay = delay
+
+        self.__dirty = set()
+        self.__last_mark = 0
+        self.__condition = Condition()
+        self.__write_lock = Lock()
+        self.__thread = None
+
+    def mark(self, *keys):
+        """
+        Marks keys as dirty and schedules a write
+
+        :param keys: what needs to be written
+        :return: None
+        """
+        with self.__condition:
+            self.__dirty.update(keys)
+            self.__last_mark = time.monotonic()
+            if self.__thread is None:
+                self.__thread = Thread(target=self.__run, name='DebouncedWriter', daemon=True)
+                self.__thread.start()
+            self.__condition.notify()
+
+    @property
+    def dirty(self) -> bool:
+        with self.__condition:
+            return len(self.__dirty) != 0
+
+    def flush(self):
+        """
+        Writes anything pending on the calling thread and waits for an in-progress background write to finish
+
+        :return: None
+        """
+        with self.__write_lock:
+            with self.__condition:
+                dirty, self.__dirty = self.__dirty, set()
+            if dirty:
+                try:
+                    self.__write(dirty)
+                except BaseException:
+                    # Keep keys dirty so the next write retries them
+                    with self.__condition:
+                        self.__dirty.update(dirty)
+                    raise
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while not self.__dirty:
+                    self.__condition.wait()
+
+                # Wait until marks stop arriving
+                remaining = self.__delay - (time.monotonic() - self.__last_mark)
+                while remaining > 0:
+                    self.__condition.wait(remaining)
+                    remaining = self.__delay - (time.monotonic() - self.__last_mark)
+
+            try:
+                self.flush()
+            except Exception as e:
+                print('Failed to save:', e)
+                # Back off before retrying
+                with self.__condition:
+                    self.__last_mark = time.monotonic()